@@ -5,17 +5,19 @@ from datetime import datetime
 import os
 from pathlib import Path
 import base64
-from utils import get_today_str, read_csv_with_index
+from utils import get_today_str
 from visualizer import *
 from pdf_generator import PDFReportGenerator
 from pipeline.config import ALL_BENCHMARKS
+from app_data import get_repository
+from pipeline.data_validate import summarize_issues
 
 # 配置
 DATA_DIR = Path('source_data')
-PROCESSED_DIR = Path('processed_data')
-MARKET_DIR = DATA_DIR
 HOLDINGS_DIR = Path('holdings')
 DEFAULT_BENCHMARKS = ['QQQ', 'SPY', 'DIA']
+# 数据后端：'columnar'（Parquet/Feather行情 + CSV结果表）/ 'csv' / 'json'
+DATA_BACKEND = 'columnar'
 #ALL_BENCHMARKS = ["SPY", "QQQ", "DIA", "IWM", "SMH", "AIQ", "BOTZ", "^GSPC", "^DJI", "^IXIC"]
 
 st.set_page_config(page_title="AGIX Fund Analyzer (New)", layout="wide")
@@ -47,24 +49,28 @@ with st.sidebar:
     )
     export_btn = st.button("📊 Export to PDF")
 
-# 数据加载
-returns_df = pd.read_csv(PROCESSED_DIR / 'returns.csv')
-risk_metrics = pd.read_csv(PROCESSED_DIR / 'risk_metrics.csv')
-volume_analysis = pd.read_csv(PROCESSED_DIR / 'volume_analysis.csv')
-closes = read_csv_with_index(MARKET_DIR / 'market_data_closes.csv')
-volumes = read_csv_with_index(MARKET_DIR / 'market_data_volumes.csv')
-
-# 只保留AGIX和Comparison ETF数据，并去除Weight和Type列
-filter_types = ['AGIX', 'Comparison ETF']
-returns_df = returns_df[returns_df['Type'].isin(filter_types)].drop(columns=['Weight', 'Type','Industry'], errors='ignore')
-risk_metrics = risk_metrics[risk_metrics['Type'].isin(filter_types)].drop(columns=['Weight', 'Type'], errors='ignore')
-volume_analysis = volume_analysis[volume_analysis['Type'].isin(filter_types)].drop(columns=['Weight', 'Type'], errors='ignore')
+# 数据加载：各数据按指纹缓存（所有会话共享），页面只读取自己用到的数据
+repo = get_repository(DATA_BACKEND)
+with st.sidebar:
+    # 数据质量检查：按数据指纹缓存，数据更新后首次加载时重新检查
+    quality = repo.get_data_quality()
+    flagged = quality[quality['Severity'].isin(['warning', 'error'])]
+    if flagged.empty:
+        st.caption(f"✅ 数据质量检查无警告（{len(quality)} 条提示）")
+    else:
+        st.warning(f"⚠️ 数据质量检查: {len(flagged)} 条警告/错误，涉及 {flagged['Ticker'].nunique()} 个ticker")
+    with st.expander("Data Quality Report"):
+        st.dataframe(summarize_issues(quality), hide_index=True)
+        st.dataframe(quality, hide_index=True)
 
 # 主页面逻辑
 def main():
     # 第一页
     if page == "📊 Fund Performance Comparison":
         st.title("AGIX Fund Performance Analysis (New)")
+        returns_df, risk_metrics, volume_analysis = repo.performance_tables(start_date, end_date, risk_free_rate)
+        closes = repo.get_closes()
+        volumes = repo.get_volumes()
         # 新增：全局benchmarks多选
         benchmarks = st.multiselect(
             "选择对比基准（只影响所有对比图）",
@@ -143,8 +149,8 @@ def main():
         st.title("AGIX Fund Portfolio Analysis (New)")
         st.subheader("Asset Allocation & Holdings Breakdown")
         # 读取数据
-        sector_df = pd.read_csv(PROCESSED_DIR / 'holdings_sectorAnalysis.csv')
-        country_df = pd.read_csv(PROCESSED_DIR / 'holdings_countryAnalysis.csv')
+        sector_df = repo.get_sector_analysis()
+        country_df = repo.get_country_analysis()
 
         col1, col2 = st.columns(2)
         with col1:
@@ -184,8 +190,11 @@ def main():
                 else:
                     contrib_col = f'{metric}_contribution'
                 
+                # 区间起点早于第一份持仓文件时没有真实的持仓权重，贡献为空
+                if contrib_col in holdings_df.columns and holdings_df[contrib_col].isna().all():
+                    st.info(f"{metric} 区间早于持仓历史的覆盖范围，没有每日持仓权重，不计算贡献")
                 # 确保必需的列存在
-                if contrib_col in holdings_df.columns:
+                elif contrib_col in holdings_df.columns:
                     # 按行业分组，并计算总权重和总贡献
                     industry_contribution = holdings_df.groupby('Industry').agg(
                         Weight=('Weight', 'sum'),
@@ -211,7 +220,7 @@ def main():
                     st.markdown(f"###### Top 5 Stocks by {metric} Return:  {rise_str}")
                 # 个股上涨贡献Top5
                 contrib_col = f'{metric}_contribution'
-                if contrib_col in sector_df.columns:
+                if contrib_col in sector_df.columns and sector_df[contrib_col].notna().any():
                     top5_contrib = sector_df.sort_values(contrib_col, ascending=False).head(5)[['Ticker', contrib_col]]
                     contrib_str = ',  '.join([f"{row['Ticker']}({row[contrib_col]*100:.2f}%)" for _, row in top5_contrib.iterrows()])
                     st.markdown(f"###### Top 5 Stocks by {metric} Contribution:  {contrib_str}")
@@ -232,6 +241,8 @@ def main():
         report.add_text(f"Pages included: {', '.join(export_pages)}")
         if "Fund Performance Comparison" in export_pages:
             report.add_section_title("1. Fund Performance Analysis")
+            returns_df, risk_metrics, volume_analysis = repo.performance_tables(start_date, end_date, risk_free_rate)
+            closes = repo.get_closes()
             returns_display = returns_df.copy().apply(lambda x: x * 100).round(2)
             report.add_dataframe(returns_display, "Return Comparison")
             fig1 = plot_returns_comparison(returns_display, benchmarks)
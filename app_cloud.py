@@ -9,33 +9,45 @@ from utils import get_today_str
 from visualizer import *
 from pdf_generator import PDFReportGenerator
 from pipeline.config import ALL_BENCHMARKS
-from cloud_data_loader import load_application_data, display_data_status
+from app_data import get_repository
+from pipeline.data_validate import summarize_issues
+from cloud_data_loader import display_data_status
 
 # 配置
 DEFAULT_BENCHMARKS = ['QQQ', 'SPY', 'DIA']
+# 数据后端：云端使用DataSync同步的文件（'sync'，Arrow优先、JSON后备），也可切换为 'columnar' / 'csv'
+DATA_BACKEND = 'sync'
+# 应用运行所必需的数据
+REQUIRED_DATA = ['returns', 'risk_metrics', 'volume_analysis', 'market_data_closes', 'market_data_volumes']
 
 st.set_page_config(page_title="AGIX Fund Analyzer (Cloud)", layout="wide")
 
-# 检查数据状态
-@st.cache_data
-def check_data_availability():
-    """检查数据可用性"""
-    data = load_application_data()
-    return data is not None
-
 # 主应用逻辑
 def main():
+    repo = get_repository(DATA_BACKEND)
     # 显示数据状态
     with st.sidebar:
         st.header("Control Panel")
         
         # 数据状态检查
-        if not check_data_availability():
-            st.error("⚠️ 数据不可用")
+        missing_data = repo.missing(REQUIRED_DATA)
+        if missing_data:
+            st.error(f"⚠️ 数据不可用，缺少必要的数据文件: {missing_data}")
             display_data_status()
             st.stop()
         else:
             st.success("✅ 数据已加载")
+
+        # 数据质量检查：按数据指纹缓存，数据更新后首次加载时重新检查
+        quality = repo.get_data_quality()
+        flagged = quality[quality['Severity'].isin(['warning', 'error'])]
+        if flagged.empty:
+            st.caption(f"✅ 数据质量检查无警告（{len(quality)} 条提示）")
+        else:
+            st.warning(f"⚠️ 数据质量检查: {len(flagged)} 条警告/错误，涉及 {flagged['Ticker'].nunique()} 个ticker")
+        with st.expander("Data Quality Report"):
+            st.dataframe(summarize_issues(quality), hide_index=True)
+            st.dataframe(quality, hide_index=True)
         
         page = st.radio(
             "Select Page",
@@ -57,27 +69,10 @@ def main():
         )
         export_btn = st.button("📊 Export to PDF")
 
-    # 加载数据
-    data = load_application_data()
-    if data is None:
-        st.error("无法加载应用数据，请检查数据文件")
-        return
-        
-    returns_df = data['returns']
-    risk_metrics = data['risk_metrics']
-    volume_analysis = data['volume_analysis']
-    closes = data['market_closes']
-    volumes = data['market_volumes']
-
-    # 只保留AGIX和Comparison ETF数据，并去除Weight和Type列
-    filter_types = ['AGIX', 'Comparison ETF']
-    returns_df = returns_df[returns_df['Type'].isin(filter_types)].drop(columns=['Weight', 'Type','Industry'], errors='ignore')
-    risk_metrics = risk_metrics[risk_metrics['Type'].isin(filter_types)].drop(columns=['Weight', 'Type'], errors='ignore')
-    volume_analysis = volume_analysis[volume_analysis['Type'].isin(filter_types)].drop(columns=['Weight', 'Type'], errors='ignore')
-
     # 页面逻辑
     if page == "📈 Data Status":
         st.title("Data Status Dashboard")
+        returns_df, risk_metrics, volume_analysis = repo.performance_tables(start_date, end_date, risk_free_rate)
         display_data_status()
         
         # 显示数据统计信息
@@ -104,6 +99,9 @@ def main():
             
     elif page == "📊 Fund Performance Comparison":
         st.title("AGIX Fund Performance Analysis (Cloud)")
+        returns_df, risk_metrics, volume_analysis = repo.performance_tables(start_date, end_date, risk_free_rate)
+        closes = repo.get_closes()
+        volumes = repo.get_volumes()
         
         # 新增：全局benchmarks多选
         benchmarks = st.multiselect(
@@ -191,12 +189,11 @@ def main():
         st.subheader("Asset Allocation & Holdings Breakdown")
         
         # 读取数据
-        sector_df = data.get('sector_analysis')
-        country_df = data.get('country_analysis')
-        
-        if sector_df is None or country_df is None:
+        if repo.missing(['holdings_sectorAnalysis', 'holdings_countryAnalysis']):
             st.error("投资组合分析数据不可用")
             return
+        sector_df = repo.get_sector_analysis()
+        country_df = repo.get_country_analysis()
 
         col1, col2 = st.columns(2)
         with col1:
@@ -236,8 +233,11 @@ def main():
                 else:
                     contrib_col = f'{metric}_contribution'
                 
+                # 区间起点早于第一份持仓文件时没有真实的持仓权重，贡献为空
+                if contrib_col in holdings_df.columns and holdings_df[contrib_col].isna().all():
+                    st.info(f"{metric} 区间早于持仓历史的覆盖范围，没有每日持仓权重，不计算贡献")
                 # 确保必需的列存在
-                if contrib_col in holdings_df.columns:
+                elif contrib_col in holdings_df.columns:
                     # 按行业分组，并计算总权重和总贡献
                     industry_contribution = holdings_df.groupby('Industry').agg(
                         Weight=('Weight', 'sum'),
@@ -263,7 +263,7 @@ def main():
                     st.markdown(f"###### Top 5 Stocks by {metric} Return:  {rise_str}")
                 # 个股上涨贡献Top5
                 contrib_col = f'{metric}_contribution'
-                if contrib_col in sector_df.columns:
+                if contrib_col in sector_df.columns and sector_df[contrib_col].notna().any():
                     top5_contrib = sector_df.sort_values(contrib_col, ascending=False).head(5)[['Ticker', contrib_col]]
                     contrib_str = ',  '.join([f"{row['Ticker']}({row[contrib_col]*100:.2f}%)" for _, row in top5_contrib.iterrows()])
                     st.markdown(f"###### Top 5 Stocks by {metric} Contribution:  {contrib_str}")
@@ -289,6 +289,8 @@ def main():
             
             if "Fund Performance Comparison" in export_pages:
                 report.add_section_title("1. Fund Performance Analysis")
+                returns_df, risk_metrics, volume_analysis = repo.performance_tables(start_date, end_date, risk_free_rate)
+                closes = repo.get_closes()
                 returns_display = returns_df.copy().apply(lambda x: x * 100).round(2)
                 report.add_dataframe(returns_display, "Return Comparison")
                 fig1 = plot_returns_comparison(returns_display, benchmarks)
@@ -0,0 +1,323 @@
+"""
+看板数据访问层
+页面只通过DataRepository的get_*方法取数，数据来自哪种后端（CSV / 同步文件 / 列式二进制）由部署选择；
+每份数据按数据源文件的(修改时间, 大小)指纹缓存，缓存由所有会话共享（st.cache_resource），
+管道写入新数据后指纹变化，下一次读取时自动重新加载；页面只在渲染时读取自己用到的数据；
+数据质量检查同样按数据指纹缓存，每份新数据在看板上只检查一次
+返回的DataFrame为各会话共享的对象，调用方修改前需先复制
+"""
+
+import pandas as pd
+from pathlib import Path
+import streamlit as st
+from market_store import MARKET_STORE_COMPACT, compact_market_frame
+from market_store import load_market_data, market_data_fingerprint, has_pyarrow
+from pipeline.data_processor import calculate_returns, RETURN_COLUMNS
+from pipeline.risk_engine import RiskEngine, RISK_COLUMNS
+from pipeline.trading_calendar import TradingCalendar
+from pipeline.data_validate import validate_all, ISSUE_COLUMNS
+from sync_format import MATRICES, sync_parts, load_sync_frame
+
+PROCESSED_DIR = Path('processed_data')
+MARKET_DIR = Path('source_data')
+SYNC_DIR = Path('data')
+# 位于source_data下的表，其余表位于processed_data下
+SOURCE_TABLES = ('holdings_tickers', 'holdings_info')
+# 对比页面展示的标的类型
+PERFORMANCE_TYPES = ('AGIX', 'Comparison ETF')
+
+
+def file_fingerprint(path):
+    """文件的(修改时间, 大小)，文件不存在时返回None"""
+    try:
+        stat = Path(path).stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+# 行过滤条件：{列: 允许的取值}，规范化为可哈希的元组，作为缓存键的一部分
+def _normalize_filters(filters):
+    if not filters:
+        return None
+    return tuple(sorted((col, tuple(values)) for col, values in filters.items()))
+
+
+def _apply_filters(df, filters, columns):
+    for col, values in filters or ():
+        df = df[df[col].isin(values)]
+    if filters:
+        df = df.reset_index(drop=True)
+    return df if columns is None else df[[c for c in columns if c in df.columns]]
+
+
+def _filter_matrix(df, tickers, start, end):
+    if tickers is not None:
+        df = df[[t for t in tickers if t in df.columns]]
+    if start is not None or end is not None:
+        df = df.loc[start:end]
+    return df
+
+
+# 数据后端接口：只负责按名称读取一张表或一个行情矩阵，并给出数据源文件供计算指纹
+# read_table的columns为列投影，filters为规范化后的行过滤条件；read_matrix的tickers/start/end为列投影和日期范围
+# 各后端尽量把投影和过滤下推到文件读取，无法下推的在读取后过滤，结果一致
+class DataBackend:
+    name = 'base'
+
+    def source(self, name):
+        raise NotImplementedError
+
+    def read_table(self, name, columns=None, filters=None):
+        raise NotImplementedError
+
+    def read_matrix(self, name, tickers=None, start=None, end=None):
+        raise NotImplementedError
+
+    @property
+    def key(self):
+        """区分不同后端实例的缓存键"""
+        return self.name
+
+    def fingerprint(self, name):
+        """数据源文件的(路径, 修改时间, 大小)，不存在时返回None"""
+        source = self.source(name)
+        stat = None if source is None else file_fingerprint(source)
+        return None if stat is None else (str(source),) + stat
+
+
+class CsvBackend(DataBackend):
+    """本地CSV：processed_data和source_data下的CSV文件；列投影通过usecols下推，行过滤在读取后完成"""
+    name = 'csv'
+
+    def __init__(self, market_dir=MARKET_DIR, processed_dir=PROCESSED_DIR):
+        self.market_dir = Path(market_dir)
+        self.processed_dir = Path(processed_dir)
+
+    @property
+    def key(self):
+        return f'{self.name}:{self.market_dir}:{self.processed_dir}'
+
+    def _table_path(self, name, suffix='.csv'):
+        return (self.market_dir if name in SOURCE_TABLES else self.processed_dir) / f'{name}{suffix}'
+
+    def source(self, name):
+        if name in MATRICES:
+            return self.market_dir / f'{name}.csv'
+        return self._table_path(name)
+
+    def read_table(self, name, columns=None, filters=None):
+        usecols = None
+        if columns is not None:
+            wanted = set(columns) | {col for col, _ in filters or ()}
+            usecols = lambda col: col in wanted
+        df = pd.read_csv(self._table_path(name), usecols=usecols, dtype={'Ticker': str})
+        return _apply_filters(df, filters, columns)
+
+    def read_matrix(self, name, tickers=None, start=None, end=None):
+        return load_market_data(name, tickers=tickers, start=start, end=end, data_dir=self.market_dir, fmt='csv')
+
+
+class ColumnarBackend(CsvBackend):
+    """
+    列式二进制：行情矩阵按market_store的优先级读取Parquet/Feather（列投影和日期范围下推到文件），
+    表存在同名Parquet文件时读取Parquet（列投影和行过滤下推），否则读取CSV
+    """
+    name = 'columnar'
+
+    def _parquet_table(self, name):
+        path = self._table_path(name, '.parquet')
+        return path if has_pyarrow() and path.exists() else None
+
+    def source(self, name):
+        if name in MATRICES:
+            fingerprint = market_data_fingerprint(name, self.market_dir)
+            return None if fingerprint is None else Path(fingerprint[0])
+        return self._parquet_table(name) or self._table_path(name)
+
+    def read_table(self, name, columns=None, filters=None):
+        path = self._parquet_table(name)
+        if path is None:
+            return super().read_table(name, columns, filters)
+        pushed = [(col, 'in', list(values)) for col, values in filters or ()]
+        df = pd.read_parquet(path, columns=None if columns is None else list(columns), filters=pushed or None)
+        return df.reset_index(drop=True)
+
+    def read_matrix(self, name, tickers=None, start=None, end=None):
+        return load_market_data(name, tickers=tickers, start=start, end=end, data_dir=self.market_dir)
+
+
+class SyncBackend(DataBackend):
+    """DataSync同步到data目录的文件（云端部署）：优先Arrow IPC（内存映射读取），没有时读取JSON；
+    按同步清单拼接增量文件，投影和过滤均在读取后完成"""
+    name = 'sync'
+
+    def __init__(self, data_dir=SYNC_DIR, compact=MARKET_STORE_COMPACT):
+        self.data_dir = Path(data_dir)
+        self.compact = compact
+
+    @property
+    def key(self):
+        return f'{self.name}:{self.data_dir}:{self.compact}'
+
+    def source(self, name):
+        parts = sync_parts(self.data_dir, name)
+        return parts[0] if parts else None
+
+    def fingerprint(self, name):
+        """基础文件和所有增量文件的指纹，追加增量后缓存失效"""
+        parts = sync_parts(self.data_dir, name)
+        stats = [file_fingerprint(p) for p in parts]
+        if not parts or None in stats:
+            return None
+        return tuple((str(p),) + stat for p, stat in zip(parts, stats))
+
+    def read_table(self, name, columns=None, filters=None):
+        return _apply_filters(load_sync_frame(self.data_dir, name), filters, columns)
+
+    def read_matrix(self, name, tickers=None, start=None, end=None):
+        df = load_sync_frame(self.data_dir, name)
+        if self.compact:
+            df = compact_market_frame(df, name)
+        return _filter_matrix(df, tickers, start, end)
+
+
+# 按名称创建数据后端
+def create_backend(name='columnar', **kwargs):
+    if name == 'csv':
+        return CsvBackend(**kwargs)
+    if name == 'columnar':
+        return ColumnarBackend(**kwargs)
+    # 'json'为旧名称，同步目录中只有JSON文件时SyncBackend同样可以读取
+    if name in ('sync', 'json'):
+        return SyncBackend(**kwargs)
+    raise ValueError(f'未知的数据后端: {name}')
+
+
+# 缓存函数以_开头的参数不参与哈希，后端实例由backend_key区分；fingerprint只作为缓存键的一部分，
+# 文件变化后产生新的缓存项，旧项按max_entries淘汰
+@st.cache_resource(max_entries=32, show_spinner=False)
+def _cached_table(_backend, backend_key, name, columns, filters, fingerprint):
+    return _backend.read_table(name, columns, filters)
+
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def _cached_matrix(_backend, backend_key, name, tickers, start, end, fingerprint):
+    return _backend.read_matrix(name, tickers, start, end)
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _cached_risk_engine(_backend, backend_key, fingerprint):
+    return RiskEngine(_cached_matrix(_backend, backend_key, 'market_data_closes', None, None, None, fingerprint))
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _cached_calendar(_backend, backend_key, fingerprint):
+    return TradingCalendar.from_closes(_cached_matrix(_backend, backend_key, 'market_data_closes', None, None, None, fingerprint))
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _cached_data_quality(_backend, backend_key, closes_fp, volumes_fp, returns_fp):
+    closes = _cached_matrix(_backend, backend_key, 'market_data_closes', None, None, None, closes_fp)
+    volumes = None if volumes_fp is None else _cached_matrix(_backend, backend_key, 'market_data_volumes', None, None, None, volumes_fp)
+    returns_df = None if returns_fp is None else _cached_table(_backend, backend_key, 'returns', None, None, returns_fp)
+    return validate_all(closes, volumes, returns_df)
+
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def _cached_as_of_returns(_backend, backend_key, fingerprint, as_of):
+    closes = _cached_matrix(_backend, backend_key, 'market_data_closes', None, None, None, fingerprint)
+    return calculate_returns(closes, as_of=as_of, calendar=_cached_calendar(_backend, backend_key, fingerprint))
+
+
+class DataRepository:
+    """
+    看板数据仓库
+    get_*方法的columns为列投影、types为按Type列的行过滤、tickers/start/end为行情矩阵的列和日期范围，
+    都会传给后端尽量下推；结果按(后端, 参数, 数据源指纹)缓存
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _table(self, name, columns=None, filters=None):
+        columns = None if columns is None else tuple(columns)
+        return _cached_table(self.backend, self.backend.key, name, columns, _normalize_filters(filters),
+                             self.backend.fingerprint(name))
+
+    def _matrix(self, name, tickers=None, start=None, end=None):
+        tickers = None if tickers is None else tuple(dict.fromkeys(str(t) for t in tickers))
+        start = None if start is None else pd.Timestamp(start)
+        end = None if end is None else pd.Timestamp(end)
+        return _cached_matrix(self.backend, self.backend.key, name, tickers, start, end, self.backend.fingerprint(name))
+
+    def missing(self, names):
+        """数据源不存在的数据名称"""
+        return [name for name in names if self.backend.fingerprint(name) is None]
+
+    def get_returns(self, types=None, columns=None):
+        return self._table('returns', columns, None if types is None else {'Type': types})
+
+    def get_risk_metrics(self, types=None, columns=None):
+        return self._table('risk_metrics', columns, None if types is None else {'Type': types})
+
+    def get_volume_analysis(self, types=None, columns=None):
+        return self._table('volume_analysis', columns, None if types is None else {'Type': types})
+
+    def get_sector_analysis(self, columns=None):
+        return self._table('holdings_sectorAnalysis', columns)
+
+    def get_country_analysis(self, columns=None):
+        return self._table('holdings_countryAnalysis', columns)
+
+    def get_holdings_tickers(self):
+        return self._table('holdings_tickers')
+
+    def get_holdings_info(self, columns=None):
+        return self._table('holdings_info', columns)
+
+    def get_closes(self, tickers=None, start=None, end=None):
+        return self._matrix('market_data_closes', tickers, start, end)
+
+    def get_volumes(self, tickers=None, start=None, end=None):
+        return self._matrix('market_data_volumes', tickers, start, end)
+
+    def get_risk_engine(self):
+        """收盘价对应的风险指标引擎，侧边栏调整日期区间和无风险利率时直接查询"""
+        return _cached_risk_engine(self.backend, self.backend.key, self.backend.fingerprint('market_data_closes'))
+
+    def get_as_of_returns(self, as_of):
+        """截至as_of的各ticker收益率，按(收盘价数据, as_of)缓存"""
+        return _cached_as_of_returns(self.backend, self.backend.key, self.backend.fingerprint('market_data_closes'),
+                                     pd.Timestamp(as_of))
+
+    def get_data_quality(self):
+        """行情和收益率表的数据质量问题长表（列同data_validate.ISSUE_COLUMNS），没有行情数据时为空表"""
+        closes_fp = self.backend.fingerprint('market_data_closes')
+        if closes_fp is None:
+            return pd.DataFrame(columns=ISSUE_COLUMNS)
+        return _cached_data_quality(self.backend, self.backend.key, closes_fp,
+                                    self.backend.fingerprint('market_data_volumes'), self.backend.fingerprint('returns'))
+
+    def performance_tables(self, start_date, end_date, risk_free_rate, types=PERFORMANCE_TYPES):
+        """
+        对比页面的收益率、风险指标和成交量分析表，只保留types中的标的，并去除Weight和Type列
+        结束日期早于最新数据日期时按结束日期重新计算收益率；风险指标按日期区间和无风险利率实时计算
+        """
+        returns_df = self.get_returns(types)
+        risk_metrics = self.get_risk_metrics(types)
+        volume_analysis = self.get_volume_analysis(types)
+        if pd.Timestamp(end_date) < self.get_closes().index[-1]:
+            as_of = self.get_as_of_returns(end_date)
+            returns_df = returns_df.assign(**{col: returns_df['Ticker'].map(as_of[col]) for col in RETURN_COLUMNS})
+        live_risk = self.get_risk_engine().metrics(start_date, end_date, risk_free_rate)
+        risk_metrics = risk_metrics.assign(**{col: risk_metrics['Ticker'].map(live_risk[col]) for col in RISK_COLUMNS})
+        return (returns_df.drop(columns=['Weight', 'Type', 'Industry'], errors='ignore'),
+                risk_metrics.drop(columns=['Weight', 'Type'], errors='ignore'),
+                volume_analysis.drop(columns=['Weight', 'Type'], errors='ignore'))
+
+
+@st.cache_resource(show_spinner=False)
+def get_repository(backend='columnar', **kwargs):
+    """按后端名称及参数创建的数据仓库（所有会话共享）"""
+    return DataRepository(create_backend(backend, **kwargs))
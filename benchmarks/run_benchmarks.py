@@ -0,0 +1,222 @@
+"""
+性能基准测试
+在合成数据上对收益率、风险指标、成交量分析、持仓归因、行情/同步文件（Arrow、JSON）读取和数据同步（全量、无变化）计时，
+记录每项的耗时、吞吐量（单元格/秒）和内存峰值，结果追加到基准测试日志并与之前相同参数的运行对比
+
+用法:
+    python benchmarks/run_benchmarks.py --tickers 500 --years 5 --holdings 100 --missing-rate 0.02
+"""
+
+import io
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+import sys
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+sys.path.append(str(BASE_DIR / 'pipeline'))
+import pandas as pd
+from config import BENCHMARK_LOG_PATH
+from market_store import load_market_data
+from holdings_store import HoldingsHistory
+from data_processor import (calculate_returns, calculate_returns_history, calculate_risk_metrics, analyze_volume,
+                            add_type_column, build_holdings_attribution, dimension_attribution)
+from data_sync import DataSync
+from sync_format import SYNC_FORMAT
+from synthetic_data import SyntheticDataset, write_source_data
+
+
+# 对func计时repeats次，另外在tracemalloc下执行一次记录内存分配峰值；func的输出不打印
+# setup在每次执行前调用，不计入耗时和内存
+def measure(func, repeats=3, setup=None):
+    times = []
+    with redirect_stdout(io.StringIO()):
+        for _ in range(repeats):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    times.sort()
+    return {
+        'seconds_min': round(times[0], 5),
+        'seconds_median': round(times[len(times) // 2], 5),
+        'peak_alloc_mb': round(peak / 1024 / 1024, 2),
+    }
+
+
+# 与main中相同的收益率表：收益率 + 类型、行业、最新权重
+def _returns_frame(dataset, closes):
+    returns_df = calculate_returns(closes)
+    type_df = add_type_column(closes, dataset.holdings_tickers, dataset.comparison_tickers)
+    type_df['Industry'] = type_df['Ticker'].map(dataset.industry_map)
+    weights = dataset.latest_weights()
+    type_df['Weight'] = type_df['Ticker'].map(lambda t: weights.get(t, 0))
+    return returns_df.merge(type_df, left_index=True, right_on='Ticker')
+
+
+# 按项目目录结构准备合成数据及processed_data下的结果文件（不计时）
+def prepare_workdir(dataset, workdir):
+    workdir = write_source_data(dataset, workdir)
+    closes, volumes = dataset.closes, dataset.volumes
+    processed = workdir / 'processed_data'
+    returns_df = _returns_frame(dataset, closes)
+    history = HoldingsHistory(dataset.holdings_history)
+    with redirect_stdout(io.StringIO()):
+        holdings = build_holdings_attribution(returns_df, closes, history, dataset.country_map)
+    returns_df.to_csv(processed / 'returns.csv', index=False)
+    calculate_risk_metrics(closes).to_csv(processed / 'risk_metrics.csv')
+    analyze_volume(volumes).to_csv(processed / 'volume_analysis.csv')
+    dimension_attribution(holdings, 'Industry', 'sector').to_csv(processed / 'holdings_sectorAnalysis.csv', index=False)
+    dimension_attribution(holdings, 'Country', 'country').to_csv(processed / 'holdings_countryAnalysis.csv', index=False)
+    return returns_df, holdings
+
+
+def run_benchmarks(dataset, workdir, repeats=3, only=None):
+    closes, volumes = dataset.closes, dataset.volumes
+    returns_df, holdings = prepare_workdir(dataset, workdir)
+    history = HoldingsHistory(dataset.holdings_history)
+    source_dir = Path(workdir) / 'source_data'
+    sync_dir = Path(workdir) / 'data'
+    fresh_dir = Path(workdir) / 'data_fresh'
+    cells = closes.size
+    holding_cells = len(dataset.holdings_history)
+
+    def sync_all(data_dir=sync_dir, fmt=SYNC_FORMAT):
+        # DataSync使用相对项目根目录的路径
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            DataSync(data_dir, fmt=fmt).sync_all_data()
+        finally:
+            os.chdir(cwd)
+
+    # 全量同步前清空目标目录（含清单），否则重复执行时所有文件都因内容未变而跳过
+    def reset_fresh_dir():
+        shutil.rmtree(fresh_dir, ignore_errors=True)
+
+    sync_all()
+
+    benchmarks = [
+        ('calculate_returns', lambda: calculate_returns(closes), cells),
+        ('calculate_returns_history', lambda: calculate_returns_history(closes), cells),
+        ('calculate_risk_metrics', lambda: calculate_risk_metrics(closes), cells),
+        ('analyze_volume', lambda: analyze_volume(volumes), volumes.size),
+        ('holdings_attribution', lambda: build_holdings_attribution(returns_df, closes, history, dataset.country_map), holding_cells),
+        ('sector_attribution', lambda: dimension_attribution(holdings, 'Industry', 'sector'), len(holdings)),
+        ('country_attribution', lambda: dimension_attribution(holdings, 'Country', 'country'), len(holdings)),
+        ('load_market_data', lambda: load_market_data('market_data_closes', data_dir=source_dir), cells),
+        ('read_market_csv', lambda: pd.read_csv(source_dir / 'market_data_closes.csv', index_col=0, parse_dates=True), cells),
+        ('sync_all_data', lambda: sync_all(fresh_dir), cells * 2),
+        # 数据未变化时的同步：按清单跳过所有文件
+        ('sync_all_data_noop', sync_all, cells * 2),
+    ]
+    setups = {'sync_all_data': reset_fresh_dir}
+    try:
+        from cloud_data_loader import CloudDataLoader
+        # 每次新建加载器，避免命中实例缓存
+        benchmarks.append(('cloud_load_arrow_closes', lambda: CloudDataLoader(sync_dir).load_json_data('market_data_closes.json'), cells))
+        benchmarks.append(('cloud_load_arrow_returns', lambda: CloudDataLoader(sync_dir).load_json_data('returns.json'), len(returns_df)))
+        # JSON后备格式单独同步到另一目录，便于与Arrow对比
+        json_dir = Path(workdir) / 'data_json'
+        sync_all(json_dir, fmt='json')
+        benchmarks.append(('cloud_load_json_closes', lambda: CloudDataLoader(json_dir).load_json_data('market_data_closes.json'), cells))
+        benchmarks.append(('cloud_load_json_returns', lambda: CloudDataLoader(json_dir).load_json_data('returns.json'), len(returns_df)))
+    except ImportError as e:
+        print(f'[WARN] 无法导入cloud_data_loader，跳过同步文件加载基准: {e}')
+
+    results = []
+    for name, func, n_cells in benchmarks:
+        if only and name not in only:
+            continue
+        result = {'name': name, 'cells': int(n_cells), **measure(func, repeats, setups.get(name))}
+        result['cells_per_second'] = round(n_cells / result['seconds_median'], 1) if result['seconds_median'] > 0 else None
+        results.append(result)
+        print(f"[INFO] {name}: {result['seconds_median']:.4f} 秒")
+    return results
+
+
+def load_benchmark_runs(log_path=BENCHMARK_LOG_PATH, params=None):
+    log_path = Path(log_path)
+    if not log_path.exists():
+        return []
+    runs = []
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                run = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if params is None or run.get('params') == params:
+                runs.append(run)
+    return runs
+
+
+def append_benchmark_run(params, results, log_path=BENCHMARK_LOG_PATH):
+    log_path = Path(log_path)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    record = {'started_at': datetime.now().isoformat(timespec='seconds'), 'params': params, 'results': results}
+    with open(log_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+# 打印结果，并与之前相同参数运行的中位耗时对比
+def print_results(results, previous_runs):
+    print(f"{'基准':<26} {'中位耗时(秒)':>12} {'变化':>8} {'吞吐(百万单元格/秒)':>20} {'内存峰值(MB)':>12}")
+    for r in results:
+        history = sorted(p['seconds_median'] for run in previous_runs for p in run['results'] if p['name'] == r['name'])
+        change = '-'
+        if history:
+            baseline = history[len(history) // 2]
+            change = f"{r['seconds_median'] / baseline - 1:+.0%}" if baseline > 0 else '-'
+        throughput = f"{r['cells_per_second'] / 1e6:.2f}" if r['cells_per_second'] else '-'
+        print(f"{r['name']:<26} {r['seconds_median']:>12.4f} {change:>8} {throughput:>20} {r['peak_alloc_mb']:>12.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="AGIX Fund Monitor 性能基准测试")
+    parser.add_argument("--tickers", type=int, default=200, help="ticker总数")
+    parser.add_argument("--years", type=float, default=3, help="行情年数")
+    parser.add_argument("--holdings", type=int, default=50, help="持仓数量")
+    parser.add_argument("--missing-rate", type=float, default=0.01, help="行情随机缺失比例")
+    parser.add_argument("--holdings-days", type=int, default=250, help="持仓历史天数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--repeats", type=int, default=3, help="每项重复次数")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="只运行指定基准")
+    parser.add_argument("--workdir", help="合成数据目录，默认使用临时目录")
+    parser.add_argument("--log", default=str(BENCHMARK_LOG_PATH), help="基准测试日志")
+    parser.add_argument("--no-log", action="store_true", help="不写入基准测试日志")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    dataset = SyntheticDataset(n_tickers=args.tickers, years=args.years, n_holdings=args.holdings,
+                               missing_rate=args.missing_rate, holdings_days=args.holdings_days, seed=args.seed)
+    print(f'[INFO] 合成数据: {dataset.closes.shape[0]} 个交易日 × {dataset.closes.shape[1]} 个ticker，'
+          f'持仓历史 {len(dataset.holdings_history)} 行，生成耗时 {time.perf_counter() - start:.2f} 秒')
+    params = dataset.params
+    previous_runs = load_benchmark_runs(args.log, params)
+    if args.workdir:
+        results = run_benchmarks(dataset, Path(args.workdir), args.repeats, args.only)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            results = run_benchmarks(dataset, Path(tmp), args.repeats, args.only)
+    print_results(results, previous_runs)
+    if not args.no_log:
+        append_benchmark_run(params, results, args.log)
+        print(f'[INFO] 基准测试结果已追加: {args.log}')
@@ -0,0 +1,105 @@
+"""
+基准测试用合成数据
+按指定的ticker数量、年数、持仓数量和缺失率生成收盘价/交易量矩阵（价格和成交量由SyntheticProvider生成）、每日持仓历史和公司信息，
+并可按项目目录结构（source_data / processed_data）写出，供各阶段的基准测试直接读取
+"""
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import sys
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+sys.path.append(str(BASE_DIR / 'pipeline'))
+from market_store import save_market_data
+from holdings_store import HOLDINGS_HISTORY_COLUMNS
+from market_data_provider import SyntheticProvider
+
+INDUSTRIES = ['Application', 'Infrastructure', 'Semi']
+COUNTRIES = ['United States', 'Taiwan', 'South Korea', 'Netherlands', 'Japan']
+
+
+class SyntheticDataset:
+    """
+    合成数据集
+    tickers: AGIX + 持仓股票(H0000...) + 其他标的(SYN0000...)，共n_tickers个
+    missing_rate: 上市后随机缺失的比例；另有约10%的标的在区间中途才上市
+    持仓历史为最近holdings_days个交易日的每日持仓，权重在基础权重上随机漂移
+    """
+
+    def __init__(self, n_tickers=200, years=3, n_holdings=50, missing_rate=0.01, holdings_days=250, end_date='2025-08-01', seed=0):
+        if n_holdings + 1 > n_tickers:
+            raise ValueError('n_tickers需大于持仓数量')
+        rng = np.random.default_rng(seed)
+        self.params = {
+            'n_tickers': n_tickers, 'years': years, 'n_holdings': n_holdings,
+            'missing_rate': missing_rate, 'holdings_days': holdings_days, 'seed': seed,
+        }
+        self.provider = SyntheticProvider(n_days=int(years * 252), end_date=end_date, seed=seed)
+        self.dates = self.provider.dates
+        self.holdings_tickers = [f'H{i:04d}' for i in range(n_holdings)]
+        others = [f'SYN{i:04d}' for i in range(n_tickers - n_holdings - 1)]
+        self.tickers = ['AGIX'] + self.holdings_tickers + others
+        self.comparison_tickers = others[:20]
+        self.closes, self.volumes = self._market_data(rng, missing_rate)
+        self.holdings_history = self._holdings_history(rng, min(holdings_days, len(self.dates)))
+        self.info = pd.DataFrame({
+            'Ticker': self.tickers,
+            'Company Name': [f'{t} Synthetic Corp' for t in self.tickers],
+            'Website': [f'https://example.com/{t.lower()}' for t in self.tickers],
+            'Country': rng.choice(COUNTRIES, len(self.tickers)),
+            'AverageAnalystRating': '2.0 - Buy',
+        })
+        self.industry_map = dict(zip(self.tickers, rng.choice(INDUSTRIES, len(self.tickers))))
+        self.country_map = dict(zip(self.info['Ticker'], self.info['Country']))
+
+    def _market_data(self, rng, missing_rate):
+        n, m = len(self.dates), len(self.tickers)
+        closes, volumes = self.provider.market_data(self.tickers)
+        missing = rng.random((n, m)) < missing_rate
+        # 约10%的标的在区间中途上市（AGIX和持仓除外）
+        listing = np.zeros(m, dtype=int)
+        late = rng.random(m) < 0.1
+        late[:len(self.holdings_tickers) + 1] = False
+        listing[late] = rng.integers(1, n // 2, late.sum())
+        missing |= np.arange(n)[:, None] < listing[None, :]
+        return closes.mask(missing), volumes.mask(missing)
+
+    def _holdings_history(self, rng, holdings_days):
+        dates = self.dates[-holdings_days:]
+        k = len(self.holdings_tickers)
+        base = rng.dirichlet(np.ones(k))
+        drift = np.exp(np.cumsum(rng.normal(0, 0.01, (holdings_days, k)), axis=0))
+        weights = base * drift
+        weights /= weights.sum(axis=1, keepdims=True)
+        nav = 1e8
+        market_value = weights * nav
+        prices = self.closes[self.holdings_tickers].loc[dates].ffill().bfill().to_numpy()
+        history = pd.DataFrame({
+            'Date': np.repeat(dates.values, k),
+            'Ticker': np.tile(self.holdings_tickers, holdings_days),
+            'Company Name': np.tile([f'{t} Synthetic Corp' for t in self.holdings_tickers], holdings_days),
+            'Shares': np.round(market_value / prices).ravel(),
+            'Market Value': market_value.ravel(),
+            'Pct Net Assets': weights.ravel(),
+            'Weight': weights.ravel(),
+        })
+        return history[HOLDINGS_HISTORY_COLUMNS]
+
+    def latest_weights(self):
+        latest = self.holdings_history[self.holdings_history['Date'] == self.holdings_history['Date'].max()]
+        return dict(zip(latest['Ticker'], latest['Weight']))
+
+
+# 按项目目录结构写出合成数据：行情矩阵（列式 + CSV）、持仓列表、公司信息
+# processed_data的各结果文件由调用方计算后写入
+def write_source_data(dataset, root):
+    root = Path(root)
+    source_dir = root / 'source_data'
+    (root / 'processed_data').mkdir(parents=True, exist_ok=True)
+    save_market_data(dataset.closes, 'market_data_closes', data_dir=source_dir)
+    save_market_data(dataset.volumes, 'market_data_volumes', data_dir=source_dir)
+    pd.Series(dataset.holdings_tickers, name='Ticker').to_csv(source_dir / 'holdings_tickers.csv', index=False)
+    dataset.info.to_csv(source_dir / 'holdings_info.csv', index=False)
+    return root
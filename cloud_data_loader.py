@@ -4,48 +4,36 @@
 """
 
 import os
-import json
 import pandas as pd
 from pathlib import Path
 from datetime import datetime
 import streamlit as st
+from market_store import MARKET_STORE_COMPACT, compact_market_frame
+from sync_format import MATRICES, sync_parts, load_sync_frame
 
 class CloudDataLoader:
-    def __init__(self, data_dir="data"):
+    def __init__(self, data_dir="data", compact=MARKET_STORE_COMPACT):
         self.data_dir = Path(data_dir)
+        # compact为True时行情矩阵使用紧凑只读表示（收盘价float32，成交量UInt32/UInt64）
+        self.compact = compact
         self.cache = {}
         
     def load_json_data(self, filename):
-        """从JSON文件加载数据"""
-        filepath = self.data_dir / filename
+        """加载同步数据：优先同名的Arrow文件（.arrow），没有时读取JSON"""
+        name = Path(filename).stem
         
         if filename in self.cache:
             return self.cache[filename]
             
-        if not filepath.exists():
+        if not sync_parts(self.data_dir, name):
             st.error(f"数据文件不存在: {filename}")
             return None
             
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
-            # 转换为DataFrame
-            df = pd.DataFrame(data['data'], columns=data['columns'])
-            if data['index']:
-                df.index = data['index']
-            
-            # 对于市场数据文件，确保数值列被正确转换为数值类型
-            if 'market_data_closes' in filename or 'market_data_volumes' in filename:
-                # 将Date列设置为索引
-                if 'Date' in df.columns:
-                    df['Date'] = pd.to_datetime(df['Date'])
-                    df.set_index('Date', inplace=True)
-                
-                # 将所有数值列转换为float类型
-                numeric_columns = df.select_dtypes(include=['object']).columns
-                for col in numeric_columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
+            # 与看板数据访问层的同步后端使用同一读取
+            df = load_sync_frame(self.data_dir, name)
+            if self.compact and name in MATRICES:
+                df = compact_market_frame(df, name)
                 
             self.cache[filename] = df
             return df
@@ -86,14 +74,16 @@ class CloudDataLoader:
         ]
         
         for filename in data_files:
-            filepath = self.data_dir / filename
-            if filepath.exists():
+            # 一份数据可能由基础文件和增量文件组成，修改时间取最新的文件，大小为合计
+            parts = sync_parts(self.data_dir, Path(filename).stem)
+            if parts:
+                filename = parts[0].name
                 # 获取文件修改时间
-                mtime = datetime.fromtimestamp(filepath.stat().st_mtime)
+                mtime = datetime.fromtimestamp(max(p.stat().st_mtime for p in parts))
                 status[filename] = {
                     'exists': True,
                     'last_modified': mtime.strftime('%Y-%m-%d %H:%M:%S'),
-                    'size': filepath.stat().st_size
+                    'size': sum(p.stat().st_size for p in parts)
                 }
             else:
                 status[filename] = {'exists': False}
@@ -12,11 +12,22 @@ import pandas as pd
 from pathlib import Path
 from datetime import datetime, timedelta
 import argparse
+from market_store import load_market_data, save_market_data, MARKET_STORE_DTYPES
+from sync_format import SYNC_FORMAT, SYNC_COMPRESSION, SYNC_MAX_DELTAS, sync_path, delta_path, sync_parts
+from sync_format import write_sync_frame, load_sync_frame, load_manifest, save_manifest
+from sync_format import frame_row_hashes, frame_digest, file_sha256, SYNC_MANIFEST
+from object_store import create_store, upload_files, download_files
+from object_store import OBJECT_PREFIX, TRANSFER_STATE, TRANSFER_CHUNK_SIZE, TRANSFER_MAX_WORKERS
+sys.path.append(str(Path(__file__).parent / 'pipeline'))
+from instrumentation import span, record_frame, add_counter, instrumented_run
 
 class DataSync:
-    def __init__(self, data_dir="data"):
+    def __init__(self, data_dir="data", fmt=SYNC_FORMAT, compression=SYNC_COMPRESSION):
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(exist_ok=True)
+        # 同步格式：'arrow'（默认，Arrow IPC）或 'json'（兼容旧部署）；compression仅对arrow有效
+        self.fmt = fmt
+        self.compression = compression
         
     def save_data_to_json(self, data, filename):
         """将数据保存为JSON格式"""
@@ -41,6 +52,7 @@ class DataSync:
             
         try:
             df = pd.read_csv(csv_path)
+            record_frame(df)
             data = {
                 'columns': df.columns.tolist(),
                 'data': df.values.tolist(),
@@ -53,6 +65,46 @@ class DataSync:
             print(f"❌ 转换失败: {e}")
             return False
             
+    def convert_market_data_to_json(self, data_dir, name, json_filename):
+        """将行情矩阵（列式存储或CSV）转换为JSON格式"""
+        df = load_market_data(name, data_dir=data_dir, compact=False)
+        if df is None:
+            print(f"❌ 行情数据不存在: {Path(data_dir) / name}")
+            return False
+        record_frame(df)
+        try:
+            df = df.reset_index()
+            df['Date'] = df['Date'].dt.strftime('%Y-%m-%d')
+            data = {
+                'columns': df.columns.tolist(),
+                'data': df.values.tolist(),
+                'index': None,
+                'last_updated': datetime.now().isoformat()
+            }
+            self.save_data_to_json(data, json_filename)
+            return True
+        except Exception as e:
+            print(f"❌ 转换失败: {e}")
+            return False
+
+    def convert_json_to_market_data(self, json_filename, data_dir, name):
+        """将JSON格式行情矩阵恢复到列式存储（同时导出CSV）"""
+        data = self.load_data_from_json(json_filename)
+        if not data:
+            print(f"❌ JSON文件不存在: {json_filename}")
+            return False
+        try:
+            df = pd.DataFrame(data['data'], columns=data['columns'])
+            df['Date'] = pd.to_datetime(df['Date'])
+            df = df.set_index('Date').apply(pd.to_numeric, errors='coerce')
+            record_frame(df)
+            path = save_market_data(df, name, data_dir=data_dir)
+            print(f"✅ 行情数据已生成: {path}")
+            return True
+        except Exception as e:
+            print(f"❌ 转换失败: {e}")
+            return False
+
     def convert_json_to_csv(self, json_filename, csv_path):
         """将JSON格式数据转换回CSV"""
         data = self.load_data_from_json(json_filename)
@@ -62,6 +114,7 @@ class DataSync:
             
         try:
             df = pd.DataFrame(data['data'], columns=data['columns'])
+            record_frame(df)
             if data['index']:
                 df.index = data['index']
             df.to_csv(csv_path, index=True)
@@ -71,8 +124,109 @@ class DataSync:
             print(f"❌ 转换失败: {e}")
             return False
             
+    def load_source(self, source_path, name):
+        """读取待同步的数据：行情矩阵通过统一的行情存储读取，其余为CSV结果表；不存在时返回None"""
+        source_path = Path(source_path)
+        if name in MARKET_STORE_DTYPES:
+            return load_market_data(name, data_dir=source_path.parent, compact=False)
+        # round_trip：恢复后再读取得到完全相同的浮点数，内容哈希可以与清单比较
+        return pd.read_csv(source_path, float_precision='round_trip') if source_path.exists() else None
+
+    def _entry_parts(self, entry):
+        """清单记录的组成文件，格式与当前同步格式不同或有文件缺失时返回None"""
+        if not entry or entry.get('format') != self.fmt:
+            return None
+        parts = [self.data_dir / part['file'] for part in entry['parts']]
+        return parts if all(p.exists() for p in parts) else None
+
+    def _part(self, path):
+        path = Path(path)
+        return {'file': path.name, 'sha256': file_sha256(path), 'size': path.stat().st_size}
+
+    def convert_to_arrow(self, df, name, entry=None, row_hashes=None):
+        """将行情矩阵或结果表写为Arrow IPC同步文件，返回组成文件列表（清单格式），失败时返回None
+        entry为上次同步的清单记录：行情矩阵的旧内容是新内容的前缀（只追加了新日期）时只写入新增行"""
+        try:
+            if row_hashes is None:
+                row_hashes = frame_row_hashes(df)
+            rows = entry['rows'] if entry else 0
+            if (entry and name in MARKET_STORE_DTYPES and 0 < rows < len(df)
+                    and len(entry['parts']) <= SYNC_MAX_DELTAS
+                    and frame_digest(df, row_hashes, rows) == entry['content_hash']):
+                path = delta_path(self.data_dir, name, len(entry['parts']))
+                size = write_sync_frame(df.iloc[rows:], path, name, self.compression)
+                print(f"✅ 增量已保存: {path} (+{len(df) - rows}行, {size} bytes)")
+                return entry['parts'] + [self._part(path)]
+            path = sync_path(self.data_dir, name, 'arrow')
+            size = write_sync_frame(df, path, name, self.compression)
+            print(f"✅ 数据已保存: {path} ({size} bytes)")
+            return [self._part(path)]
+        except Exception as e:
+            print(f"❌ 转换失败: {e}")
+            return None
+
+    def sync_file(self, source_path, name, manifest):
+        """同步一份数据并更新清单：内容哈希与清单一致时跳过，否则整份或增量写入"""
+        source_path = Path(source_path)
+        df = self.load_source(source_path, name)
+        if df is None:
+            print(f"❌ 数据不存在: {source_path}")
+            return False
+        row_hashes = frame_row_hashes(df)
+        digest = frame_digest(df, row_hashes)
+        entry = manifest.get(name)
+        valid = self._entry_parts(entry) is not None
+        if valid and entry['content_hash'] == digest:
+            print(f"⏭️ 内容未变化，跳过: {name}")
+            return True
+
+        json_filename = f'{name}.json'
+        if self.fmt == 'json':
+            if name in MARKET_STORE_DTYPES:
+                ok = self.convert_market_data_to_json(source_path.parent, name, json_filename)
+            else:
+                ok = self.convert_csv_to_json(source_path, json_filename)
+            parts = [self._part(self.data_dir / json_filename)] if ok else None
+        else:
+            record_frame(df)
+            parts = self.convert_to_arrow(df, name, entry if valid else None, row_hashes)
+        if parts is None:
+            return False
+
+        # 整份重写后，上次同步中不再使用的文件（旧增量、其他格式）一并删除
+        current = {part['file'] for part in parts}
+        for part in (entry or {}).get('parts', []):
+            if part['file'] not in current:
+                (self.data_dir / part['file']).unlink(missing_ok=True)
+        manifest[name] = {
+            'format': self.fmt,
+            'content_hash': digest,
+            'rows': len(df),
+            'last_date': df.index[-1].strftime('%Y-%m-%d') if name in MARKET_STORE_DTYPES and len(df) else None,
+            'last_updated': datetime.now().isoformat(),
+            'parts': parts,
+        }
+        return True
+
+    def convert_arrow_to_source(self, name, target_path, manifest=None):
+        """将Arrow IPC同步文件（含增量文件）恢复为行情矩阵（列式存储，同时导出CSV）或CSV结果表"""
+        target_path = Path(target_path)
+        try:
+            df = load_sync_frame(self.data_dir, name, manifest)
+            record_frame(df)
+            if name in MARKET_STORE_DTYPES:
+                path = save_market_data(df, name, data_dir=target_path.parent)
+            else:
+                df.to_csv(target_path, index=False)
+                path = target_path
+            print(f"✅ 数据已生成: {path}")
+            return True
+        except Exception as e:
+            print(f"❌ 转换失败: {e}")
+            return False
+
     def sync_all_data(self):
-        """同步所有数据文件"""
+        """同步所有数据文件；只重写内容发生变化的数据"""
         print("🔄 开始同步所有数据文件...")
         
         # 需要同步的文件列表
@@ -88,16 +242,21 @@ class DataSync:
             ('processed_data/holdings_countryAnalysis.csv', 'holdings_countryAnalysis.json')
         ]
         
+        manifest = load_manifest(self.data_dir)
         success_count = 0
         for csv_path, json_filename in files_to_sync:
-            if self.convert_csv_to_json(csv_path, json_filename):
+            csv_path = Path(csv_path)
+            with span('file', json_filename):
+                ok = self.sync_file(csv_path, csv_path.stem, manifest)
+            if ok:
                 success_count += 1
+        save_manifest(self.data_dir, manifest)
                 
         print(f"✅ 同步完成: {success_count}/{len(files_to_sync)} 个文件")
         return success_count == len(files_to_sync)
         
     def restore_all_data(self):
-        """恢复所有数据文件"""
+        """恢复所有数据文件；本地数据与清单中的内容哈希一致时跳过"""
         print("🔄 开始恢复所有数据文件...")
         
         # 需要恢复的文件列表
@@ -117,99 +276,137 @@ class DataSync:
         Path('source_data').mkdir(exist_ok=True)
         Path('processed_data').mkdir(exist_ok=True)
         
+        manifest = load_manifest(self.data_dir)
         success_count = 0
         for json_filename, csv_path in files_to_restore:
-            if self.convert_json_to_csv(json_filename, csv_path):
+            csv_path = Path(csv_path)
+            name = csv_path.stem
+            with span('file', json_filename):
+                entry = manifest.get(name)
+                local = self.load_source(csv_path, name) if entry else None
+                parts = sync_parts(self.data_dir, name, manifest)
+                if local is not None and frame_digest(local) == entry['content_hash']:
+                    print(f"⏭️ 本地数据已是最新，跳过: {csv_path}")
+                    ok = True
+                # 优先从Arrow同步文件恢复，不存在时使用JSON
+                elif parts and parts[0].suffix == '.arrow':
+                    ok = self.convert_arrow_to_source(name, csv_path, manifest)
+                elif name in MARKET_STORE_DTYPES:
+                    ok = self.convert_json_to_market_data(json_filename, csv_path.parent, name)
+                else:
+                    ok = self.convert_json_to_csv(json_filename, csv_path)
+            if ok:
                 success_count += 1
                 
         print(f"✅ 恢复完成: {success_count}/{len(files_to_restore)} 个文件")
         return success_count == len(files_to_restore)
         
-    '''def upload_to_cloud_storage(self, bucket_name, credentials_file=None):
-        """上传数据到云存储（示例：AWS S3）"""
+    def _remote_manifest(self, store):
+        key = OBJECT_PREFIX + SYNC_MANIFEST
+        if store.head(key) is None:
+            return {}
+        return json.loads(store.get(key).decode('utf-8'))
+
+    def upload_to_cloud_storage(self, bucket_name, credentials_file=None, store_name='s3',
+                                max_workers=TRANSFER_MAX_WORKERS, chunk_size=TRANSFER_CHUNK_SIZE):
+        """上传同步文件到对象存储：只上传远端没有或内容不同的文件，清单最后上传，最后删除清单不再引用的对象"""
         try:
-            import boto3
-            from botocore.exceptions import NoCredentialsError
-            
-            if credentials_file:
-                session = boto3.Session(profile_name=credentials_file)
-                s3 = session.client('s3')
-            else:
-                s3 = boto3.client('s3')
-                
-            # 上传所有JSON文件
-            for json_file in self.data_dir.glob('*.json'):
-                s3.upload_file(
-                    str(json_file), 
-                    bucket_name, 
-                    f"agix-monitor-data/{json_file.name}"
-                )
-                print(f"✅ 已上传: {json_file.name}")
-                
+            store = create_store(store_name, bucket_name, credentials_file)
+            manifest = load_manifest(self.data_dir)
+            if not manifest:
+                print("❌ 同步清单不存在，请先运行 --action sync")
+                return False
+            remote_files = {part['file']: part['sha256']
+                            for entry in self._remote_manifest(store).values() for part in entry['parts']}
+            existing = store.list_keys(OBJECT_PREFIX)
+            local_files = [part for entry in manifest.values() for part in entry['parts']]
+            changed = [part['file'] for part in local_files
+                       if remote_files.get(part['file']) != part['sha256'] or OBJECT_PREFIX + part['file'] not in existing]
+            print(f"🔄 需要上传 {len(changed)}/{len(local_files)} 个文件")
+
+            sent = upload_files(store, [(self.data_dir / name, OBJECT_PREFIX + name) for name in changed],
+                                chunk_size=chunk_size, max_workers=max_workers,
+                                state_path=self.data_dir / TRANSFER_STATE)
+            # 清单最后上传：下载方读到新清单时，清单引用的文件都已上传完成
+            data = (self.data_dir / SYNC_MANIFEST).read_bytes()
+            store.put(OBJECT_PREFIX + SYNC_MANIFEST, data)
+            add_counter('network_bytes', sent + len(data))
+
+            keep = {OBJECT_PREFIX + part['file'] for part in local_files} | {OBJECT_PREFIX + SYNC_MANIFEST}
+            for key in existing:
+                if key not in keep:
+                    store.delete(key)
+            print(f"✅ 上传完成: {len(changed)} 个文件, {sent} bytes")
             return True
         except ImportError:
             print("❌ 需要安装 boto3: pip install boto3")
             return False
-        except NoCredentialsError:
-            print("❌ 需要配置AWS凭证")
-            return False
         except Exception as e:
             print(f"❌ 上传失败: {e}")
             return False
-            '''
-            
-    '''def download_from_cloud_storage(self, bucket_name, credentials_file=None):
-        """从云存储下载数据"""
+
+    def download_from_cloud_storage(self, bucket_name, credentials_file=None, store_name='s3',
+                                    max_workers=TRANSFER_MAX_WORKERS, chunk_size=TRANSFER_CHUNK_SIZE):
+        """从对象存储下载同步文件：只下载本地没有或内容不同的文件，校验sha256后最后写入清单"""
         try:
-            import boto3
-            from botocore.exceptions import NoCredentialsError
-            
-            if credentials_file:
-                session = boto3.Session(profile_name=credentials_file)
-                s3 = session.client('s3')
-            else:
-                s3 = boto3.client('s3')
-                
-            # 列出所有JSON文件
-            response = s3.list_objects_v2(
-                Bucket=bucket_name,
-                Prefix="agix-monitor-data/"
-            )
-            
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    if obj['Key'].endswith('.json'):
-                        filename = obj['Key'].split('/')[-1]
-                        s3.download_file(
-                            bucket_name, 
-                            obj['Key'], 
-                            str(self.data_dir / filename)
-                        )
-                        print(f"✅ 已下载: {filename}")
-                        
+            store = create_store(store_name, bucket_name, credentials_file)
+            manifest = self._remote_manifest(store)
+            if not manifest:
+                print("❌ 远端同步清单不存在")
+                return False
+            parts = [part for entry in manifest.values() for part in entry['parts']]
+            needed = [part for part in parts
+                      if not (self.data_dir / part['file']).exists()
+                      or file_sha256(self.data_dir / part['file']) != part['sha256']]
+            print(f"🔄 需要下载 {len(needed)}/{len(parts)} 个文件")
+
+            received = download_files(store, [(OBJECT_PREFIX + part['file'], self.data_dir / part['file'], part['size'])
+                                              for part in needed],
+                                      chunk_size=chunk_size, max_workers=max_workers)
+            add_counter('network_bytes', received)
+            corrupt = [part['file'] for part in needed if file_sha256(self.data_dir / part['file']) != part['sha256']]
+            if corrupt:
+                print(f"❌ 下载文件校验失败: {corrupt}")
+                return False
+            # 清单最后写入：读取方看到新清单时，清单引用的文件都已下载完成；之后删除新清单不再引用的本地文件
+            previous = load_manifest(self.data_dir)
+            save_manifest(self.data_dir, manifest)
+            current = {part['file'] for part in parts}
+            for entry in previous.values():
+                for part in entry['parts']:
+                    if part['file'] not in current:
+                        (self.data_dir / part['file']).unlink(missing_ok=True)
+            print(f"✅ 下载完成: {len(needed)} 个文件, {received} bytes")
             return True
         except ImportError:
             print("❌ 需要安装 boto3: pip install boto3")
             return False
-        except NoCredentialsError:
-            print("❌ 需要配置AWS凭证")
-            return False
         except Exception as e:
             print(f"❌ 下载失败: {e}")
             return False
-            '''
 
 def main():
     parser = argparse.ArgumentParser(description="AGIX Fund Monitor 数据同步工具")
     parser.add_argument("--action", choices=["sync", "restore", "upload", "download"], 
                        required=True, help="执行的操作")
     parser.add_argument("--data-dir", default="data", help="数据目录")
-    parser.add_argument("--bucket", help="云存储桶名称")
+    parser.add_argument("--format", choices=["arrow", "json"], default=SYNC_FORMAT, help="同步文件格式")
+    parser.add_argument("--compression", choices=["zstd", "lz4", "none"], default=SYNC_COMPRESSION or "none",
+                       help="Arrow同步文件压缩方式（none可零拷贝内存映射读取）")
+    parser.add_argument("--bucket", help="云存储桶名称（--store local时为本地目录）")
     parser.add_argument("--credentials", help="AWS凭证文件")
+    parser.add_argument("--store", choices=["s3", "local"], default="s3", help="对象存储（local为本地目录，用于测试）")
+    parser.add_argument("--workers", type=int, default=TRANSFER_MAX_WORKERS, help="并发传输线程数")
+    parser.add_argument("--chunk-mb", type=int, default=TRANSFER_CHUNK_SIZE // (1024 * 1024),
+                       help="分块大小（MB，S3分段上传至少5）")
     
     args = parser.parse_args()
+    # S3要求除最后一块外每块不小于5MB；其他存储和下载的分块也至少1MB
+    min_chunk_mb = 5 if args.store == "s3" and args.action == "upload" else 1
+    if args.chunk_mb < min_chunk_mb:
+        parser.error(f"--chunk-mb 不能小于 {min_chunk_mb}")
     
-    sync = DataSync(args.data_dir)
+    sync = DataSync(args.data_dir, fmt=args.format, compression=None if args.compression == "none" else args.compression)
     
     if args.action == "sync":
         sync.sync_all_data()
@@ -219,12 +416,13 @@ def main():
         if not args.bucket:
             print("❌ 需要指定 --bucket 参数")
             sys.exit(1)
-        sync.upload_to_cloud_storage(args.bucket, args.credentials)
+        sync.upload_to_cloud_storage(args.bucket, args.credentials, args.store, args.workers, args.chunk_mb * 1024 * 1024)
     elif args.action == "download":
         if not args.bucket:
             print("❌ 需要指定 --bucket 参数")
             sys.exit(1)
-        sync.download_from_cloud_storage(args.bucket, args.credentials)
+        sync.download_from_cloud_storage(args.bucket, args.credentials, args.store, args.workers, args.chunk_mb * 1024 * 1024)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    with instrumented_run('data_sync'):
+        main() 
\ No newline at end of file
@@ -0,0 +1,239 @@
+"""
+行情矩阵存储模块
+收盘价/交易量矩阵（日期 × ticker）以列式二进制格式（Parquet/Feather）保存，
+所有读取方统一通过load_market_data加载，CSV仅作为可选的导出格式
+"""
+
+import pandas as pd
+import numpy as np
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+MARKET_DATA_DIR = BASE_DIR / 'source_data'
+
+# 存储格式：'parquet' / 'feather' / 'csv'
+MARKET_STORE_FORMAT = 'parquet'
+# 写入列式文件的同时是否导出CSV（供人工查看及旧工具使用）
+MARKET_STORE_EXPORT_CSV = True
+# 各矩阵默认保存精度
+MARKET_STORE_DTYPES = {
+    'market_data_closes': 'float64',
+    'market_data_volumes': 'float64',
+}
+
+# 紧凑表示（可选）：收盘价float32，成交量UInt32/UInt64（缺失保留为NA），
+# 同一文件在进程内只加载一次，各次读取得到的DataFrame共用同一份只读数组
+MARKET_STORE_COMPACT = False
+VOLUME_MATRICES = ('market_data_volumes',)
+
+_SUFFIXES = {'parquet': '.parquet', 'feather': '.feather', 'csv': '.csv'}
+# 紧凑矩阵的共享数组：路径 -> (文件修改时间, 文件大小, 日期索引, ticker, 数组)
+_SHARED = {}
+
+
+def has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def market_data_path(name, fmt=MARKET_STORE_FORMAT, data_dir=MARKET_DATA_DIR):
+    """返回指定矩阵在指定格式下的文件路径"""
+    return Path(data_dir) / f'{name}{_SUFFIXES[fmt]}'
+
+
+def _resolve_read_path(name, data_dir):
+    """按 列式格式 -> CSV 的优先级找到可读取的文件；若CSV比列式文件更新（如被单独覆盖），则读取CSV"""
+    csv_path = market_data_path(name, 'csv', data_dir)
+    formats = [MARKET_STORE_FORMAT, 'parquet', 'feather'] if has_pyarrow() else []
+    for fmt in formats:
+        if fmt == 'csv':
+            continue
+        path = market_data_path(name, fmt, data_dir)
+        if path.exists():
+            if csv_path.exists() and csv_path.stat().st_mtime > path.stat().st_mtime:
+                break
+            return path, fmt
+    if csv_path.exists():
+        return csv_path, 'csv'
+    return None, None
+
+
+def market_data_fingerprint(name, data_dir=MARKET_DATA_DIR, fmt=None):
+    """load_market_data将读取的文件及其(修改时间, 大小)，文件不存在时返回None；用于按文件变化失效的缓存"""
+    path = _resolve_read_path(name, data_dir)[0] if fmt is None else market_data_path(name, fmt, data_dir)
+    if path is None or not path.exists():
+        return None
+    stat = path.stat()
+    return str(path), stat.st_mtime_ns, stat.st_size
+
+
+def save_market_data(df, name, data_dir=MARKET_DATA_DIR, dtype=None, fmt=MARKET_STORE_FORMAT, export_csv=MARKET_STORE_EXPORT_CSV):
+    """
+    保存行情矩阵
+    df: 以日期为索引、ticker为列的DataFrame
+    dtype: 'float32' 或 'float64'，默认按MARKET_STORE_DTYPES
+    """
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    dtype = dtype or MARKET_STORE_DTYPES.get(name, 'float64')
+    df = df.loc[:, ~df.columns.duplicated()].astype(np.dtype(dtype))
+    df.index = pd.DatetimeIndex(df.index, name='Date')
+    df.columns = [str(c) for c in df.columns]
+    if fmt != 'csv' and not has_pyarrow():
+        print(f'[WARN] 未安装pyarrow，{name} 仅保存为CSV')
+        fmt = 'csv'
+    # 先写CSV再写列式文件，保证列式文件的修改时间不早于CSV
+    if fmt == 'csv' or export_csv:
+        df.to_csv(market_data_path(name, 'csv', data_dir))
+    if fmt == 'parquet':
+        df.to_parquet(market_data_path(name, fmt, data_dir))
+    elif fmt == 'feather':
+        # feather不保存索引，日期作为普通列写入
+        df.reset_index().to_feather(market_data_path(name, fmt, data_dir))
+    return market_data_path(name, fmt, data_dir)
+
+
+def _table_path(path):
+    path = Path(path)
+    if path.suffix == '.parquet' and not has_pyarrow():
+        return path.with_suffix('.csv')
+    return path
+
+
+def save_table(df, path):
+    """保存长表（Parquet，未安装pyarrow时退化为同名CSV），返回实际保存路径"""
+    path = _table_path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == '.parquet':
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+
+def load_table(path, columns=None, date_columns=('Date',), compact=None):
+    """
+    读取save_table保存的长表，不存在时返回None
+    compact: 默认按MARKET_STORE_COMPACT，为True时Ticker/Benchmark列转换为分类类型
+    """
+    path = _table_path(path)
+    if not path.exists():
+        return None
+    if path.suffix == '.parquet':
+        df = pd.read_parquet(path, columns=columns)
+    else:
+        df = pd.read_csv(path, usecols=columns, dtype={'Ticker': str})
+        for col in date_columns:
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col])
+    if MARKET_STORE_COMPACT if compact is None else compact:
+        for col in ('Ticker', 'Benchmark'):
+            if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype('category')
+    return df
+
+
+def _readonly(arr):
+    arr.flags.writeable = False
+    return arr
+
+
+def compact_arrays(df, name):
+    """
+    将行情矩阵转换为紧凑表示所需的只读数组
+    收盘价为一个float32二维数组；成交量为按列连续存放的无符号整数数组及缺失掩码，
+    最大值不超过uint32范围时使用uint32，否则使用uint64
+    """
+    values = df.to_numpy(dtype=float, na_value=np.nan)
+    if name not in VOLUME_MATRICES:
+        return (_readonly(np.ascontiguousarray(values, dtype=np.float32)),)
+    mask = np.isnan(values)
+    peak = np.nanmax(values) if (~mask).any() else 0
+    dtype = np.uint32 if peak <= np.iinfo(np.uint32).max else np.uint64
+    data = np.asfortranarray(np.where(mask, 0, np.rint(np.clip(values, 0, None))), dtype=dtype)
+    return _readonly(data), _readonly(np.asfortranarray(mask))
+
+
+def compact_frame(index, columns, arrays):
+    """由compact_arrays的结果构造DataFrame，不复制数据"""
+    if len(arrays) == 1:
+        return pd.DataFrame(arrays[0], index=index, columns=columns, copy=False)
+    data, mask = arrays
+    return pd.DataFrame({col: pd.arrays.IntegerArray(data[:, j], mask[:, j]) for j, col in enumerate(columns)},
+                        index=index, columns=columns, copy=False)
+
+
+def compact_market_frame(df, name):
+    """行情矩阵的紧凑表示（新的只读数组，不进入共享缓存）"""
+    return compact_frame(df.index, df.columns, compact_arrays(df, name))
+
+
+def _load_shared(name, path, fmt):
+    """紧凑模式下读取整个矩阵；文件未变化时复用进程内已加载的只读数组"""
+    stat = path.stat()
+    cached = _SHARED.get(str(path))
+    if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+        df = _read_market_file(path, fmt)
+        cached = (stat.st_mtime_ns, stat.st_size, df.index, df.columns, compact_arrays(df, name))
+        _SHARED[str(path)] = cached
+    return compact_frame(*cached[2:])
+
+
+def _read_market_file(path, fmt, tickers=None, start=None, end=None):
+    """读取行情文件；tickers投影到列，Parquet格式下start/end同时作为行过滤条件下推"""
+    if fmt == 'parquet':
+        if tickers is not None:
+            import pyarrow.parquet as pq
+            available = set(pq.read_schema(path).names)
+            tickers = [t for t in tickers if t in available]
+        filters = [('Date', op, pd.Timestamp(d)) for op, d in (('>=', start), ('<=', end)) if d is not None]
+        df = pd.read_parquet(path, columns=tickers, filters=filters or None)
+    elif fmt == 'feather':
+        columns = None if tickers is None else ['Date'] + tickers
+        if columns is not None:
+            import pyarrow.ipc as ipc
+            available = set(ipc.open_file(str(path)).schema.names)
+            columns = [c for c in columns if c in available]
+        df = pd.read_feather(path, columns=columns).set_index('Date')
+    else:
+        usecols = None
+        if tickers is not None:
+            header = pd.read_csv(path, nrows=0).columns
+            usecols = [header[0]] + [t for t in tickers if t in header]
+        df = pd.read_csv(path, index_col=0, parse_dates=True, usecols=usecols)
+    df.index = pd.DatetimeIndex(df.index, name='Date')
+    return df
+
+
+def load_market_data(name, tickers=None, start=None, end=None, data_dir=MARKET_DATA_DIR, dtype=None, compact=None, fmt=None):
+    """
+    读取行情矩阵，不存在时返回None
+    tickers: 只读取指定ticker列（列投影，列式格式下不会读取其余列）
+    start/end: 日期范围（包含两端），Parquet格式下作为过滤条件下推
+    dtype: 读取后转换的精度，默认保持文件中的精度
+    compact: 是否使用紧凑表示，默认按MARKET_STORE_COMPACT；紧凑表示的完整矩阵为只读，
+             指定tickers/start/end时从共享矩阵中截取（截取结果为副本）
+    fmt: 只读取指定格式的文件（'parquet' / 'feather' / 'csv'），默认按 列式格式 -> CSV 的优先级
+    """
+    if fmt is None:
+        path, fmt = _resolve_read_path(name, data_dir)
+    else:
+        path = market_data_path(name, fmt, data_dir)
+    if path is None or not path.exists():
+        return None
+    if tickers is not None:
+        tickers = list(dict.fromkeys(str(t) for t in tickers))
+    if MARKET_STORE_COMPACT if compact is None else compact:
+        df = _load_shared(name, path, fmt)
+        if tickers is not None:
+            df = df[[t for t in tickers if t in df.columns]]
+    else:
+        df = _read_market_file(path, fmt, tickers, start, end)
+    if start is not None or end is not None:
+        df = df.loc[start:end]
+    if dtype is not None:
+        df = df.astype(np.dtype(dtype))
+    return df
@@ -0,0 +1,367 @@
+"""
+对象存储与并发分块传输
+DataSync通过ObjectStore接口上传/下载同步文件：LocalObjectStore把对象保存在本地目录（测试、无云凭证时使用），
+S3ObjectStore使用AWS S3（需要boto3）
+大文件按块并发分段上传，上传状态保存在本地，中断后重新运行只上传远端还没有的块；
+下载按字节范围并发读取，写入临时文件后替换；所有文件的块共用一个有界线程池
+"""
+
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from sync_format import file_sha256
+
+# 对象键前缀
+OBJECT_PREFIX = 'agix-monitor-data/'
+# 分块大小（S3要求除最后一块外每块不小于5MB），不超过一块的文件直接整份上传
+TRANSFER_CHUNK_SIZE = 8 * 1024 * 1024
+# 并发传输的线程数（所有文件的块共用）
+TRANSFER_MAX_WORKERS = 8
+# 未完成的分段上传状态（位于同步目录下）
+TRANSFER_STATE = '.transfer_state.json'
+
+
+# 对象存储接口：按键读写整个对象或字节范围，大对象通过分段上传写入
+# 分段上传完成前对象不可见；list_parts返回已上传的块（块号 -> etag），上传不存在时返回None
+# min_part_size: 分段上传中除最后一块外每块的最小字节数
+class ObjectStore:
+    name = 'base'
+    min_part_size = 1
+
+    def head(self, key):
+        """对象大小，不存在时返回None"""
+        raise NotImplementedError
+
+    def list_keys(self, prefix=''):
+        """前缀下的所有对象：{键: 大小}"""
+        raise NotImplementedError
+
+    def put(self, key, data):
+        raise NotImplementedError
+
+    def get(self, key, start=None, end=None):
+        """读取对象，start/end为字节范围（左闭右开）"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def create_multipart(self, key):
+        """开始分段上传，返回upload_id"""
+        raise NotImplementedError
+
+    def upload_part(self, key, upload_id, part_no, data):
+        """上传一块（块号从1开始），返回etag（块内容的MD5）"""
+        raise NotImplementedError
+
+    def list_parts(self, key, upload_id):
+        raise NotImplementedError
+
+    def complete_multipart(self, key, upload_id, etags):
+        """按块号顺序合并所有块，etags为各块的etag"""
+        raise NotImplementedError
+
+    def abort_multipart(self, key, upload_id):
+        raise NotImplementedError
+
+
+class LocalObjectStore(ObjectStore):
+    """
+    本地目录对象存储：对象保存为 root/<键>，分段上传的块保存在 root/.multipart/<upload_id>/ 下
+    写入先写临时文件再替换，读取方不会看到写了一半的对象
+    """
+    name = 'local'
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.multipart_dir = self.root / '.multipart'
+
+    def _path(self, key):
+        return self.root / key
+
+    def _upload_dir(self, upload_id):
+        return self.multipart_dir / upload_id
+
+    def _write(self, path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f'{path.name}.{uuid.uuid4().hex}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def head(self, key):
+        path = self._path(key)
+        return path.stat().st_size if path.is_file() else None
+
+    def list_keys(self, prefix=''):
+        keys = {}
+        for path in self.root.rglob('*'):
+            if path.is_file() and self.multipart_dir not in path.parents and not path.name.endswith('.tmp'):
+                key = path.relative_to(self.root).as_posix()
+                if key.startswith(prefix):
+                    keys[key] = path.stat().st_size
+        return keys
+
+    def put(self, key, data):
+        self._write(self._path(key), data)
+
+    def get(self, key, start=None, end=None):
+        with open(self._path(key), 'rb') as f:
+            if start:
+                f.seek(start)
+            return f.read() if end is None else f.read(end - (start or 0))
+
+    def delete(self, key):
+        self._path(key).unlink(missing_ok=True)
+
+    def create_multipart(self, key):
+        upload_id = uuid.uuid4().hex
+        upload_dir = self._upload_dir(upload_id)
+        upload_dir.mkdir(parents=True)
+        (upload_dir / 'key').write_text(key, encoding='utf-8')
+        return upload_id
+
+    def upload_part(self, key, upload_id, part_no, data):
+        upload_dir = self._upload_dir(upload_id)
+        if not upload_dir.exists():
+            raise KeyError(f'分段上传不存在: {upload_id}')
+        self._write(upload_dir / f'part-{part_no:05d}', data)
+        return hashlib.md5(data).hexdigest()
+
+    def list_parts(self, key, upload_id):
+        upload_dir = self._upload_dir(upload_id)
+        if not upload_dir.exists() or (upload_dir / 'key').read_text(encoding='utf-8') != key:
+            return None
+        parts = {}
+        for path in upload_dir.glob('part-*'):
+            if not path.name.endswith('.tmp'):
+                parts[int(path.name[5:])] = hashlib.md5(path.read_bytes()).hexdigest()
+        return parts
+
+    def complete_multipart(self, key, upload_id, etags):
+        upload_dir = self._upload_dir(upload_id)
+        if self.list_parts(key, upload_id) != dict(enumerate(etags, 1)):
+            raise ValueError(f'分段上传的块与etag不一致: {key}')
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = upload_dir / 'object.tmp'
+        with open(tmp_path, 'wb') as out:
+            for part_no in range(1, len(etags) + 1):
+                with open(upload_dir / f'part-{part_no:05d}', 'rb') as f:
+                    shutil.copyfileobj(f, out)
+        os.replace(tmp_path, path)
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    def abort_multipart(self, key, upload_id):
+        shutil.rmtree(self._upload_dir(upload_id), ignore_errors=True)
+
+
+class S3ObjectStore(ObjectStore):
+    """AWS S3对象存储（boto3客户端可在线程间共享）"""
+    name = 's3'
+    min_part_size = 5 * 1024 * 1024
+
+    def __init__(self, bucket, profile=None):
+        import boto3
+        from botocore.exceptions import ClientError
+        session = boto3.Session(profile_name=profile) if profile else boto3.Session()
+        self.s3 = session.client('s3')
+        self.bucket = bucket
+        self.ClientError = ClientError
+
+    def head(self, key):
+        try:
+            return self.s3.head_object(Bucket=self.bucket, Key=key)['ContentLength']
+        except self.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def list_keys(self, prefix=''):
+        keys = {}
+        for page in self.s3.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                keys[obj['Key']] = obj['Size']
+        return keys
+
+    def put(self, key, data):
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    def get(self, key, start=None, end=None):
+        kwargs = {}
+        if start is not None or end is not None:
+            kwargs['Range'] = f"bytes={start or 0}-{'' if end is None else end - 1}"
+        return self.s3.get_object(Bucket=self.bucket, Key=key, **kwargs)['Body'].read()
+
+    def delete(self, key):
+        self.s3.delete_object(Bucket=self.bucket, Key=key)
+
+    def create_multipart(self, key):
+        return self.s3.create_multipart_upload(Bucket=self.bucket, Key=key)['UploadId']
+
+    def upload_part(self, key, upload_id, part_no, data):
+        response = self.s3.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=part_no, Body=data)
+        return response['ETag'].strip('"')
+
+    def list_parts(self, key, upload_id):
+        parts = {}
+        try:
+            for page in self.s3.get_paginator('list_parts').paginate(Bucket=self.bucket, Key=key, UploadId=upload_id):
+                for part in page.get('Parts', []):
+                    parts[part['PartNumber']] = part['ETag'].strip('"')
+        except self.ClientError as e:
+            if e.response['Error']['Code'] == 'NoSuchUpload':
+                return None
+            raise
+        return parts
+
+    def complete_multipart(self, key, upload_id, etags):
+        parts = [{'ETag': etag, 'PartNumber': part_no} for part_no, etag in enumerate(etags, 1)]
+        self.s3.complete_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+
+    def abort_multipart(self, key, upload_id):
+        self.s3.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+
+# 按名称创建对象存储：local的bucket为本地目录，s3的credentials为AWS配置名
+def create_store(name='s3', bucket=None, credentials=None):
+    if bucket is None:
+        raise ValueError('对象存储需要指定bucket')
+    if name == 'local':
+        return LocalObjectStore(bucket)
+    if name == 's3':
+        return S3ObjectStore(bucket, profile=credentials)
+    raise ValueError(f'未知的对象存储: {name}')
+
+
+def _chunks(size, chunk_size):
+    return [(start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)]
+
+
+def _read_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+class _TransferState:
+    """未完成的分段上传：{键: {upload_id, sha256, chunk_size}}，每次变化立即写盘，进程中断后可继续"""
+
+    def __init__(self, path):
+        self.path = Path(path) if path is not None else None
+        self.uploads = {}
+        if self.path is not None and self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.uploads = json.load(f)
+            except Exception as e:
+                print(f'[WARN] 传输状态读取失败，分段上传将重新开始: {e}')
+
+    def save(self):
+        if self.path is None:
+            return
+        if not self.uploads:
+            self.path.unlink(missing_ok=True)
+            return
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.uploads, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def upload_files(store, files, chunk_size=TRANSFER_CHUNK_SIZE, max_workers=TRANSFER_MAX_WORKERS, state_path=None):
+    """
+    并发上传 [(本地路径, 键)]，返回实际上传的字节数
+    不超过一块的文件整份上传；大文件分段上传，state_path记录未完成的上传，
+    文件内容和分块大小未变时继续上次的上传，远端已有且MD5一致的块不再上传
+    chunk_size小于store.min_part_size时抛出ValueError（S3拒绝小于5MB的非末尾块）
+    """
+    if chunk_size < store.min_part_size:
+        raise ValueError(f'分块大小 {chunk_size} 字节小于{store.name}允许的最小分段 {store.min_part_size} 字节')
+    state = _TransferState(state_path)
+    lock = threading.Lock()
+    sent = [0]
+
+    def put_file(path, key):
+        data = Path(path).read_bytes()
+        store.put(key, data)
+        with lock:
+            sent[0] += len(data)
+
+    def put_part(path, key, upload_id, part_no, start, end, uploaded):
+        data = _read_range(path, start, end)
+        etag = hashlib.md5(data).hexdigest()
+        if uploaded.get(part_no) == etag:
+            return etag
+        etag = store.upload_part(key, upload_id, part_no, data)
+        with lock:
+            sent[0] += len(data)
+        return etag
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = []
+        for path, key in files:
+            size = Path(path).stat().st_size
+            if size <= chunk_size:
+                pending.append((key, None, [executor.submit(put_file, path, key)]))
+                continue
+            digest = file_sha256(path)
+            upload = state.uploads.get(key)
+            uploaded = None
+            if upload and upload['sha256'] == digest and upload['chunk_size'] == chunk_size:
+                uploaded = store.list_parts(key, upload['upload_id'])
+            if uploaded is None:
+                upload = {'upload_id': store.create_multipart(key), 'sha256': digest, 'chunk_size': chunk_size}
+                state.uploads[key] = upload
+                state.save()
+                uploaded = {}
+            futures = [executor.submit(put_part, path, key, upload['upload_id'], part_no, start, end, uploaded)
+                       for part_no, (start, end) in enumerate(_chunks(size, chunk_size), 1)]
+            pending.append((key, upload['upload_id'], futures))
+
+        # 某一块失败时异常向上抛出，未完成的上传保留在状态文件中，下次运行继续
+        for key, upload_id, futures in pending:
+            etags = [f.result() for f in futures]
+            if upload_id is not None:
+                store.complete_multipart(key, upload_id, etags)
+                state.uploads.pop(key, None)
+                state.save()
+            print(f"✅ 已上传: {key}")
+    return sent[0]
+
+
+def download_files(store, files, chunk_size=TRANSFER_CHUNK_SIZE, max_workers=TRANSFER_MAX_WORKERS):
+    """
+    并发下载 [(键, 本地路径, 大小)]，返回下载的字节数
+    大文件按字节范围分块并发读取，写入预分配的临时文件，全部完成后替换目标文件
+    """
+    def get_range(key, tmp_path, start, end):
+        data = store.get(key, start, end)
+        with open(tmp_path, 'r+b') as f:
+            f.seek(start)
+            f.write(data)
+        return len(data)
+
+    received = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = []
+        for key, path, size in files:
+            path = Path(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f'{path.name}.download')
+            with open(tmp_path, 'wb') as f:
+                f.truncate(size)
+            futures = [executor.submit(get_range, key, tmp_path, start, end) for start, end in _chunks(size, chunk_size)]
+            pending.append((key, path, tmp_path, futures))
+
+        for key, path, tmp_path, futures in pending:
+            received += sum(f.result() for f in futures)
+            os.replace(tmp_path, path)
+            print(f"✅ 已下载: {path.name}")
+    return received
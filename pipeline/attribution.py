@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent))
+from risk_engine import daily_returns
+
+LINKING_METHODS = ('carino', 'menchero')
+
+
+# 对齐每个交易日的期初权重：第t天的收益使用第t-1个交易日（含）之前最近一份持仓文件的权重
+# 第t-1个交易日早于第一份持仓文件时没有权重，按0计（这些交易日不在归因覆盖范围内）
+def align_weights(weights, index):
+    pos = weights.index.searchsorted(index[:-1], side='right') - 1
+    pos = np.concatenate([[-1], pos])
+    aligned = weights.to_numpy(dtype=float)[np.maximum(pos, 0)]
+    aligned[pos < 0] = 0.0
+    return aligned
+
+
+def _prefix(arr):
+    return np.concatenate([np.zeros((1,) + arr.shape[1:]), np.cumsum(arr, axis=0)])
+
+
+class AttributionEngine:
+    """
+    持仓收益归因引擎
+    每个交易日用期初持仓权重乘以当天的价格收益得到各持仓的当日贡献，
+    任意区间内的每日贡献按Carino或Menchero方法几何链接，使各持仓贡献之和等于组合的区间收益
+    链接所需的各项预先按 日期 × 持仓 矩阵求前缀和，任意区间查询为O(1)
+    持仓文件只覆盖第一份持仓日期之后：起点早于coverage_start的区间没有真实权重，返回NaN
+    """
+
+    def __init__(self, closes, weights):
+        """closes: 收盘价（日期 × ticker）；weights: 持仓权重矩阵（持仓日期 × ticker，未持有为0）"""
+        weights = weights.sort_index()
+        self.index = pd.DatetimeIndex(closes.index)
+        self.tickers = weights.columns
+        # 第一份持仓日期（含）之后的第一个交易日，区间起点不早于它时每一天都有期初权重
+        first = int(self.index.searchsorted(weights.index[0], side='left')) if len(weights) else len(self.index)
+        self.coverage_start = self.index[first] if first < len(self.index) else None
+        self._first = first
+        prices = closes.reindex(columns=self.tickers)
+        # 没有行情的持仓（如未上市公司）收益按0计
+        returns = np.nan_to_num(daily_returns(prices))
+        contrib = align_weights(weights, self.index) * returns
+        port = contrib.sum(axis=1)
+        log_port = np.log1p(port)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            k = np.where(port != 0, log_port / port, 1.0)
+        self.daily_contributions = pd.DataFrame(contrib, index=self.index, columns=self.tickers)
+        self.portfolio_returns = pd.Series(port, index=self.index)
+        self._log_port = _prefix(log_port)
+        self._count = _prefix(np.ones(len(self.index)))
+        self._port = _prefix(port)
+        self._port_sq = _prefix(port * port)
+        self._contrib = _prefix(contrib)
+        self._contrib_k = _prefix(contrib * k[:, None])
+        self._contrib_port = _prefix(contrib * port[:, None])
+
+    def _positions(self, start=None, end=None):
+        """start为区间起点（以当天收盘价为基准，不计当天收益），end为区间终点（包含）"""
+        i = 0 if start is None else int(self.index.searchsorted(pd.Timestamp(start), side='left'))
+        j = len(self.index) - 1 if end is None else int(self.index.searchsorted(pd.Timestamp(end), side='right')) - 1
+        return i, j
+
+    def covers(self, start=None, end=None):
+        """区间内每一天是否都有持仓权重"""
+        i, j = self._positions(start, end)
+        return j > i >= self._first
+
+    def portfolio_return(self, start=None, end=None):
+        """区间内组合的几何累计收益，区间早于持仓覆盖范围时为NaN"""
+        i, j = self._positions(start, end)
+        if j <= i or i < self._first:
+            return np.nan
+        return float(np.expm1(self._log_port[j + 1] - self._log_port[i + 1]))
+
+    def contributions(self, start=None, end=None, method='carino'):
+        """区间内各持仓的链接贡献（Series，index为ticker），合计等于portfolio_return(start, end)；
+        区间早于持仓覆盖范围时全部为NaN"""
+        if method not in LINKING_METHODS:
+            raise ValueError(f'未知的链接方法: {method}')
+        i, j = self._positions(start, end)
+        if j <= i or i < self._first:
+            return pd.Series(np.nan, index=self.tickers)
+        a, b = i + 1, j + 1
+        total = np.expm1(self._log_port[b] - self._log_port[a])
+        if method == 'carino':
+            k_total = np.log1p(total) / total if total != 0 else 1.0
+            linked = (self._contrib_k[b] - self._contrib_k[a]) / k_total
+        else:
+            n = self._count[b] - self._count[a]
+            sum_port = self._port[b] - self._port[a]
+            sum_port_sq = self._port_sq[b] - self._port_sq[a]
+            m = total / (n * ((1 + total) ** (1 / n) - 1)) if total != 0 else 1.0
+            alpha = (total - m * sum_port) / sum_port_sq if sum_port_sq > 0 else 0.0
+            linked = m * (self._contrib[b] - self._contrib[a]) + alpha * (self._contrib_port[b] - self._contrib_port[a])
+        return pd.Series(linked, index=self.tickers)
+
+    def group_contributions(self, groups, start=None, end=None, method='carino'):
+        """按分组（ticker -> 行业/国家等的映射）汇总区间贡献，没有分组的ticker不计入；区间早于持仓覆盖范围时为NaN"""
+        contrib = self.contributions(start, end, method)
+        return contrib.groupby(contrib.index.map(groups)).sum(min_count=1)
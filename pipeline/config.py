@@ -53,9 +53,100 @@ YF_INTERVAL = '1d'
 YF_START_DATE = '2023-01-01'
 # YF_END_DATE = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
 YF_END_DATE = get_today_str()
+# 增量下载时，从已存储的最后日期再往前回补的天数（覆盖复权/修正）
+YF_OVERLAP_DAYS = 5
+# 重叠区间内新下载的复权收盘价与已存储值的相对偏差超过该值时，视为发生拆股/分红后历史复权价被整体重算，该ticker全量重新下载
+YF_ADJUST_TOLERANCE = 1e-4
+# 并发下载参数：每批ticker数量上限（一批为一次多ticker请求，实际按线程数均分）、线程数、最大重试次数
+YF_BATCH_SIZE = 100
+YF_MAX_WORKERS = 4
+YF_MAX_RETRIES = 5
+# 所有下载线程共享的限流：每秒请求数及允许的突发请求数
+YF_RATE_LIMIT = 2.0
+YF_RATE_BURST = 4
+# 单个ticker重试的指数退避参数（秒）
+YF_BACKOFF_BASE = 1.0
+YF_BACKOFF_MAX = 30.0
+# 行情数据源：'yfinance' / 'record' / 'replay' / 'synthetic'，record/replay使用MARKET_DATA_RECORD_DIR
+MARKET_DATA_PROVIDER = 'yfinance'
+MARKET_DATA_RECORD_DIR = BASE_DIR / 'cache' / 'market_data_record'
+# 非yfinance数据源（录制/回放/合成）的沙盒目录：行情矩阵、持仓ticker、公司信息及其缓存都写入这里，不改动正式数据
+MARKET_DATA_SANDBOX_DIR = BASE_DIR / 'cache' / 'sandbox'
+
+# 风险指标参数：无风险利率、滚动窗口（交易日）及窗口内最少有效天数占比
+RISK_FREE_RATE = 0.02
+ROLLING_WINDOWS = [20, 60, 120]
+ROLLING_MIN_PERIODS_RATIO = 0.75
+
+# 交易日历：各交易所的休市日表随代码提交（由exchange_calendars生成，覆盖CALENDAR_HOLIDAYS_START至CALENDAR_HOLIDAYS_END），
+# 重新生成: python pipeline/trading_calendar.py --build-holidays
+CALENDAR_HOLIDAYS_PATH = BASE_DIR / 'pipeline' / 'exchange_holidays.csv'
+CALENDAR_HOLIDAYS_START = '2020-01-01'
+CALENDAR_HOLIDAYS_END = '2027-12-31'
+# 交易所对应的exchange_calendars日历代码
+EXCHANGE_CALENDAR_CODES = {
+    'US': 'XNYS',
+    'Taiwan': 'XTAI',
+    'Korea': 'XKRX',
+    'London': 'XLON',
+    'Xetra': 'XETR',
+    'Frankfurt': 'XFRA',
+    'ASX': 'XASX',
+}
+# exchange_calendars未收录的临时休市（如台风停市），生成休市日表时一并写入
+CALENDAR_EXTRA_HOLIDAYS = {
+    'Taiwan': ['2024-10-31'],
+}
+# 没有休市日表（或超出覆盖区间）时按行情推断：某个工作日该交易所在交易期内的ticker中至少这一比例有收盘价，视为开市；
+# 只有一个ticker的交易所不做推断，按工作日计
+CALENDAR_SESSION_COVERAGE = 0.5
+
+# 数据质量检查：连续缺失告警天数、价格停滞天数、跳变阈值（日收益率、稳健z值）
+# VALIDATE_ILLIQUID_EXCHANGES中的标的（如未上市公司估值）不做停滞、零成交量和跳变检查
+VALIDATE_GAP_WARN_DAYS = 2
+VALIDATE_STALE_DAYS = 5
+VALIDATE_SPIKE_RETURN = 0.3
+VALIDATE_SPIKE_ZSCORE = 10
+# 稳健z值所用MAD（日收益率）的下限：平稳或流动性差的序列MAD接近0，不设下限时任何小幅变动的z值都会无穷大
+VALIDATE_SPIKE_MIN_MAD = 0.005
+VALIDATE_ILLIQUID_EXCHANGES = ['Private']
+
+# 持仓交易所由ticker后缀确定，无后缀的为美国上市
+TICKER_SUFFIX_TO_EXCHANGE = {
+    'TW': 'Taiwan',
+    'KS': 'Korea',
+    'L': 'London',
+    'DE': 'Xetra',
+    'F': 'Frankfurt',
+    'AX': 'ASX',
+    'PVT': 'Private',
+}
 
 # 其他配置
 CACHE_DIR = BASE_DIR / 'cache' 
+# 运行日志（每次运行一行JSON），以及运行中打印未结束阶段的间隔（秒，0为不打印）
+RUN_LOG_PATH = CACHE_DIR / 'run_log.jsonl'
+INSTRUMENT_HEARTBEAT_SECONDS = 30
+# 运行中采样常驻内存的间隔（秒），各区间记录自己存续期间采样到的峰值
+INSTRUMENT_RSS_SAMPLE_SECONDS = 0.05
+# 基准测试结果日志（每次运行一行JSON）
+BENCHMARK_LOG_PATH = CACHE_DIR / 'benchmark_log.jsonl'
+# 公司信息缓存文件，以及各字段的缓存有效期（天）
+HOLDINGS_INFO_CACHE = CACHE_DIR / 'holdings_info_cache.json'
+INFO_FIELD_TTL_DAYS = {
+    'longName': 90,
+    'website': 90,
+    'country': 180,
+    'averageAnalystRating': 7,
+}
+INFO_MAX_WORKERS = 8
+
+# 持仓文件下载：地址、超时（秒）、回补时的并发数
+HOLDINGS_BASE_URL = 'https://kraneshares.com/csv/'
+HOLDINGS_TIMEOUT = 10
+HOLDINGS_MAX_WORKERS = 8
+# 已确认无持仓文件（非交易日/未发布）的日期记录
+HOLDINGS_MISSING_CACHE = CACHE_DIR / 'holdings_missing_dates.json'
 
 
 # 股票代码对应的Industry
@@ -1,41 +1,133 @@
 import os
+import math
+import numpy as np
 import pandas as pd
-import yfinance as yf
 from datetime import datetime, timedelta
 from pathlib import Path
 import sys
 sys.path.append(str(Path(__file__).parent))
-from config import RAW_DATA_DIR, HOLDINGS_DIR, ALL_BENCHMARKS, YF_PERIOD, YF_INTERVAL, YF_START_DATE, YF_END_DATE, COMPANY_TO_TICKER_ADD
+from config import RAW_DATA_DIR, HOLDINGS_DIR, ALL_BENCHMARKS, YF_INTERVAL, YF_START_DATE, YF_END_DATE, YF_OVERLAP_DAYS, YF_ADJUST_TOLERANCE
+from config import HOLDINGS_INFO_CACHE, INFO_FIELD_TTL_DAYS, INFO_MAX_WORKERS
+from config import HOLDINGS_BASE_URL, HOLDINGS_TIMEOUT, HOLDINGS_MAX_WORKERS, HOLDINGS_MISSING_CACHE
+from config import YF_BATCH_SIZE, YF_MAX_WORKERS, YF_MAX_RETRIES, YF_RATE_LIMIT, YF_RATE_BURST, YF_BACKOFF_BASE, YF_BACKOFF_MAX
+from config import MARKET_DATA_PROVIDER, MARKET_DATA_RECORD_DIR, MARKET_DATA_SANDBOX_DIR
+from rate_limiter import TokenBucket, backoff_delay
+from market_data_provider import create_provider
+from market_store import load_market_data, save_market_data
+from holdings_store import update_holdings_history, normalize_holdings_file, HOLDINGS_HISTORY_PATH, NORMALIZED_HOLDINGS_PATH
+from instrumentation import span, current_span, add_counter, record_frame, instrumented_run
 import requests
+from requests.adapters import HTTPAdapter
+import argparse
+import threading
 import time
+import heapq
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+import json
 
 RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
 HOLDINGS_DIR.mkdir(parents=True, exist_ok=True)
 
-# 尝试从kraneshares官网按指定文件名下载持仓csv文件，下载成功返回True，否则返回False
-def try_download(csv_name, save_path):
-    url = f'https://kraneshares.com/csv/{csv_name}'
+# 持仓文件名：MM_DD_YYYY_agix_holdings.csv
+def holdings_csv_name(date):
+    return date.strftime('%m_%d_%Y') + '_agix_holdings.csv'
+
+# 创建带连接池（keep-alive）的HTTP会话，pool_size为最大并发连接数
+def make_http_session(pool_size=HOLDINGS_MAX_WORKERS):
+    session = requests.Session()
+    session.headers.update({'User-Agent': 'Mozilla/5.0'})
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+# 从kraneshares官网下载持仓csv，返回'ok'（下载成功）、'missing'（该日期无文件）或'error'（网络等错误）
+def _fetch_holdings_csv(csv_name, save_path, session=None):
+    url = f'{HOLDINGS_BASE_URL}{csv_name}'
     print(f'[INFO] 尝试下载URL: {url}')
     try:
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(url, timeout=10, headers=headers)
+        response = (session or requests).get(url, timeout=HOLDINGS_TIMEOUT, headers={'User-Agent': 'Mozilla/5.0'})
+        if response.status_code == 404:
+            print(f'[WARN] 该日期无持仓文件: {url}')
+            return 'missing'
         response.raise_for_status()
+        add_counter('network_bytes', len(response.content))
+        # 不存在的日期可能返回网页而不是csv
+        if b'Holdings' not in response.content[:200]:
+            print(f'[WARN] 返回内容不是持仓csv: {url}')
+            return 'missing'
         with open(save_path, 'wb') as f:
             f.write(response.content)
         print(f'[INFO] 下载成功: {save_path}')
-        return True
+        return 'ok'
     except Exception as e:
         print(f'[WARN] 下载失败: {url}, 错误: {e}')
-        return False
+        return 'error'
+
+# 尝试从kraneshares官网按指定文件名下载持仓csv文件，下载成功返回True，否则返回False
+def try_download(csv_name, save_path, session=None):
+    return _fetch_holdings_csv(csv_name, save_path, session) == 'ok'
+
+def load_missing_holdings_dates(cache_path=HOLDINGS_MISSING_CACHE):
+    if not Path(cache_path).exists():
+        return set()
+    with open(cache_path, 'r', encoding='utf-8') as f:
+        return set(json.load(f))
+
+def save_missing_holdings_dates(dates, cache_path=HOLDINGS_MISSING_CACHE):
+    Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump(sorted(dates), f, indent=2)
+
+# 并发回补[start_date, end_date]区间内缺失的持仓文件
+# 跳过周末、本地已有的日期以及之前确认无文件的日期；所有请求共用一个连接池会话，并发数不超过max_workers
+def backfill_agix_holdings(start_date, end_date, max_workers=HOLDINGS_MAX_WORKERS):
+    missing_dates = load_missing_holdings_dates()
+    today = pd.Timestamp(datetime.today().date())
+    to_fetch = []
+    for date in pd.bdate_range(start_date, end_date):
+        key = date.strftime('%Y-%m-%d')
+        if (HOLDINGS_DIR / holdings_csv_name(date)).exists() or key in missing_dates:
+            continue
+        to_fetch.append(date)
+    print(f'[INFO] 持仓回补: 需要下载 {len(to_fetch)} 天')
+    results = {'ok': [], 'missing': [], 'error': []}
+    lock = threading.Lock()
+    session = make_http_session(max_workers)
+    def fetch(date):
+        csv_name = holdings_csv_name(date)
+        status = _fetch_holdings_csv(csv_name, HOLDINGS_DIR / csv_name, session)
+        with lock:
+            results[status].append(date)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(fetch, to_fetch))
+    finally:
+        session.close()
+    # 今天的文件可能尚未发布，不记为缺失
+    new_missing = {d.strftime('%Y-%m-%d') for d in results['missing'] if d < today}
+    if new_missing:
+        save_missing_holdings_dates(missing_dates | new_missing)
+    print(f"[INFO] 持仓回补完成: 成功 {len(results['ok'])}，无文件 {len(results['missing'])}，失败 {len(results['error'])}")
+    if results['ok']:
+        update_holdings_history()
+    return results
+
+# 目录中最新的持仓文件，没有时返回None
+def latest_local_holdings(holdings_dir=HOLDINGS_DIR):
+    all_csvs = sorted(Path(holdings_dir).glob('*_agix_holdings.csv'), reverse=True)
+    return all_csvs[0] if all_csvs else None
 
 # 下载AGIX持仓文件，优先下载今日，其次昨日，最后本地最新，找不到则返回None
-def download_agix_holdings():
+def download_agix_holdings(holdings_dir=HOLDINGS_DIR):
+    holdings_dir = Path(holdings_dir)
+    holdings_dir.mkdir(parents=True, exist_ok=True)
     today = datetime.today()
     yesterday = today - timedelta(days=1)
-    today_csv = today.strftime('%m_%d_%Y') + '_agix_holdings.csv'
-    yesterday_csv = yesterday.strftime('%m_%d_%Y') + '_agix_holdings.csv'
-    today_path = HOLDINGS_DIR / today_csv
-    yesterday_path = HOLDINGS_DIR / yesterday_csv
+    today_csv = holdings_csv_name(today)
+    yesterday_csv = holdings_csv_name(yesterday)
+    today_path = holdings_dir / today_csv
+    yesterday_path = holdings_dir / yesterday_csv
 
     # 1. 优先下载今日
     if not today_path.exists():
@@ -54,38 +146,17 @@ def download_agix_holdings():
         return yesterday_path
 
     # 3. 用本地最新
-    all_csvs = sorted(HOLDINGS_DIR.glob('*_agix_holdings.csv'), reverse=True)
-    if all_csvs:
-        print(f'[INFO] 使用本地最新持仓: {all_csvs[0]}')
-        return all_csvs[0]
+    latest = latest_local_holdings(holdings_dir)
+    if latest is not None:
+        print(f'[INFO] 使用本地最新持仓: {latest}')
+        return latest
     print('[FATAL] 无法下载或找到任何AGIX持仓文件，请检查网络或手动上传。')
     return None
 
 
-# 读取持仓csv文件，提取有效的股票ticker列表
-# 新增：根据公司名替换ticker，并覆盖保存到原文件
-def replace_tickers_in_holdings_file(holdings_csv):
-    df = pd.read_csv(holdings_csv, skiprows=1)
-    for company, ticker in COMPANY_TO_TICKER_ADD.items():
-        df.loc[df['Company Name'] == company, 'Ticker'] = ticker
-    # 重新保存，保留原有的表头格式
-    with open(holdings_csv, 'r', encoding='utf-8') as f:
-        header = f.readline()
-    df.to_csv(holdings_csv, index=False, mode='w', encoding='utf-8')
-    # 保留原始的第一行表头
-    with open(holdings_csv, 'r+', encoding='utf-8') as f:
-        content = f.read()
-        f.seek(0, 0)
-        f.write(header + content)
-
-# 读取持仓csv文件，提取有效的股票ticker列表
-def get_holdings_tickers(holdings_csv):
-    print(f'[INFO] 读取持仓csv: {holdings_csv}')
-    df = pd.read_csv(holdings_csv, skiprows=1)
-    # 只修改需要替换的Ticker
-    #for company, ticker in COMPANY_TO_TICKER_ADD.items():
-        #df.loc[df['Company Name'] == company, 'Ticker'] = ticker
-    tickers = df["Ticker"].dropna().astype(str).unique().tolist()
+# 从规范化后的持仓中提取有效的股票ticker列表
+def get_holdings_tickers(holdings):
+    tickers = holdings["Ticker"].dropna().astype(str).unique().tolist()
 
     #import re
     #total_count = len(tickers)
@@ -99,156 +170,447 @@ def get_holdings_tickers(holdings_csv):
 
     return tickers
 
-# 批量下载指定ticker的行情数据（收盘价和成交量），并保存为csv文件
-# 默认从YF_START_DATE开始，按50只股票一批下载，支持多线程
-def download_market_data(tickers, start_date=YF_START_DATE, end_date=YF_END_DATE):
-    batch_size = 100
-    max_retries = 5
-    remaining_tickers = tickers.copy()
+# 所有对yfinance的请求（行情下载、公司信息）共用的限流器，两个阶段并行执行时整体请求速率仍不超过YF_RATE_LIMIT
+YF_LIMITER = TokenBucket(YF_RATE_LIMIT, YF_RATE_BURST)
+
+# 当前使用的行情数据源，默认按config创建，可通过set_provider替换（如离线回放、合成数据）
+_provider = None
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        _provider = create_provider(MARKET_DATA_PROVIDER, record_dir=MARKET_DATA_RECORD_DIR)
+    return _provider
+
+def set_provider(provider):
+    global _provider
+    _provider = provider
+
+# 输出位置由数据源决定：yfinance写入正式数据目录；录制/回放/合成数据源写入沙盒，
+# 不改动正式的行情矩阵、持仓ticker、公司信息及其缓存
+def is_sandboxed(provider=None):
+    return (provider or get_provider()).name != 'yfinance'
+
+def output_dir():
+    data_dir = MARKET_DATA_SANDBOX_DIR / 'source_data' if is_sandboxed() else RAW_DATA_DIR
+    data_dir.mkdir(parents=True, exist_ok=True)
+    return data_dir
+
+def info_cache_path():
+    return MARKET_DATA_SANDBOX_DIR / 'holdings_info_cache.json' if is_sandboxed() else HOLDINGS_INFO_CACHE
+
+# 持仓文件来源：record/replay使用录制目录下的holdings，其余使用正式的持仓目录
+def provider_holdings_dir(provider=None):
+    provider = provider or get_provider()
+    if provider.name in ('record', 'replay'):
+        return provider.record_dir / 'holdings'
+    return HOLDINGS_DIR
+
+# 获取最新持仓文件：yfinance从kraneshares下载；record下载到录制目录供之后回放；
+# replay和synthetic不访问网络，分别使用录制目录和正式持仓目录中最新的文件
+def fetch_provider_holdings():
+    provider = get_provider()
+    holdings_dir = provider_holdings_dir(provider)
+    if provider.name in ('yfinance', 'record'):
+        return download_agix_holdings(holdings_dir)
+    latest = latest_local_holdings(holdings_dir)
+    if latest is None:
+        print(f'[FATAL] {holdings_dir} 中没有持仓文件')
+    else:
+        print(f'[INFO] {provider.name}数据源使用本地持仓: {latest}')
+    return latest
+
+# 下载一个batch的日线行情，返回 {ticker: 行情DataFrame}
+# per_ticker=False时整批一次请求（取一个令牌）；per_ticker=True（重试）时逐个ticker请求，每次请求前各取一个令牌
+def _download_histories(batch, start_date, end_date, limiter, per_ticker=False):
+    provider = get_provider()
+    if not per_ticker:
+        limiter.acquire()
+        try:
+            return provider.history_batch(batch, start_date, end_date, interval=YF_INTERVAL)
+        except Exception as e:
+            print(f'[WARN] batch整批下载异常: {e}')
+            return {}
+    histories = {}
+    for t in batch:
+        limiter.acquire()
+        try:
+            histories[t] = provider.history(t, start_date, end_date, interval=YF_INTERVAL)
+        except Exception as e:
+            print(f'[WARN] {t} 下载异常: {e}')
+    return histories
+
+# 下载一个batch，返回(收盘价DataFrame, 交易量DataFrame, 失败ticker列表)，最新交易日无收盘价的ticker视为失败
+# parent: 所属的监控区间（线程池中的线程没有自己的区间）
+def _download_one_batch(batch, start_date, end_date, limiter, parent=None, batch_no=None, per_ticker=False):
+    with span('batch', 'market_data', parent, batch_no=batch_no, tickers=len(batch), per_ticker=per_ticker) as s:
+        closes_df, volumes_df, failed = _download_batch_frames(batch, start_date, end_date, limiter, per_ticker)
+        s.add('failed', len(failed))
+        if closes_df is not None:
+            s.record_frame(closes_df)
+        return closes_df, volumes_df, failed
+
+def _download_batch_frames(batch, start_date, end_date, limiter, per_ticker=False):
+    histories = _download_histories(batch, start_date, end_date, limiter, per_ticker)
+    closes_map, volumes_map, failed = {}, {}, []
+    for t in batch:
+        hist = histories.get(t)
+        if hist is None or hist.empty:
+            failed.append(t)
+            continue
+        closes_map[t] = hist['Close']
+        volumes_map[t] = hist['Volume']
+    if not closes_map:
+        return None, None, failed
+    closes_df = pd.DataFrame(closes_map)
+    volumes_df = pd.DataFrame(volumes_map)
+    # 检查每个ticker在最新交易日是否有收盘价，否则加入失败列表
+    latest_date = closes_df.index.max()
+    failed.extend([t for t in closes_df.columns if pd.isna(closes_df.loc[latest_date, t])])
+    return closes_df, volumes_df, failed
+
+# 并发下载指定ticker的行情数据，返回(收盘价列表, 交易量列表)
+# 首次下载的ticker按线程数均分成batch（每个batch不超过batch_size），每个batch一次多ticker请求，在线程池中并发执行，
+# 共享一个令牌桶限流器；失败的ticker单独按指数退避+抖动重新排期，到期后逐个ticker请求，不再整轮重试
+def _download_batches(tickers, start_date, end_date, batch_size=YF_BATCH_SIZE, max_workers=YF_MAX_WORKERS, max_retries=YF_MAX_RETRIES, limiter=None):
+    limiter = limiter or YF_LIMITER
+    # 待下载队列：(可执行时间, ticker, 已尝试次数)
+    pending = [(0.0, t, 0) for t in tickers]
+    heapq.heapify(pending)
+    in_flight = {}
     closes_list, volumes_list = [], []
-    retry_count = 0
-    while remaining_tickers and retry_count < max_retries:
-        time.sleep(1)
-        failed_tickers = []
-        print(f'\n[RETRY] 第{retry_count+1}轮尝试，待下载ticker数量: {len(remaining_tickers)}')
-        for i in range(0, len(remaining_tickers), batch_size):
-            batch = remaining_tickers[i:i+batch_size]
-            print(f'[INFO] 下载行情 batch {i//batch_size+1} (重试{retry_count+1}): {batch}')
-            try:
-                data = yf.download(batch, start=start_date, end=end_date, period=YF_PERIOD, interval=YF_INTERVAL, group_by='ticker', auto_adjust=True, threads=True)
-                if data is None or (hasattr(data, 'empty') and data.empty):
-                    print(f'[WARN] batch {i//batch_size+1} 无数据: {batch}')
-                    failed_tickers.extend(batch)
+    # 失败ticker最近一次下载到的数据，重试耗尽时作为兜底保存
+    fallback_closes, fallback_volumes = {}, {}
+    gave_up = []
+    batch_no = 0
+    # 各batch的监控区间挂在调用方的区间下
+    span_parent = current_span()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or in_flight:
+            now = time.monotonic()
+            ready = []
+            while pending and pending[0][0] <= now:
+                ready.append(heapq.heappop(pending))
+            # 首次下载整批请求，重试逐个ticker请求；都按线程数均分，保证所有线程都有任务
+            for per_ticker in (False, True):
+                group = [item for item in ready if (item[2] > 0) == per_ticker]
+                if not group:
                     continue
-                # 检查每个ticker在最新交易日是否有收盘价，否则加入失败列表
-                latest_date = None
-                if hasattr(data, 'empty') and (not data.empty):
-                    latest_date = data.index.max()
-                batch_failed = []
-                for t in batch:
-                    try:
-                        if isinstance(data.columns, pd.MultiIndex):
-                            close_val = data[(t, 'Close')].loc[latest_date] if latest_date is not None and (t, 'Close') in data.columns else None
-                        else:
-                            close_val = data['Close'].loc[latest_date] if latest_date is not None and 'Close' in data.columns else None
-                        if isinstance(close_val, pd.Series):
-                            # 如果是Series，检查是否全是NaN
-                            if close_val.isna().all():
-                                batch_failed.append(t)
-                        elif pd.isna(close_val):
-                            batch_failed.append(t)
-                    except Exception:
-                        batch_failed.append(t)
-                if batch_failed:
-                    print(f'[WARN] batch {i//batch_size+1} 最新交易日无收盘价ticker: {batch_failed}')
-                    failed_tickers.extend(batch_failed)
-                else:
-                    print(f'[INFO] batch {i//batch_size+1} 全部ticker最新交易日有收盘价')
-                if isinstance(data.columns, pd.MultiIndex):
-                    closes = data.loc[:, (slice(None), 'Close')]
-                    closes.columns = closes.columns.droplevel(1)
-                    volumes = data.loc[:, (slice(None), 'Volume')]
-                    volumes.columns = volumes.columns.droplevel(1)
+                chunk_size = min(batch_size, max(1, math.ceil(len(group) / max_workers)))
+                for i in range(0, len(group), chunk_size):
+                    chunk = group[i:i+chunk_size]
+                    batch = [t for _, t, _ in chunk]
+                    batch_no += 1
+                    print(f'[INFO] 提交行情下载 batch {batch_no}: {len(batch)} 个ticker' + ('（逐个重试）' if per_ticker else ''))
+                    future = pool.submit(_download_one_batch, batch, start_date, end_date, limiter, span_parent, batch_no, per_ticker)
+                    in_flight[future] = (batch_no, {t: attempt for _, t, attempt in chunk})
+            if not in_flight:
+                time.sleep(max(0.0, pending[0][0] - time.monotonic()))
+                continue
+            timeout = max(0.0, pending[0][0] - time.monotonic()) if pending else None
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                no, attempts = in_flight.pop(future)
+                try:
+                    closes, volumes, failed = future.result()
+                except Exception as e:
+                    print(f'[ERROR] batch {no} 下载异常: {e}')
+                    closes, volumes, failed = None, None, list(attempts)
+                if closes is not None:
+                    ok = [t for t in closes.columns if t not in failed]
+                    if ok:
+                        closes_list.append(closes[ok])
+                        volumes_list.append(volumes[ok])
+                    for t in failed:
+                        if t in closes.columns:
+                            fallback_closes[t] = closes[[t]]
+                            fallback_volumes[t] = volumes[[t]]
+                if failed:
+                    print(f'[WARN] batch {no} 失败ticker: {failed}')
                 else:
-                    closes = data[['Close']]
-                    volumes = data[['Volume']]
-                closes_list.append(closes)
-                volumes_list.append(volumes)
-            except Exception as e:
-                print(f'[ERROR] batch {i//batch_size+1} 下载异常: {e}')
-                failed_tickers.extend(batch)
-        if failed_tickers:
-            print(f'[RETRY] 第{retry_count+1}轮失败ticker: {failed_tickers}')
+                    print(f'[INFO] batch {no} 全部ticker最新交易日有收盘价')
+                for t in failed:
+                    attempt = attempts[t] + 1
+                    if attempt >= max_retries:
+                        gave_up.append(t)
+                        continue
+                    delay = backoff_delay(attempt, YF_BACKOFF_BASE, YF_BACKOFF_MAX)
+                    print(f'[RETRY] {t} 第{attempt}次重试，{delay:.1f}秒后执行')
+                    heapq.heappush(pending, (time.monotonic() + delay, t, attempt))
+    if gave_up:
+        print(f'[ERROR] 达到最大重试次数，以下ticker仍未成功下载: {gave_up}')
+        for t in gave_up:
+            if t in fallback_closes:
+                closes_list.append(fallback_closes[t])
+                volumes_list.append(fallback_volumes[t])
+    return closes_list, volumes_list
+
+# 读取本地已存储的行情矩阵（全精度，用于合并后重新写入），不存在时返回None
+def load_stored_market_data(name):
+    return load_market_data(name, data_dir=output_dir(), compact=False)
+
+# 根据已存储的收盘价，计算每个ticker需要从哪一天开始下载
+# 已有数据的ticker从最后有效日期往前回补YF_OVERLAP_DAYS天；新ticker从start_date全量回补
+def plan_incremental_download(tickers, stored_closes, start_date=YF_START_DATE, overlap_days=YF_OVERLAP_DAYS):
+    plan = {}
+    for t in tickers:
+        last_date = None
+        if stored_closes is not None and t in stored_closes.columns:
+            last_date = stored_closes[t].last_valid_index()
+        if last_date is None:
+            plan[t] = start_date
         else:
-            print(f'[RETRY] 第{retry_count+1}轮全部ticker下载成功！')
-        remaining_tickers = list(set(failed_tickers))
-        retry_count += 1
-        if remaining_tickers:
-            print(f'[RETRY] 轮次{retry_count}后，仍需重试ticker: {remaining_tickers}')
-    if remaining_tickers:
-        print(f'[ERROR] 达到最大重试次数，以下ticker仍未成功下载: {remaining_tickers}')
+            fetch_start = max(pd.Timestamp(start_date), last_date - timedelta(days=overlap_days))
+            plan[t] = fetch_start.strftime('%Y-%m-%d')
+    return plan
+
+# 将起始日期相近（相差不超过tolerance_days）的ticker合并为一组，组内统一从最早日期下载，减少请求次数
+def group_download_plan(plan, tolerance_days=YF_OVERLAP_DAYS):
+    groups = {}
+    group_start = None
+    for t, fetch_start in sorted(plan.items(), key=lambda x: x[1]):
+        if group_start is None or pd.Timestamp(fetch_start) - pd.Timestamp(group_start) > timedelta(days=tolerance_days):
+            group_start = fetch_start
+        groups.setdefault(group_start, []).append(t)
+    return groups
+
+# 将新下载的数据合并进已存储矩阵：新数据覆盖重叠区间，其余保留历史
+def merge_market_data(stored, fresh):
+    if stored is None or stored.empty:
+        return fresh
+    if fresh is None or fresh.empty:
+        return stored
+    merged = fresh.combine_first(stored)
+    # 列顺序：保持原有列在前，新ticker追加在后
+    columns = list(stored.columns) + [c for c in fresh.columns if c not in stored.columns]
+    return merged.sort_index()[columns]
+
+# 复权检查：yfinance返回复权价，拆股或分红后该ticker此前的全部收盘价都会按新的复权因子重算，
+# 只覆盖重叠区间会在更早的历史处留下虚假跳变；返回重叠区间内新旧收盘价偏差超过tolerance的ticker
+def readjusted_tickers(stored, fresh, tolerance=YF_ADJUST_TOLERANCE):
+    if stored is None or fresh is None or stored.empty or fresh.empty:
+        return []
+    cols = fresh.columns.intersection(stored.columns)
+    rows = fresh.index.intersection(stored.index)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        deviation = (fresh.loc[rows, cols] / stored.loc[rows, cols] - 1).abs().max()
+    return list(deviation.index[deviation > tolerance])
+
+# 按ticker列表下载并拼接成(收盘价, 交易量)矩阵，没有数据时为(None, None)
+def _download_frames(tickers, start_date, end_date):
+    closes_list, volumes_list = _download_batches(tickers, start_date, end_date)
+    if not closes_list:
+        return None, None
+    closes = pd.concat(closes_list, axis=1)
+    volumes = pd.concat(volumes_list, axis=1)
+    return closes.loc[:, ~closes.columns.duplicated()], volumes.loc[:, ~volumes.columns.duplicated()]
+
+# 批量下载指定ticker的行情数据（收盘价和成交量），并保存为csv文件
+# incremental=True时只下载每个ticker缺失的尾部数据（加少量重叠）并合并进已存储的矩阵，
+# 新加入的ticker仍从start_date开始全量回补；重叠区间复权价发生变化的ticker从start_date全量重新下载并整列替换；
+# incremental=False时从start_date全量下载并覆盖
+def download_market_data(tickers, start_date=YF_START_DATE, end_date=YF_END_DATE, incremental=True):
+    stored_closes = load_stored_market_data('market_data_closes') if incremental else None
+    stored_volumes = load_stored_market_data('market_data_volumes') if incremental else None
+    if stored_closes is None or stored_volumes is None:
+        stored_closes, stored_volumes = None, None
+    plan = plan_incremental_download(tickers, stored_closes, start_date=start_date)
+    groups = group_download_plan(plan)
+    closes_list, volumes_list = [], []
+    for fetch_start, group in groups.items():
+        print(f'[INFO] 从 {fetch_start} 开始下载 {len(group)} 个ticker')
+        group_closes, group_volumes = _download_batches(group, fetch_start, end_date)
+        closes_list.extend(group_closes)
+        volumes_list.extend(group_volumes)
     if closes_list:
         closes_all = pd.concat(closes_list, axis=1)
         closes_all = closes_all.loc[:,~closes_all.columns.duplicated()]
-        closes_all.to_csv(RAW_DATA_DIR / 'market_data_closes.csv')
-        print(f'[INFO] 收盘价已保存: {RAW_DATA_DIR / "market_data_closes.csv"}')
+        volumes_all = pd.concat(volumes_list, axis=1)
+        volumes_all = volumes_all.loc[:,~volumes_all.columns.duplicated()]
+        readjusted = readjusted_tickers(stored_closes, closes_all)
+        if readjusted:
+            print(f'[WARN] 以下ticker的历史复权价已变化，从 {start_date} 全量重新下载: {readjusted}')
+            full_closes, full_volumes = _download_frames(readjusted, start_date, end_date)
+            if full_closes is not None:
+                # 重新下载成功的ticker整列替换：已存储的旧复权价置空，不再参与合并
+                replaced = list(full_closes.columns)
+                stored_closes = stored_closes.copy()
+                stored_volumes = stored_volumes.copy()
+                stored_closes[replaced] = np.nan
+                stored_volumes[stored_volumes.columns.intersection(replaced)] = np.nan
+                closes_all = pd.concat([closes_all.drop(columns=replaced), full_closes], axis=1)
+                volumes_all = pd.concat([volumes_all.drop(columns=volumes_all.columns.intersection(replaced)), full_volumes], axis=1)
+        closes_all = merge_market_data(stored_closes, closes_all)
+        closes_path = save_market_data(closes_all, 'market_data_closes', data_dir=output_dir())
+        print(f'[INFO] 收盘价已保存: {closes_path}')
         # 检查每个ticker在最新交易日是否有收盘价数据
         latest_date = closes_all.index.max()
-        missing_tickers = [col for col in closes_all.columns if pd.isna(closes_all.loc[latest_date, col])]
+        missing_tickers = [col for col in tickers if col in closes_all.columns and pd.isna(closes_all.loc[latest_date, col])]
         if missing_tickers:
             print(f'[WARN] 以下ticker在最新交易日({latest_date})无收盘价数据: {missing_tickers}')
     else:
         print('[ERROR] 没有收盘价数据可保存')
     if volumes_list:
-        volumes_all = pd.concat(volumes_list, axis=1)
-        volumes_all = volumes_all.loc[:,~volumes_all.columns.duplicated()]
-        volumes_all.to_csv(RAW_DATA_DIR / 'market_data_volumes.csv')
-        print(f'[INFO] 交易量已保存: {RAW_DATA_DIR / "market_data_volumes.csv"}')
+        volumes_all = merge_market_data(stored_volumes, volumes_all)
+        volumes_path = save_market_data(volumes_all, 'market_data_volumes', data_dir=output_dir())
+        print(f'[INFO] 交易量已保存: {volumes_path}')
     else:
         print('[ERROR] 没有交易量数据可保存')
 
 
-def fetch_holdings_info():
-    import pandas as pd
-    import yfinance as yf
-    from pathlib import Path
+# 公司信息字段与输出csv列名的对应关系
+INFO_FIELDS = {
+    'longName': 'Company Name',
+    'website': 'Website',
+    'country': 'Country',
+    'averageAnalystRating': 'AverageAnalystRating',
+}
+
+# 读取公司信息缓存：{ticker: {field: {'value': ..., 'fetched_at': ISO时间}}}
+def load_info_cache(cache_path=None):
+    cache_path = cache_path or info_cache_path()
+    if not Path(cache_path).exists():
+        return {}
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f'[WARN] 公司信息缓存读取失败，将重新获取: {e}')
+        return {}
+
+def save_info_cache(cache, cache_path=None):
+    cache_path = cache_path or info_cache_path()
+    Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+
+# 某个ticker需要刷新的字段：缺失或超过该字段TTL的字段
+def expired_info_fields(entry, now=None, ttl_days=INFO_FIELD_TTL_DAYS):
+    now = now or datetime.now()
+    expired = []
+    for field in INFO_FIELDS:
+        cached = (entry or {}).get(field)
+        if not cached or not cached.get('fetched_at'):
+            expired.append(field)
+            continue
+        ttl = timedelta(days=ttl_days.get(field, 0))
+        if now - datetime.fromisoformat(cached['fetched_at']) > ttl:
+            expired.append(field)
+    return expired
+
+# 判断某个ticker的缓存是否需要刷新：任一字段缺失或超过该字段的TTL即需要刷新
+def info_cache_expired(entry, now=None, ttl_days=INFO_FIELD_TTL_DAYS):
+    return bool(expired_info_fields(entry, now, ttl_days))
+
+# 获取单个ticker的公司信息（请求前先从共享限流器取令牌）
+def _fetch_ticker_info(ticker, limiter):
+    limiter.acquire()
+    return get_provider().info(ticker) or {}
+
+# 获取持仓公司信息并保存为holdings_info.csv
+# 只对新ticker或有字段过期的ticker并发请求yfinance，其余直接使用本地缓存
+def fetch_holdings_info(max_workers=INFO_MAX_WORKERS, limiter=None):
     from tqdm import tqdm
-    tickers_path = Path(__file__).parent.parent / 'source_data' / 'holdings_tickers.csv'
-    out_path = Path(__file__).parent.parent / 'source_data'  / 'holdings_info.csv'
+    tickers_path = output_dir() / 'holdings_tickers.csv'
+    out_path = output_dir() / 'holdings_info.csv'
     tickers = pd.read_csv(tickers_path)['Ticker'].astype(str).tolist()
+    cache = load_info_cache()
+    now = datetime.now()
+    expired = {t: expired_info_fields(cache.get(t), now) for t in tickers}
+    to_fetch = [t for t in tickers if expired[t]]
+    print(f'[INFO] 公司信息缓存命中 {len(tickers) - len(to_fetch)} 个，需要请求 {len(to_fetch)} 个')
+    errors = {}
+    if to_fetch:
+        limiter = limiter or YF_LIMITER
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(_fetch_ticker_info, t, limiter): t for t in to_fetch}
+            for future in tqdm(as_completed(futures), total=len(futures), desc='获取公司信息'):
+                t = futures[future]
+                try:
+                    info = future.result()
+                except Exception as e:
+                    # 请求失败时保留旧缓存（如有），不刷新时间戳，下次运行继续重试
+                    errors[t] = str(e)
+                    continue
+                # 只更新过期的字段，未过期字段保留原值和原获取时间，各字段按自己的TTL刷新
+                fetched_at = now.isoformat(timespec='seconds')
+                entry = cache.setdefault(t, {})
+                for field in expired[t]:
+                    entry[field] = {'value': info.get(field, ''), 'fetched_at': fetched_at}
+        save_info_cache(cache)
     info_list = []
-    for t in tqdm(tickers, desc='获取公司信息'):
-        try:
-            yf_t = yf.Ticker(t)
-            info = yf_t.info
-            info_list.append({
-                'Ticker': t,
-                'Company Name': info.get('longName', ''),
-                'Website': info.get('website', ''),
-                'Country': info.get('country', ''),
-                'AverageAnalystRating': info.get('averageAnalystRating', '')
-            })
-        except Exception as e:
-            info_list.append({
-                'Ticker': t,
-                'Company Name': '',
-                'Website': '',
-                'Country': '',
-                'AverageAnalystRating': '',
-                'Error': str(e)
-            })
+    for t in tickers:
+        entry = cache.get(t, {})
+        row = {'Ticker': t}
+        for field, col in INFO_FIELDS.items():
+            row[col] = entry.get(field, {}).get('value', '')
+        if t in errors:
+            row['Error'] = errors[t]
+        info_list.append(row)
     df_info = pd.DataFrame(info_list)
     df_info.to_csv(out_path, index=False)
+    record_frame(df_info)
     print(f'[INFO] 持仓公司信息已保存: {out_path}')
 
 
-def main():
-    print("\n" + "="*40 + " PIPELINE START " + "="*40)
-    # 下载持仓
-    print("\n" + "="*20 + " 下载持仓情况 " + "="*20)
-    holdings_csv = download_agix_holdings()
+# 获取并规范化最新持仓，增量更新持仓历史，保存holdings_tickers.csv（非yfinance数据源写入沙盒目录），返回持仓ticker列表；无持仓文件时返回None
+def update_holdings():
+    holdings_csv = fetch_provider_holdings()
     if holdings_csv is None:
-        print('[FATAL] 持仓数据下载失败，终止')
-        return
+        return None
+    data_dir = output_dir()
 
-    # 新增：下载后直接替换ticker
-    replace_tickers_in_holdings_file(holdings_csv)
+    # 解析并规范化持仓（按公司名替换ticker），原始下载文件保持不变
+    holdings = normalize_holdings_file(holdings_csv, data_dir / NORMALIZED_HOLDINGS_PATH.name)
 
-    holdings_tickers = get_holdings_tickers(holdings_csv)
+    # 将所有每日持仓文件增量写入持仓历史长表，当天文件复用上面的解析结果
+    update_holdings_history(holdings_dir=provider_holdings_dir(), path=data_dir / HOLDINGS_HISTORY_PATH.name, parsed=[holdings])
+
+    holdings_tickers = get_holdings_tickers(holdings)
     # 保存holdings_tickers到csv，供data_processor使用
-    pd.Series(holdings_tickers, name='Ticker').to_csv(RAW_DATA_DIR / 'holdings_tickers.csv', index=False)
+    pd.Series(holdings_tickers, name='Ticker').to_csv(data_dir / 'holdings_tickers.csv', index=False)
+    return holdings_tickers
+
+# 下载AGIX、基准指数和持仓股票的行情
+def update_market_data(holdings_tickers=None):
+    if holdings_tickers is None:
+        holdings_tickers = pd.read_csv(output_dir() / 'holdings_tickers.csv')['Ticker'].astype(str).tolist()
     # 合并AGIX、基准指数和持仓股票ticker，去重
-    all_tickers = ['AGIX'] + ALL_BENCHMARKS + holdings_tickers
+    all_tickers = ['AGIX'] + ALL_BENCHMARKS + holdings_tickers + list(get_provider().extra_tickers)
     all_tickers = list(dict.fromkeys([t for t in all_tickers if t and t != 'nan']))
+    print(f'[INFO] 总共需要下载行情的ticker数量: {len(all_tickers)}')
+    download_market_data(all_tickers)  # 默认增量下载，新ticker从YF_START_DATE全量回补
+
+
+def main():
+    print("\n" + "="*40 + " PIPELINE START " + "="*40)
+    # 下载持仓
+    print("\n" + "="*20 + " 下载持仓情况 " + "="*20)
+    holdings_tickers = update_holdings()
+    if holdings_tickers is None:
+        print('[FATAL] 持仓数据下载失败，终止')
+        return
     # 下载市场数据
     print("\n" + "="*20 + " 下载市场数据 " + "="*20)
-    print(f'[INFO] 总共需要下载行情的ticker数量: {len(all_tickers)}')
-    download_market_data(all_tickers)  # start_date默认已为YF_START_DATE
+    update_market_data(holdings_tickers)
     # 下载持仓公司信息
     print("\n" + "="*20 + " 下载持仓股票公司信息 " + "="*20)
     fetch_holdings_info()
     print("\n" + "="*40 + " PIPELINE END " + "="*40)
 
 if __name__ == '__main__':
-    # 直接运行本文件时，执行主流程
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="AGIX Fund Monitor 数据采集")
+    parser.add_argument("--backfill", nargs=2, metavar=("START", "END"), help="回补指定日期区间（YYYY-MM-DD）的持仓文件")
+    parser.add_argument("--workers", type=int, default=HOLDINGS_MAX_WORKERS, help="回补并发数")
+    parser.add_argument("--provider", choices=["yfinance", "record", "replay", "synthetic"], default=MARKET_DATA_PROVIDER, help="行情数据源")
+    parser.add_argument("--record-dir", default=str(MARKET_DATA_RECORD_DIR), help="record/replay数据源的录制目录")
+    parser.add_argument("--synthetic-tickers", type=int, default=0, help="合成数据源额外生成的ticker数量")
+    parser.add_argument("--synthetic-days", type=int, default=750, help="合成数据源的交易日数量")
+    args = parser.parse_args()
+    set_provider(create_provider(args.provider, record_dir=args.record_dir, n_tickers=args.synthetic_tickers, n_days=args.synthetic_days))
+    if args.backfill:
+        backfill_agix_holdings(args.backfill[0], args.backfill[1], max_workers=args.workers)
+    else:
+        # 直接运行本文件时，执行主流程
+        with instrumented_run('data_fetcher'):
+            main() 
\ No newline at end of file
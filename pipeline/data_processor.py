@@ -5,56 +5,108 @@ from pathlib import Path
 import sys
 sys.path.append(str(Path(__file__).parent))
 from config import RAW_DATA_DIR, PROCESSED_DATA_DIR, HOLDINGS_DIR, ALL_BENCHMARKS, TICKER_TO_INDUSTRY
+from market_store import load_market_data, load_table, save_table
+from risk_engine import RiskEngine, RISK_COLUMNS
+from holdings_store import load_normalized_holdings, parse_holdings_file, holdings_file_date
+from holdings_store import HoldingsHistory, update_holdings_history
+from rolling_risk import save_rolling_risk
+from attribution import AttributionEngine
+from instrumentation import record_frame, instrumented_run
+from trading_calendar import TradingCalendar, ticker_exchange, take_rows
 
 PROCESSED_DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-def calculate_returns(df):
+RETURN_COLUMNS = ['DTD', 'WTD', 'MTD', 'YTD', 'Since Launch']
+
+# 返回index中不晚于date的最后一个位置（即date当天或之前最近的交易日），不存在时返回-1
+def _anchor_position(index, date):
+    return int(index.searchsorted(pd.Timestamp(date), side='right')) - 1
+
+# 计算各ticker的DTD/WTD/MTD/YTD/Since Launch收益率
+# as_of: 计算截至哪一天的收益率，默认使用数据中的最后一天
+# calendar: 交易日历，默认由df推断；每个ticker的当日、前一日及周一/月初/年初锚点都按其所在交易所的交易日定位
+# （锚点为该日期当天或之前最近的本交易所交易日），所有ticker一次性按数组计算
+def calculate_returns(df, as_of=None, calendar=None):
+    calendar = TradingCalendar.from_closes(df) if calendar is None else calendar
+    index = calendar.index
+    end = len(index) if as_of is None else _anchor_position(index, as_of) + 1
+    if end <= 0:
+        raise ValueError(f'as_of日期 {as_of} 早于数据起始日期 {index[0]}')
+    aligned = calendar.align(df).to_numpy(dtype=float)
+    today = index[end - 1]
+    last_rows = calendar.last_session(end - 1)
+    last = take_rows(aligned, last_rows)
     results = pd.DataFrame(index=df.columns)
-    today = df.index[-1]
-    def get_prev_biz_day(date):
-        while date not in df.index:
-            date -= timedelta(days=1)
-        return date
-    results['DTD'] = df.pct_change().iloc[-1]
-    week_start = today - timedelta(days=today.weekday())
-    week_start = get_prev_biz_day(week_start)
-    results['WTD'] = (df.iloc[-1] / df.loc[week_start]) - 1
-    month_start = today.replace(day=1)
-    month_start = get_prev_biz_day(month_start)
-    results['MTD'] = (df.iloc[-1] / df.loc[month_start]) - 1
-    year_start = today.replace(month=1, day=1)
-    year_start = get_prev_biz_day(year_start)
-    results['YTD'] = (df.iloc[-1] / df.loc[year_start]) - 1
-    # --- 修改since launch逻辑 ---
-    agix_first_date = df['AGIX'].first_valid_index() if 'AGIX' in df.columns else df.index[0]
-    since_launch = []
-    for col in df.columns:
-        # 该ticker在AGIX首日有数据
-        if agix_first_date in df.index and not pd.isna(df.loc[agix_first_date, col]):
-            base_date = agix_first_date
-        else:
-            # 用该ticker自己的首日
-            base_date = df[col].first_valid_index()
-        since_launch.append((df[col].iloc[-1] / df.loc[base_date, col]) - 1)
-    results['Since Launch'] = since_launch
-    # --- 结束 ---
+
+    def period_return(anchor_date):
+        return last / take_rows(aligned, calendar.anchor_rows(anchor_date)[0]) - 1
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        results['DTD'] = last / take_rows(aligned, calendar.previous_session(last_rows)) - 1
+        results['WTD'] = period_return(today - timedelta(days=today.weekday()))
+        results['MTD'] = period_return(today.replace(day=1))
+        results['YTD'] = period_return(today.replace(month=1, day=1))
+        # Since Launch：在AGIX首日有数据的ticker以AGIX首日为基准，否则以该ticker自己的首日为基准
+        values = df.to_numpy(dtype=float)[:end]
+        valid = ~np.isnan(values)
+        cols = np.arange(values.shape[1])
+        first_pos = valid.argmax(axis=0)
+        first_vals = np.where(valid.any(axis=0), values[first_pos, cols], np.nan)
+        agix_pos = first_pos[df.columns.get_loc('AGIX')] if 'AGIX' in df.columns else 0
+        base_vals = np.where(valid[agix_pos], values[agix_pos], first_vals)
+        results['Since Launch'] = last / base_vals - 1
     return results
 
-def calculate_risk_metrics(df, risk_free_rate=0.02):
-    returns = df.pct_change().dropna()
-    annualized_return = returns.mean() * 252
-    annualized_volatility = returns.std() * np.sqrt(252)
-    sharpe_ratio = (annualized_return - risk_free_rate) / annualized_volatility
-    cumulative_returns = (1 + returns).cumprod()
-    rolling_max = cumulative_returns.cummax()
-    drawdown = (cumulative_returns - rolling_max) / rolling_max
-    max_drawdown = drawdown.min()
-    return pd.DataFrame({
-        'Annualized Return': annualized_return,
-        'Annualized Volatility': annualized_volatility,
-        'Sharpe Ratio': sharpe_ratio,
-        'Max Drawdown': max_drawdown
+HISTORY_RETURN_COLUMNS = ['DTD', 'WTD', 'MTD', 'YTD']
+RETURNS_HISTORY_PATH = PROCESSED_DATA_DIR / 'returns_history.parquet'
+
+# 一次性计算每个交易日、每个ticker截至当天的DTD/WTD/MTD/YTD收益率
+# 每一行的周/月/年起点按该行日期分组后用searchsorted一次定位，再映射到各ticker所在交易所的最近交易日，
+# 结果与逐日调用calculate_returns(as_of=当天)一致；ticker所在交易所休市的日期为NaN
+# 返回 {收益类型: DataFrame(日期 × ticker)}
+def calculate_returns_history(df, calendar=None):
+    calendar = TradingCalendar.from_closes(df) if calendar is None else calendar
+    index = calendar.index
+    aligned = calendar.align(df).to_numpy(dtype=float)
+    rows = calendar.last_session(np.arange(len(index)))
+    results = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        results['DTD'] = aligned / take_rows(aligned, calendar.previous_session(rows)) - 1
+        anchors = {
+            'WTD': index - pd.to_timedelta(index.weekday, unit='D'),
+            'MTD': index.to_period('M').to_timestamp(),
+            'YTD': index.to_period('Y').to_timestamp(),
+        }
+        for name, anchor_dates in anchors.items():
+            results[name] = aligned / take_rows(aligned, calendar.anchor_rows(anchor_dates)) - 1
+    return {name: pd.DataFrame(arr, index=index, columns=df.columns) for name, arr in results.items()}
+
+# 将收益率历史转换为长表（Date, Ticker, DTD, WTD, MTD, YTD），Ticker为分类类型，收益率使用float32保存
+def returns_history_to_long(history):
+    first = history[HISTORY_RETURN_COLUMNS[0]]
+    long_df = pd.DataFrame({
+        'Date': np.repeat(first.index.values, first.shape[1]),
+        'Ticker': pd.Categorical.from_codes(np.tile(np.arange(first.shape[1]), first.shape[0]),
+                                            categories=first.columns.astype(str)),
     })
+    for name in HISTORY_RETURN_COLUMNS:
+        long_df[name] = history[name].to_numpy(dtype=np.float32).ravel()
+    return long_df.dropna(subset=HISTORY_RETURN_COLUMNS, how='all').reset_index(drop=True)
+
+def save_returns_history(closes, path=RETURNS_HISTORY_PATH, calendar=None):
+    long_df = returns_history_to_long(calculate_returns_history(closes, calendar))
+    return save_table(long_df, path)
+
+# 读取收益率历史，可只取部分ticker，返回长表
+def load_returns_history(tickers=None, path=RETURNS_HISTORY_PATH):
+    history = load_table(path)
+    if history is not None and tickers is not None:
+        history = history[history['Ticker'].isin(tickers)].reset_index(drop=True)
+    return history
+
+# 风险指标：每个ticker按自己的有效交易日计算，start/end限定区间
+def calculate_risk_metrics(df, risk_free_rate=0.02, start=None, end=None):
+    return RiskEngine(df).metrics(start, end, risk_free_rate)
 
 def analyze_volume(volumes):
     volume_changes = volumes.pct_change().mean() * 100
@@ -63,6 +115,64 @@ def analyze_volume(volumes):
         'Avg Daily Change (%)': volume_changes
     })
 
+# 各持仓按每日持仓权重链接得到的DTD/WTD/MTD/YTD/Since Launch贡献，index为ticker，列为<收益类型>_contribution
+# 区间起点与calculate_returns一致；起点早于第一份持仓文件的收益类型没有真实权重，整列为NaN；没有持仓历史时返回None
+def calculate_holdings_contributions(closes, history=None, as_of=None, method='carino'):
+    history = HoldingsHistory.load() if history is None else history
+    if history is None:
+        return None
+    engine = AttributionEngine(closes, history.weights_matrix())
+    index = engine.index
+    end = len(index) - 1 if as_of is None else _anchor_position(index, as_of)
+    today = index[end]
+    launch_pos = int(closes['AGIX'].notna().to_numpy().argmax()) if 'AGIX' in closes.columns else 0
+    starts = {
+        'DTD': end - 1,
+        'WTD': _anchor_position(index, today - timedelta(days=today.weekday())),
+        'MTD': _anchor_position(index, today.replace(day=1)),
+        'YTD': _anchor_position(index, today.replace(month=1, day=1)),
+        'Since Launch': launch_pos,
+    }
+    out = pd.DataFrame(index=engine.tickers)
+    for rtype, pos in starts.items():
+        col = rtype.replace(' ', '') + '_contribution'
+        out[col] = engine.contributions(index[max(pos, 0)], today, method) if pos >= 0 else np.nan
+    return out
+
+# 在持仓收益表上加入各收益类型的贡献列
+# 有持仓历史时使用链接后的贡献，并补入区间内持有过、但已不在最新持仓中的股票（Weight为0），使分组合计完整
+# 没有持仓历史时退回到 最新权重 × 区间收益
+def _add_holdings_contributions(df, contributions):
+    return_types = RETURN_COLUMNS
+    if contributions is None:
+        for rtype in return_types:
+            df[rtype.replace(' ', '') + '_contribution'] = df['Weight'] * df[rtype]
+        return df
+    held = contributions[(contributions.fillna(0) != 0).any(axis=1)]
+    df = df.merge(held, left_on='Ticker', right_index=True, how='outer')
+    df['Weight'] = df['Weight'].fillna(0.0)
+    df['Type'] = df['Type'].fillna('Holding')
+    if 'Industry' in df.columns:
+        df['Industry'] = df['Industry'].fillna(df['Ticker'].map(TICKER_TO_INDUSTRY))
+    # 区间早于持仓覆盖范围的贡献列整列为NaN，保持NaN，不当作0贡献
+    for col in contributions.columns:
+        if contributions[col].notna().any():
+            df[col] = df[col].fillna(0.0)
+    return df
+
+# 由内存中的收盘价和持仓历史计算贡献，持仓历史尚未生成（未运行data_fetcher）时从持仓文件目录在内存中构建
+# （持仓历史由holdings阶段负责写入，这里不保存）；失败时返回None
+def _holdings_contributions(closes, history=None):
+    try:
+        history = HoldingsHistory.load() if history is None else history
+        if history is None:
+            built = update_holdings_history(save=False)
+            history = None if built is None else HoldingsHistory(built)
+        return calculate_holdings_contributions(closes, history)
+    except Exception as e:
+        print(f'[WARN] 持仓归因计算失败，使用最新权重估算贡献: {e}')
+        return None
+
 # 增加类型标记函数
 
 def add_type_column(df, holdings_tickers, comparison_etfs):
@@ -88,100 +198,76 @@ def add_industry_column(df):
 
 # 增加Country标记函数
 
-def add_country_column(df):
+def load_country_map():
     info_path = Path(__file__).parent.parent / 'source_data' / 'holdings_info.csv'
     if not info_path.exists():
         raise FileNotFoundError(f"{info_path} 不存在，请先生成 holdings_info.csv")
     info_df = pd.read_csv(info_path, dtype={'Ticker': str})
-    country_map = dict(zip(info_df['Ticker'], info_df['Country']))
+    return dict(zip(info_df['Ticker'], info_df['Country']))
+
+def add_country_column(df):
+    country_map = load_country_map()
     df_country = pd.DataFrame({'Ticker': df.columns})
     df_country['Country'] = df_country['Ticker'].apply(lambda x: country_map.get(x, None))
     return df_country
 
-# 国家分析函数
+CONTRIBUTION_COLUMNS = [rtype.replace(' ', '') + '_contribution' for rtype in RETURN_COLUMNS]
+# 归因维度：维度列 -> (分组合计列前缀, 输出文件)
+ATTRIBUTION_DIMENSIONS = {
+    'Industry': ('sector', 'holdings_sectorAnalysis.csv'),
+    'Country': ('country', 'holdings_countryAnalysis.csv'),
+    'Exchange': ('exchange', 'holdings_exchangeAnalysis.csv'),
+}
 
-def country_analysis_for_holdings():
-    returns_path = Path(__file__).parent.parent / 'processed_data' / 'returns.csv'
-    df = pd.read_csv(returns_path)
-    if not isinstance(df, pd.DataFrame):
-        df = pd.DataFrame(df, columns=df.columns if hasattr(df, 'columns') else None)
-    # 只保留Type=Holding
-    df = df[df['Type'] == 'Holding'].copy()
-    # 加载Country信息
-    info_path = Path(__file__).parent.parent / 'source_data' / 'holdings_info.csv'
-    info_df = pd.read_csv(info_path, dtype={'Ticker': str})
-    country_map = dict(zip(info_df['Ticker'], info_df['Country']))
-    df['Country'] = df['Ticker'].apply(lambda x: country_map.get(x, None))
-    # 只保留有Country的
-    df = df[df['Country'].notna() & (df['Country'].astype(str).str.strip() != '')]
-    # 需要的return类型
-    return_types = ['DTD', 'WTD', 'MTD', 'YTD', 'Since Launch']
-    # 计算每个return的contribution
-    for rtype in return_types:
-        col = rtype.replace(' ', '') + '_contribution' if ' ' in rtype else rtype + '_contribution'
-        df[col] = df['Weight'] * df[rtype]
-    # 计算每个国家的country_contribution
-    for rtype in return_types:
-        col = rtype.replace(' ', '') + '_contribution' if ' ' in rtype else rtype + '_contribution'
-        country_col = 'country_' + col
-        country_contrib = pd.DataFrame(df.groupby('Country', as_index=False)[col].sum())
-        country_contrib = country_contrib.rename(columns={col: country_col})
-        df = df.merge(country_contrib, on='Country', how='left')
-    # 输出字段
-    output_cols = ['Country', 'Ticker', 'Weight'] + return_types + [
-        'DTD_contribution', 'WTD_contribution', 'MTD_contribution', 'YTD_contribution', 'SinceLaunch_contribution',
-        'country_DTD_contribution', 'country_WTD_contribution', 'country_MTD_contribution', 'country_YTD_contribution', 'country_SinceLaunch_contribution'
-    ]
-    # 兼容列名
-    df = df.rename(columns={'Since Launch_contribution': 'SinceLaunch_contribution', 'country_Since Launch_contribution': 'country_SinceLaunch_contribution'})
-    df_out = df[output_cols]
-    df_out.to_csv(Path(__file__).parent.parent / 'processed_data' / 'holdings_countryAnalysis.csv', index=False)
-    print('国家贡献分析已保存为 holdings_countryAnalysis.csv')
-
-def sector_analysis_for_holdings():
-    import pandas as pd
-    from pathlib import Path
-    returns_path = Path(__file__).parent.parent / 'processed_data' / 'returns.csv'
-    df = pd.read_csv(returns_path)
-    df = pd.DataFrame(df)
-    # 只保留Type=Holding
-    df = df[df['Type'] == 'Holding'].copy()
-    # 只保留有Industry的
-    df = df[df['Industry'].notna() & (df['Industry'].astype(str).str.strip() != '')]
-    # 需要的return类型
-    return_types = ['DTD', 'WTD', 'MTD', 'YTD', 'Since Launch']
-    # 计算每个return的contribution
-    for rtype in return_types:
-        col = rtype.replace(' ', '') + '_contribution' if ' ' in rtype else rtype + '_contribution'
-        df[col] = df['Weight'] * df[rtype]
-    # 计算每个行业的sector_contribution
-    for rtype in return_types:
-        col = rtype.replace(' ', '') + '_contribution' if ' ' in rtype else rtype + '_contribution'
-        sector_col = 'sector_' + col
-        sector_contrib = pd.DataFrame(df.groupby('Industry', as_index=False)[col].sum())
-        sector_contrib = sector_contrib.rename(columns={col: sector_col})
-        df = pd.DataFrame(df).merge(sector_contrib, on='Industry', how='left')
-    # 输出字段
-    output_cols = ['Industry', 'Ticker', 'Weight'] + return_types + [
-        'DTD_contribution', 'WTD_contribution', 'MTD_contribution', 'YTD_contribution', 'SinceLaunch_contribution',
-        'sector_DTD_contribution', 'sector_WTD_contribution', 'sector_MTD_contribution', 'sector_YTD_contribution', 'sector_SinceLaunch_contribution'
-    ]
-    # 兼容列名
-    df = df.rename(columns={'Since Launch_contribution': 'SinceLaunch_contribution', 'sector_Since Launch_contribution': 'sector_SinceLaunch_contribution'})
-    df_out = df[output_cols]
-    df_out.to_csv(Path(__file__).parent.parent / 'processed_data' / 'holdings_sectorAnalysis.csv', index=False)
-    print('行业贡献分析已保存为 holdings_sectorAnalysis.csv')
+# 持仓归因表：Type=Holding的收益率行加上贡献列和各维度标签
+# returns_df为main中已合并类型、权重、行业的收益率表，closes为内存中的收盘价
+# country_map: ticker -> 国家，默认读取holdings_info.csv
+def build_holdings_attribution(returns_df, closes, history=None, country_map=None):
+    df = returns_df[returns_df['Type'] == 'Holding'].copy()
+    df = _add_holdings_contributions(df, _holdings_contributions(closes, history))
+    try:
+        df['Country'] = df['Ticker'].map(load_country_map() if country_map is None else country_map)
+    except FileNotFoundError as e:
+        print(f'[WARN] {e}')
+    df['Exchange'] = df['Ticker'].map(ticker_exchange)
+    return df.reset_index(drop=True)
+
+# 按任意维度归因：各收益类型的个股贡献及所在分组的合计，分组合计由一次groupby/transform得到
+# 维度为空的持仓不参与；输出列为 维度, Ticker, Weight, 各收益率, 各贡献, <prefix>_各贡献
+def dimension_attribution(holdings, dimension, prefix):
+    labels = holdings[dimension]
+    df = holdings[labels.notna() & (labels.astype(str).str.strip() != '')]
+    group_totals = df.groupby(dimension)[CONTRIBUTION_COLUMNS].transform('sum', min_count=1)
+    group_totals.columns = [f'{prefix}_{col}' for col in CONTRIBUTION_COLUMNS]
+    return pd.concat([df[[dimension, 'Ticker', 'Weight'] + RETURN_COLUMNS + CONTRIBUTION_COLUMNS], group_totals], axis=1)
+
+def save_dimension_attributions(holdings, dimensions=ATTRIBUTION_DIMENSIONS):
+    for dimension, (prefix, file_name) in dimensions.items():
+        if dimension not in holdings.columns:
+            print(f'[WARN] 持仓缺少 {dimension} 信息，跳过该维度的贡献分析')
+            continue
+        dimension_attribution(holdings, dimension, prefix).to_csv(PROCESSED_DATA_DIR / file_name, index=False)
+        print(f'{dimension}贡献分析已保存为 {file_name}')
 
 def main():
-    closes = pd.read_csv(RAW_DATA_DIR / 'market_data_closes.csv', index_col=0, parse_dates=True)
-    volumes = pd.read_csv(RAW_DATA_DIR / 'market_data_volumes.csv', index_col=0, parse_dates=True)
-    returns_df = calculate_returns(closes)
+    closes = load_market_data('market_data_closes', data_dir=RAW_DATA_DIR)
+    volumes = load_market_data('market_data_volumes', data_dir=RAW_DATA_DIR)
+    record_frame(closes)
+    # 交易日历只推断一次，收益率和收益率历史共用
+    calendar = TradingCalendar.from_closes(closes)
+    returns_df = calculate_returns(closes, calendar=calendar)
+    history_path = save_returns_history(closes, calendar=calendar)
+    print(f'收益率历史已保存: {history_path}')
     risk_metrics = calculate_risk_metrics(closes)
     volume_analysis = analyze_volume(volumes)
 
     # 读取持仓股票列表
     holdings_tickers = pd.read_csv(RAW_DATA_DIR / 'holdings_tickers.csv')['Ticker'].astype(str).tolist()
 
+    # AGIX及持仓相对各基准的滚动风险指标
+    risk_path, beta_path = save_rolling_risk(closes, ['AGIX'] + holdings_tickers, ALL_BENCHMARKS)
+    print(f'滚动风险指标已保存: {risk_path}, {beta_path}')
+
     # 加类型信息
     type_df = add_type_column(closes, holdings_tickers, ALL_BENCHMARKS)
     # 加Industry信息
@@ -190,25 +276,13 @@ def main():
     type_df = type_df.merge(industry_df, on='Ticker', how='left')
 
     # 计算权重（仅对持仓股票）
-    # 读取最新持仓csv
-    import re
-    import glob
-    import os
-    # 找到最新的持仓csv文件
-    holdings_files = sorted(glob.glob(str(HOLDINGS_DIR / '*_agix_holdings.csv')), reverse=True)
-    if holdings_files:
-        latest_holdings = pd.read_csv(holdings_files[0], skiprows=1)
-        # 兼容Ticker列名
-        if 'Ticker' in latest_holdings.columns and 'Market Value($)' in latest_holdings.columns:
-            latest_holdings = latest_holdings.dropna(subset=['Ticker', 'Market Value($)'])
-            latest_holdings['Ticker'] = latest_holdings['Ticker'].astype(str)
-            #latest_holdings = latest_holdings[latest_holdings['Ticker'].apply(lambda t: bool(re.match(r'^[A-Z]{1,5}$', t)))]
-            latest_holdings['Market Value($)'] = latest_holdings['Market Value($)'].astype(str).str.replace(',', '', regex=True).astype(float)
-            total_value = latest_holdings['Market Value($)'].sum()
-            latest_holdings['Weight'] = latest_holdings['Market Value($)'] / total_value
-            weight_map = dict(zip(latest_holdings['Ticker'], latest_holdings['Weight']))
-        else:
-            weight_map = {}
+    # 优先复用data_fetcher生成的规范化持仓，不存在时解析最新的持仓csv
+    latest_holdings = load_normalized_holdings()
+    if latest_holdings is None:
+        holdings_files = sorted(HOLDINGS_DIR.glob('*_agix_holdings.csv'), key=holdings_file_date, reverse=True)
+        latest_holdings = parse_holdings_file(holdings_files[0]) if holdings_files else None
+    if latest_holdings is not None:
+        weight_map = dict(zip(latest_holdings['Ticker'], latest_holdings['Weight']))
     else:
         weight_map = {}
     # 生成weight列
@@ -222,9 +296,11 @@ def main():
     returns_df.to_csv(PROCESSED_DATA_DIR / 'returns.csv', index=False)
     risk_metrics.to_csv(PROCESSED_DATA_DIR / 'risk_metrics.csv', index=False)
     volume_analysis.to_csv(PROCESSED_DATA_DIR / 'volume_analysis.csv', index=False)
+
+    # 行业/国家/交易所贡献分析
+    save_dimension_attributions(build_holdings_attribution(returns_df, closes))
     print('所有指标已保存')
 
 if __name__ == '__main__':
-    main()
-    sector_analysis_for_holdings()
-    country_analysis_for_holdings() 
\ No newline at end of file
+    with instrumented_run('data_processor'):
+        main()
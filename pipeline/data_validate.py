@@ -1,86 +1,188 @@
+import numpy as np
 import pandas as pd
 from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent))
+from config import RAW_DATA_DIR, PROCESSED_DATA_DIR
+from config import VALIDATE_GAP_WARN_DAYS, VALIDATE_STALE_DAYS, VALIDATE_SPIKE_RETURN, VALIDATE_SPIKE_ZSCORE, VALIDATE_ILLIQUID_EXCHANGES
+from config import VALIDATE_SPIKE_MIN_MAD
+from market_store import load_market_data
+from risk_engine import daily_returns
+from trading_calendar import TradingCalendar, ticker_exchange
 
-# 读取收盘价数据
-closes_path = Path(__file__).parent.parent / 'source_data' / 'market_data_closes.csv'
-if not closes_path.exists():
-    closes_path = Path(__file__).parent.parent / 'source_data' / 'market_data_closes.csv'
-closes = pd.read_csv(closes_path, index_col=0, parse_dates=True)
-
-problem_tickers = {}
-
-for ticker in closes.columns:
-    series = closes[ticker]
-    # 找到第一个非空的日期（上市首日）
-    first_valid = series.first_valid_index()
-    if first_valid is None:
-        continue  # 全部为空，跳过
-    # 上市首日及之后的所有数据
-    after_list = series.loc[first_valid:]
-    # 检查是否有空值
-    if after_list.isna().any():
-        na_dates = after_list[after_list.isna()].index.strftime('%Y-%m-%d').tolist()
-        problem_tickers[ticker] = na_dates
-
-#if problem_tickers:
-    #print('以下标的在上市后仍有空白数据：')
-    #for ticker, dates in problem_tickers.items():
-        #print(f'{ticker}: {dates}')
-#else:
-    #print('所有标的上市后数据均完整。')
-
-# 检查是否有连续多天空白的标的
-from datetime import datetime, timedelta
-
-print("\n==== 连续多天空白检测 ====")
-found = False
-for ticker, dates in problem_tickers.items():
-    # 转为日期对象并排序
-    date_objs = sorted([datetime.strptime(d, '%Y-%m-%d') for d in dates])
-    if not date_objs:
-        continue
-    streak = 1
-    max_streak = 1
-    streak_start = date_objs[0]
-    max_streak_start = streak_start
-    max_streak_end = streak_start
-    for i in range(1, len(date_objs)):
-        if (date_objs[i] - date_objs[i-1]).days == 1:
-            streak += 1
-            if streak > max_streak:
-                max_streak = streak
-                max_streak_start = date_objs[i-streak+1]
-                max_streak_end = date_objs[i]
-        else:
-            streak = 1
-    if max_streak > 1:
-        found = True
-        print(f"{ticker} 存在连续 {max_streak} 天空白，起始日期：{max_streak_start.strftime('%Y-%m-%d')}，结束日期：{max_streak_end.strftime('%Y-%m-%d')}")
-if not found:
-    print("未发现任何标的有连续多天空白的情况，仅为单天分布。")
-
-def validate_industry_mapping():
-    # 读取returns.csv，假设Type和Industry都在里面
-    df = pd.read_csv(Path(__file__).parent.parent / 'processed_data' / 'returns.csv')
-    problems = []
-    for _, row in df.iterrows():
-        ticker = row['Ticker']
-        ttype = row['Type']
-        industry = row['Industry'] if 'Industry' in row else None
-        industry_str = str(industry).strip().lower()
-        if ttype == 'Holding':
-            if industry_str == '' or industry_str == 'nan':
-                problems.append((ticker, ttype, 'Holding无行业'))
-        elif ttype == 'Comparison ETF':
-            if not (industry_str == '' or industry_str == 'nan'):
-                problems.append((ticker, ttype, 'ETF有行业'))
-    if not problems:
-        print('行业mapping正确')
+DATA_QUALITY_REPORT_PATH = PROCESSED_DATA_DIR / 'data_quality_report.csv'
+ISSUE_COLUMNS = ['Check', 'Severity', 'Ticker', 'Start', 'End', 'Days', 'Value', 'Detail']
+
+
+# 各ticker所在交易所的交易日（由trading_calendar按行情推断），返回 日期 × ticker 的布尔矩阵
+def session_mask(closes):
+    return TradingCalendar.from_closes(closes).session_mask()
+
+
+# 布尔矩阵按列做游程编码，pass_through为True的行不打断游程也不计入长度
+# 返回(起始行, 结束行（包含）, 列, 长度)数组
+def _runs(flags, pass_through=None):
+    flags = np.asarray(flags, dtype=bool)
+    if pass_through is not None:
+        # 穿透行仅在前后相邻的非穿透行都在游程内时才属于游程，保证游程的起止行都是计数行
+        state = pd.DataFrame(np.where(pass_through, np.nan, flags.astype(float)))
+        state = (state.ffill().fillna(0).to_numpy(dtype=bool) & state.bfill().fillna(0).to_numpy(dtype=bool))
+        counted = flags & ~pass_through
+    else:
+        state, counted = flags, flags
+    n, m = state.shape
+    padded = np.zeros((m, n + 2), dtype=np.int8)
+    padded[:, 1:-1] = state.T
+    edges = np.diff(padded, axis=1)
+    start_cols, start_rows = np.nonzero(edges == 1)
+    end_cols, end_rows = np.nonzero(edges == -1)
+    end_rows = end_rows - 1
+    prefix = np.vstack([np.zeros((1, m), dtype=int), np.cumsum(counted, axis=0)])
+    lengths = prefix[end_rows + 1, start_cols] - prefix[start_rows, start_cols]
+    return start_rows, end_rows, start_cols, lengths
+
+
+def _issues(check, severity, closes, rows_start, rows_end, cols, days, value=np.nan, detail=''):
+    index = closes.index
+    return pd.DataFrame({
+        'Check': check,
+        'Severity': severity,
+        'Ticker': closes.columns[cols],
+        'Start': index[rows_start],
+        'End': index[rows_end],
+        'Days': days,
+        'Value': value,
+        'Detail': detail,
+    }, columns=ISSUE_COLUMNS)
+
+
+# 缺失检测：上市后、该交易所开市日没有收盘价；节假日不计入且不打断连续缺失
+def check_gaps(closes, sessions=None):
+    sessions = session_mask(closes) if sessions is None else sessions
+    valid = closes.notna().to_numpy()
+    listed = np.maximum.accumulate(valid, axis=0)
+    missing = ~valid & listed & sessions
+    start, end, cols, days = _runs(missing, pass_through=~sessions)
+    keep = days > 0
+    start, end, cols, days = start[keep], end[keep], cols[keep], days[keep]
+    severity = np.where(days >= VALIDATE_GAP_WARN_DAYS, 'warning', 'info')
+    return _issues('gap', severity, closes, start, end, cols, days, detail='开市日无收盘价')
+
+
+def _liquid_columns(closes):
+    return ~np.asarray(closes.columns.map(ticker_exchange).isin(VALIDATE_ILLIQUID_EXCHANGES))
+
+
+# 价格停滞：连续VALIDATE_STALE_DAYS个以上有效交易日收盘价与前一有效收盘价相同
+def check_stale_prices(closes, min_days=VALIDATE_STALE_DAYS):
+    prices = closes.to_numpy(dtype=float)
+    valid = ~np.isnan(prices)
+    prev = closes.ffill().shift(1).to_numpy(dtype=float)
+    same = valid & (prices == prev) & _liquid_columns(closes)
+    start, end, cols, days = _runs(same, pass_through=~valid)
+    keep = days >= min_days
+    return _issues('stale_price', 'warning', closes, start[keep], end[keep], cols[keep], days[keep],
+                   value=prices[end[keep], cols[keep]], detail=f'收盘价连续不变（>= {min_days} 天）')
+
+
+# 零成交量：有收盘价但成交量为0的连续交易日
+def check_zero_volume(closes, volumes):
+    volumes = volumes.reindex(index=closes.index, columns=closes.columns)
+    zero = closes.notna().to_numpy() & (volumes.to_numpy(dtype=float) == 0) & _liquid_columns(closes)
+    start, end, cols, days = _runs(zero, pass_through=closes.isna().to_numpy())
+    return _issues('zero_volume', 'warning', closes, start, end, cols, days, detail='有收盘价但成交量为0')
+
+
+# 价格异常跳变：相对前一有效收盘价的收益率绝对值超过VALIDATE_SPIKE_RETURN，
+# 或稳健z值（相对中位数、按MAD缩放，MAD不低于VALIDATE_SPIKE_MIN_MAD）超过VALIDATE_SPIKE_ZSCORE
+def check_spikes(closes, max_return=VALIDATE_SPIKE_RETURN, max_zscore=VALIDATE_SPIKE_ZSCORE, min_mad=VALIDATE_SPIKE_MIN_MAD):
+    returns = daily_returns(closes)
+    with np.errstate(invalid='ignore'):
+        median = np.nanmedian(returns, axis=0)
+        mad = np.fmax(np.nanmedian(np.abs(returns - median), axis=0) * 1.4826, min_mad)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        zscore = np.abs(returns - median) / mad
+        spike = (np.abs(returns) > max_return) | (zscore > max_zscore)
+    spike &= ~np.isnan(returns) & _liquid_columns(closes)
+    rows, cols = np.nonzero(spike)
+    severity = np.where(np.abs(returns[rows, cols]) > max_return, 'warning', 'info')
+    return _issues('spike', severity, closes, rows, rows, cols, 1, value=returns[rows, cols], detail='日收益率异常')
+
+
+# 行业映射检查：持仓必须有行业，对比ETF不应有行业
+def validate_industry_mapping(returns_df=None):
+    if returns_df is None:
+        returns_df = pd.read_csv(PROCESSED_DATA_DIR / 'returns.csv')
+    industry = returns_df['Industry'] if 'Industry' in returns_df.columns else pd.Series(pd.NA, index=returns_df.index)
+    # 缺失值在pandas 3下astype(str)后仍为NaN，需先用notna排除
+    text = industry.astype('string').str.strip().str.lower()
+    has_industry = industry.notna() & ~text.isin(['', 'nan', 'none']).fillna(True)
+    holding_missing = (returns_df['Type'] == 'Holding') & ~has_industry
+    etf_has = (returns_df['Type'] == 'Comparison ETF') & has_industry
+    problems = pd.concat([
+        pd.DataFrame({'Ticker': returns_df.loc[holding_missing, 'Ticker'], 'Detail': 'Holding无行业'}),
+        pd.DataFrame({'Ticker': returns_df.loc[etf_has, 'Ticker'], 'Detail': 'ETF有行业'}),
+    ], ignore_index=True)
+    return pd.DataFrame({
+        'Check': 'industry_mapping', 'Severity': 'error', 'Ticker': problems['Ticker'],
+        'Start': pd.NaT, 'End': pd.NaT, 'Days': 0, 'Value': np.nan, 'Detail': problems['Detail'],
+    }, columns=ISSUE_COLUMNS)
+
+
+# 对行情矩阵执行全部检查，返回问题长表（列为ISSUE_COLUMNS）
+def validate_market_data(closes, volumes=None):
+    sessions = session_mask(closes)
+    frames = [check_gaps(closes, sessions), check_stale_prices(closes), check_spikes(closes)]
+    if volumes is not None:
+        frames.append(check_zero_volume(closes, volumes))
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=ISSUE_COLUMNS)
+    return pd.concat(frames, ignore_index=True).sort_values(['Check', 'Ticker', 'Start'], kind='mergesort').reset_index(drop=True)
+
+
+# 行情检查加上行业映射检查（returns_df为None时跳过），不保存、不打印；看板加载时也调用
+def validate_all(closes, volumes=None, returns_df=None):
+    issues = validate_market_data(closes, volumes)
+    if returns_df is not None:
+        mapping = validate_industry_mapping(returns_df)
+        if not mapping.empty:
+            issues = pd.concat([issues, mapping], ignore_index=True)
+    return issues
+
+
+def summarize_issues(issues):
+    """按检查项和严重程度统计问题数量"""
+    if issues.empty:
+        return pd.DataFrame(columns=['Check', 'Severity', 'Count', 'Tickers'])
+    return (issues.groupby(['Check', 'Severity'])
+            .agg(Count=('Ticker', 'size'), Tickers=('Ticker', 'nunique'))
+            .reset_index())
+
+
+# 读取行情和收益率表，执行全部检查并保存报告，返回问题长表
+def run_validation(closes=None, volumes=None, returns_df=None, report_path=DATA_QUALITY_REPORT_PATH):
+    if closes is None:
+        closes = load_market_data('market_data_closes', data_dir=RAW_DATA_DIR)
+    if volumes is None:
+        volumes = load_market_data('market_data_volumes', data_dir=RAW_DATA_DIR)
+    if returns_df is None:
+        try:
+            returns_df = pd.read_csv(PROCESSED_DATA_DIR / 'returns.csv')
+        except FileNotFoundError as e:
+            print(f'[WARN] 跳过行业映射检查: {e}')
+    issues = validate_all(closes, volumes, returns_df)
+    if report_path is not None:
+        issues.to_csv(report_path, index=False)
+        print(f'[INFO] 数据质量报告已保存: {report_path}')
+    summary = summarize_issues(issues)
+    if summary.empty:
+        print('[INFO] 数据质量检查未发现问题')
     else:
-        print('行业mapping有问题的tickers:')
-        for t in problems:
-            print(f'Ticker: {t[0]}, Type: {t[1]}, 问题: {t[2]}')
+        print('[INFO] 数据质量检查结果:')
+        print(summary.to_string(index=False))
+    return issues
+
 
 if __name__ == '__main__':
-    print("\n==== 行业映射验证 ====")
-    validate_industry_mapping() 
\ No newline at end of file
+    run_validation()
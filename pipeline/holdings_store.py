@@ -0,0 +1,176 @@
+import re
+import pandas as pd
+import numpy as np
+from datetime import datetime
+from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent))
+from config import RAW_DATA_DIR, HOLDINGS_DIR, COMPANY_TO_TICKER_ADD
+from market_store import load_table, save_table
+
+# 持仓历史长表：每个持仓文件的每只股票一行
+HOLDINGS_HISTORY_PATH = RAW_DATA_DIR / 'holdings_history.parquet'
+HOLDINGS_HISTORY_COLUMNS = ['Date', 'Ticker', 'Company Name', 'Shares', 'Market Value', 'Pct Net Assets', 'Weight']
+# 最新持仓文件规范化后的结果，供下游各阶段直接复用（原始下载文件保持不变）
+NORMALIZED_HOLDINGS_PATH = RAW_DATA_DIR / 'holdings_normalized.csv'
+
+
+def _to_number(series):
+    return pd.to_numeric(series.astype(str).str.replace(',', '', regex=False), errors='coerce')
+
+
+# 从持仓文件第一行（"As of 2025-07-31"）解析持仓日期，解析失败时使用文件名中的日期
+def holdings_file_date(holdings_csv):
+    holdings_csv = Path(holdings_csv)
+    with open(holdings_csv, 'r', encoding='utf-8') as f:
+        banner = f.readline()
+    match = re.search(r'As of (\d{4}-\d{2}-\d{2})', banner)
+    if match:
+        return pd.Timestamp(match.group(1))
+    return pd.Timestamp(datetime.strptime(holdings_csv.name[:10], '%m_%d_%Y'))
+
+
+# 解析单个KraneShares持仓文件为长表，只保留有ticker和市值的行
+# 公司名在COMPANY_TO_TICKER_ADD中的，用映射的ticker替换原始ticker
+def parse_holdings_file(holdings_csv):
+    df = pd.read_csv(holdings_csv, skiprows=1)
+    mapped = df['Company Name'].map(COMPANY_TO_TICKER_ADD)
+    df['Ticker'] = mapped.fillna(df['Ticker'])
+    df = df.dropna(subset=['Ticker', 'Market Value($)'])
+    market_value = _to_number(df['Market Value($)'])
+    out = pd.DataFrame({
+        'Date': holdings_file_date(holdings_csv),
+        'Ticker': df['Ticker'].astype(str).values,
+        'Company Name': df['Company Name'].astype(str).values,
+        'Shares': _to_number(df['Shares Held']).values,
+        'Market Value': market_value.values,
+        'Pct Net Assets': pd.to_numeric(df['% of Net Assets'], errors='coerce').values / 100,
+    })
+    out['Weight'] = out['Market Value'] / out['Market Value'].sum()
+    return out
+
+
+# 规范化持仓文件：解析一次并保存为规范化结果，返回规范化后的DataFrame
+# 若规范化结果已对应同一源文件且不早于源文件，直接读取缓存
+def normalize_holdings_file(holdings_csv, out_path=NORMALIZED_HOLDINGS_PATH):
+    holdings_csv = Path(holdings_csv)
+    out_path = Path(out_path)
+    if out_path.exists() and out_path.stat().st_mtime >= holdings_csv.stat().st_mtime:
+        cached = load_normalized_holdings(out_path)
+        if cached is not None and (cached['Source'] == holdings_csv.name).all():
+            return cached
+    df = parse_holdings_file(holdings_csv)
+    df['Source'] = holdings_csv.name
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(out_path, index=False)
+    print(f'[INFO] 持仓已规范化: {out_path}')
+    return df
+
+
+def load_normalized_holdings(path=NORMALIZED_HOLDINGS_PATH):
+    """读取规范化后的最新持仓，不存在时返回None"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    return pd.read_csv(path, parse_dates=['Date'], dtype={'Ticker': str})
+
+
+def load_holdings_history(path=HOLDINGS_HISTORY_PATH):
+    """读取持仓历史长表，不存在时返回None"""
+    return load_table(path)
+
+
+def save_holdings_history(history, path=HOLDINGS_HISTORY_PATH):
+    return save_table(history, path)
+
+
+# 增量构建持仓历史：只解析持仓日期尚未入库的文件，追加后按(日期, ticker)排序保存
+# parsed: 本次运行中已解析过的持仓（如规范化后的最新持仓），对应日期的文件不再重复解析
+# save=False时只在内存中构建，不写入path（供只读取持仓历史的阶段使用）
+def update_holdings_history(holdings_dir=HOLDINGS_DIR, path=HOLDINGS_HISTORY_PATH, parsed=None, save=True):
+    history = load_holdings_history(path)
+    known_dates = set() if history is None else set(history['Date'].unique())
+    new_frames = []
+    for frame in parsed or []:
+        file_date = frame['Date'].iloc[0]
+        if file_date not in known_dates:
+            new_frames.append(frame[HOLDINGS_HISTORY_COLUMNS])
+            known_dates.add(file_date)
+    for holdings_csv in sorted(Path(holdings_dir).glob('*_agix_holdings.csv')):
+        try:
+            file_date = holdings_file_date(holdings_csv)
+        except Exception as e:
+            print(f'[WARN] 无法识别持仓日期，跳过: {holdings_csv}, 错误: {e}')
+            continue
+        if file_date in known_dates:
+            continue
+        try:
+            new_frames.append(parse_holdings_file(holdings_csv))
+            known_dates.add(file_date)
+        except Exception as e:
+            print(f'[WARN] 持仓文件解析失败，跳过: {holdings_csv}, 错误: {e}')
+    if not new_frames:
+        print('[INFO] 持仓历史已是最新')
+        return history
+    frames = ([history] if history is not None else []) + new_frames
+    history = pd.concat(frames, ignore_index=True)
+    history = history.sort_values(['Date', 'Ticker'], kind='mergesort').reset_index(drop=True)
+    if not save:
+        print(f'[INFO] 持仓历史新增 {len(new_frames)} 天，共 {history["Date"].nunique()} 天（未保存）')
+        return history
+    saved = save_holdings_history(history, path)
+    print(f'[INFO] 持仓历史新增 {len(new_frames)} 天，共 {history["Date"].nunique()} 天，已保存: {saved}')
+    return history
+
+
+class HoldingsHistory:
+    """
+    持仓历史查询
+    长表按(日期, ticker)排序存放，并建立按日期（行区间）和按ticker（行号数组）的索引
+    """
+
+    def __init__(self, history):
+        self.frame = history.sort_values(['Date', 'Ticker'], kind='mergesort').reset_index(drop=True)
+        dates = self.frame['Date'].values
+        self.dates = pd.DatetimeIndex(np.unique(dates))
+        starts = np.searchsorted(dates, self.dates.values, side='left')
+        stops = np.searchsorted(dates, self.dates.values, side='right')
+        self._date_index = dict(zip(self.dates, zip(starts, stops)))
+        self._ticker_index = {t: rows for t, rows in self.frame.groupby('Ticker', sort=False).indices.items()}
+
+    @classmethod
+    def load(cls, path=HOLDINGS_HISTORY_PATH):
+        history = load_holdings_history(path)
+        return None if history is None else cls(history)
+
+    @property
+    def tickers(self):
+        return list(self._ticker_index)
+
+    def on(self, date, asof=True):
+        """某一天的持仓；asof=True时，若当天无持仓文件则返回之前最近一天的持仓"""
+        date = pd.Timestamp(date)
+        if date not in self._date_index:
+            if not asof:
+                return self.frame.iloc[0:0]
+            pos = self.dates.searchsorted(date, side='right') - 1
+            if pos < 0:
+                return self.frame.iloc[0:0]
+            date = self.dates[pos]
+        start, stop = self._date_index[date]
+        return self.frame.iloc[start:stop]
+
+    def for_ticker(self, ticker):
+        """某只股票的全部持仓历史"""
+        rows = self._ticker_index.get(ticker)
+        if rows is None:
+            return self.frame.iloc[0:0]
+        return self.frame.iloc[rows]
+
+    def weights_matrix(self):
+        """权重矩阵：日期 × ticker，未持有为0"""
+        return self.frame.pivot_table(index='Date', columns='Ticker', values='Weight', aggfunc='sum', fill_value=0.0)
+
+
+if __name__ == '__main__':
+    update_holdings_history()
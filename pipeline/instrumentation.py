@@ -0,0 +1,346 @@
+"""
+运行监控
+记录每次运行中各阶段（stage）、各下载批次（batch）等区间的墙钟时间、CPU时间、
+区间内的常驻内存峰值和增量、处理的行列数和网络字节数，运行结束时作为一行JSON追加到运行日志，并可与历史运行对比
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+from datetime import datetime
+from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent))
+from config import RUN_LOG_PATH, INSTRUMENT_HEARTBEAT_SECONDS, INSTRUMENT_RSS_SAMPLE_SECONDS
+
+_local = threading.local()
+_lock = threading.Lock()
+_active_run = None
+
+
+# 进程整个生命周期的内存峰值（MB），不支持resource模块的平台（Windows）返回None
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux单位为KB，macOS为字节
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else None
+
+
+# 当前常驻内存（MB）：Linux读取/proc/self/statm，其他平台使用psutil，都不可用时返回None
+def current_rss_mb():
+    if _PAGE_SIZE:
+        try:
+            with open('/proc/self/statm', 'r') as f:
+                return round(int(f.read().split()[1]) * _PAGE_SIZE / (1024 * 1024), 1)
+        except (OSError, ValueError, IndexError):
+            pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return round(psutil.Process().memory_info().rss / (1024 * 1024), 1)
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def current_span():
+    """当前线程最内层的区间；线程池中的线程没有自己的区间时，返回运行的根区间（未在运行中时为None）"""
+    stack = _stack()
+    if stack:
+        return stack[-1]
+    return _active_run.root if _active_run is not None else None
+
+
+class Span:
+    """
+    一个计时区间
+    计数（rows、network_bytes等）会同时累加到所有上级区间；columns记录最大值
+    cpu_seconds为进程CPU时间，并行执行的区间之间会互相包含
+    peak_rss_mb为区间存续期间的常驻内存峰值（进入、退出时及运行中定期采样），rss_delta_mb为退出与进入时之差；
+    内存按进程统计，并行执行的区间同样互相包含
+    """
+
+    def __init__(self, kind, name, parent=None, **fields):
+        self.kind = kind
+        self.name = name
+        self.parent = parent
+        self.fields = fields
+        self.counters = {}
+        self.status = 'ok'
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self.peak_rss_mb = None
+        self.rss_start_mb = None
+        self.rss_delta_mb = None
+
+    def observe_rss(self, rss):
+        if rss is not None and (self.peak_rss_mb is None or rss > self.peak_rss_mb):
+            self.peak_rss_mb = rss
+
+    def add(self, key, value):
+        span = self
+        with _lock:
+            while span is not None:
+                span.counters[key] = span.counters.get(key, 0) + value
+                span = span.parent
+
+    def record_frame(self, df):
+        """记录处理的DataFrame行列数"""
+        self.add('rows', int(df.shape[0]))
+        with _lock:
+            self.counters['columns'] = max(self.counters.get('columns', 0), int(df.shape[1]) if df.ndim > 1 else 1)
+
+    def elapsed(self):
+        return time.perf_counter() - self._wall_start
+
+    def __enter__(self):
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self.rss_start_mb = current_rss_mb()
+        self.peak_rss_mb = self.rss_start_mb
+        _stack().append(self)
+        if _active_run is not None:
+            with _lock:
+                _active_run.open_spans.add(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wall_seconds = round(time.perf_counter() - self._wall_start, 4)
+        self.cpu_seconds = round(time.process_time() - self._cpu_start, 4)
+        rss = current_rss_mb()
+        with _lock:
+            self.observe_rss(rss)
+        if rss is not None and self.rss_start_mb is not None:
+            self.rss_delta_mb = round(rss - self.rss_start_mb, 1)
+        if exc_type is not None:
+            self.status = 'error'
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        if _active_run is not None:
+            _active_run.finish_span(self)
+        return False
+
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'name': self.name,
+            'status': self.status,
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'peak_rss_mb': self.peak_rss_mb,
+            'rss_delta_mb': self.rss_delta_mb,
+            **self.counters,
+            **self.fields,
+        }
+
+
+def span(kind, name, parent=None, **fields):
+    """创建区间，默认挂在当前区间之下；用法: with span('stage', 'process') as s: ..."""
+    return Span(kind, name, parent if parent is not None else current_span(), **fields)
+
+
+def add_counter(key, value):
+    """累加到当前区间（及所有上级区间），不在运行中时忽略"""
+    target = current_span()
+    if target is not None:
+        target.add(key, value)
+
+
+def record_frame(df):
+    target = current_span()
+    if target is not None:
+        target.record_frame(df)
+
+
+class Run:
+    """
+    一次运行：根区间覆盖整个运行，结束时把所有区间追加到运行日志
+    运行期间每隔INSTRUMENT_HEARTBEAT_SECONDS秒打印仍未结束的区间及已耗时，便于区分"慢"和"卡住"；
+    每隔rss_sample_seconds秒采样一次常驻内存，更新所有未结束区间的内存峰值
+    """
+
+    def __init__(self, name, log_path=RUN_LOG_PATH, heartbeat_seconds=INSTRUMENT_HEARTBEAT_SECONDS,
+                 rss_sample_seconds=INSTRUMENT_RSS_SAMPLE_SECONDS):
+        self.name = name
+        self.log_path = Path(log_path)
+        self.heartbeat_seconds = heartbeat_seconds
+        self.rss_sample_seconds = rss_sample_seconds
+        self.root = Span('run', name)
+        self.spans = []
+        self.open_spans = set()
+        self._stop = threading.Event()
+
+    def finish_span(self, finished):
+        with _lock:
+            self.open_spans.discard(finished)
+            if finished is not self.root:
+                self.spans.append(finished.to_dict())
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            with _lock:
+                running = [s for s in self.open_spans if s is not self.root]
+            for s in sorted(running, key=lambda s: -s.elapsed()):
+                print(f'[INFO] 运行中: {s.kind} {s.name}，已耗时 {s.elapsed():.0f} 秒')
+
+    def _sample_rss(self):
+        while not self._stop.wait(self.rss_sample_seconds):
+            rss = current_rss_mb()
+            with _lock:
+                for s in self.open_spans:
+                    s.observe_rss(rss)
+
+    def __enter__(self):
+        global _active_run
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        _active_run = self
+        self.root.__enter__()
+        if self.heartbeat_seconds:
+            threading.Thread(target=self._heartbeat, daemon=True).start()
+        if self.rss_sample_seconds:
+            threading.Thread(target=self._sample_rss, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active_run
+        self._stop.set()
+        self.root.__exit__(exc_type, exc, tb)
+        _active_run = None
+        record = {
+            'run': self.name,
+            'started_at': self.started_at,
+            'argv': sys.argv[1:],
+            **self.root.to_dict(),
+            'process_peak_rss_mb': peak_rss_mb(),
+            'spans': self.spans,
+        }
+        record.pop('kind')
+        record.pop('name')
+        try:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        except Exception as e:
+            print(f'[WARN] 运行日志写入失败: {e}')
+        print(f"[INFO] 运行 {self.name} 结束: 耗时 {self.root.wall_seconds:.2f} 秒，CPU {self.root.cpu_seconds:.2f} 秒，"
+              f"内存峰值 {self.root.peak_rss_mb} MB，运行日志: {self.log_path}")
+        return False
+
+
+def instrumented_run(name, **kwargs):
+    """开始一次运行；已在运行中（如由编排器调用）时返回当前区间下的子区间"""
+    if _active_run is not None:
+        return span('run', name)
+    return Run(name, **kwargs)
+
+
+def load_runs(log_path=RUN_LOG_PATH, name=None):
+    log_path = Path(log_path)
+    if not log_path.exists():
+        return []
+    runs = []
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                run = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if name is None or run.get('run') == name:
+                runs.append(run)
+    return runs
+
+
+SUMMARY_METRICS = ['wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'rows', 'network_bytes']
+
+
+# 把一次运行的区间按(类型, 名称)汇总：时间、行数、字节数求和，内存取最大值，count为区间个数
+def summarize_run(run):
+    summary = {}
+    for s in run.get('spans', []):
+        key = (s['kind'], s['name'])
+        entry = summary.setdefault(key, {'count': 0})
+        entry['count'] += 1
+        for metric in SUMMARY_METRICS:
+            value = s.get(metric)
+            if value is None:
+                continue
+            if metric == 'peak_rss_mb':
+                entry[metric] = max(entry.get(metric, 0), value)
+            else:
+                entry[metric] = entry.get(metric, 0) + value
+    summary[('run', run['run'])] = {'count': 1, **{m: run.get(m) for m in SUMMARY_METRICS if run.get(m) is not None}}
+    return summary
+
+
+def _median(values):
+    values = sorted(values)
+    n = len(values)
+    if n == 0:
+        return None
+    return values[n // 2] if n % 2 else (values[n // 2 - 1] + values[n // 2]) / 2
+
+
+# 最近一次运行与之前若干次运行（中位数）对比，返回行列表
+def compare_runs(runs, last=5):
+    if not runs:
+        return []
+    latest = summarize_run(runs[-1])
+    previous = [summarize_run(r) for r in runs[-1 - last:-1]]
+    rows = []
+    for key, entry in latest.items():
+        row = {'kind': key[0], 'name': key[1], 'count': entry['count']}
+        for metric in SUMMARY_METRICS:
+            value = entry.get(metric)
+            history = [p[key][metric] for p in previous if key in p and p[key].get(metric) is not None]
+            baseline = _median(history)
+            row[metric] = value
+            row[f'{metric}_baseline'] = baseline
+            row[f'{metric}_change'] = (value / baseline - 1) if value is not None and baseline else None
+        rows.append(row)
+    return rows
+
+
+def print_summary(name=None, last=5, log_path=RUN_LOG_PATH):
+    runs = load_runs(log_path, name)
+    if not runs:
+        print(f'[WARN] 运行日志中没有记录: {log_path}')
+        return
+    latest = runs[-1]
+    print(f"运行: {latest['run']}  开始: {latest['started_at']}  对比之前 {min(last, len(runs) - 1)} 次运行的中位数")
+    header = f"{'类型':<6} {'名称':<24} {'次数':>4} {'耗时(秒)':>10} {'变化':>8} {'CPU(秒)':>9} {'内存峰值(MB)':>12} {'行数':>10} {'网络字节':>12}"
+    print(header)
+    for row in compare_runs(runs, last):
+        change = row['wall_seconds_change']
+        change_str = f'{change:+.0%}' if change is not None else '-'
+
+        def fmt(metric, spec):
+            value = row[metric]
+            return format(value, spec) if value is not None else '-'
+
+        print(f"{row['kind']:<6} {row['name'][:24]:<24} {row['count']:>4} {fmt('wall_seconds', '.2f'):>10} {change_str:>8} "
+              f"{fmt('cpu_seconds', '.2f'):>9} {fmt('peak_rss_mb', '.1f'):>12} {fmt('rows', 'd'):>10} {fmt('network_bytes', 'd'):>12}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="AGIX Fund Monitor 运行日志对比")
+    parser.add_argument("--run", help="只看指定名称的运行（pipeline / data_fetcher / data_processor / data_sync）")
+    parser.add_argument("--last", type=int, default=5, help="与之前多少次运行对比")
+    parser.add_argument("--log", default=str(RUN_LOG_PATH), help="运行日志文件")
+    args = parser.parse_args()
+    print_summary(args.run, args.last, args.log)
@@ -0,0 +1,215 @@
+import json
+import zlib
+import threading
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+
+# 行情数据源接口：data_fetcher的各下载阶段统一通过provider获取数据
+# history返回以日期（无时区）为索引、包含Close和Volume列的DataFrame，无数据时返回空DataFrame
+# history_batch一次请求多个ticker，返回 {ticker: 同history的DataFrame}；默认逐个调用history
+# info返回公司信息字典（字段同yfinance的Ticker.info）
+class MarketDataProvider:
+    name = 'base'
+    # 额外追加到下载列表的ticker（合成数据源用于放大ticker规模）
+    extra_tickers = []
+
+    def history(self, ticker, start_date, end_date, interval='1d'):
+        raise NotImplementedError
+
+    def history_batch(self, tickers, start_date, end_date, interval='1d'):
+        return {t: self.history(t, start_date, end_date, interval) for t in tickers}
+
+    def info(self, ticker):
+        raise NotImplementedError
+
+
+def _normalize_history(hist):
+    if hist is None or hist.empty:
+        return pd.DataFrame(columns=['Close', 'Volume'])
+    index = hist.index
+    if getattr(index, 'tz', None) is not None:
+        index = index.tz_localize(None)
+    out = pd.DataFrame({'Close': hist['Close'].values, 'Volume': hist['Volume'].values}, index=index.normalize())
+    out.index.name = 'Date'
+    return out
+
+
+class YFinanceProvider(MarketDataProvider):
+    """
+    yfinance数据源（线上）
+    history_batch用一次yf.download请求整批ticker（内部多线程下载）；yf.download使用模块级共享状态，
+    多个线程同时调用会互相覆盖结果，因此各线程的调用按锁串行；单个ticker的重试使用Ticker.history
+    """
+    name = 'yfinance'
+    _download_lock = threading.Lock()
+
+    def history(self, ticker, start_date, end_date, interval='1d'):
+        import yfinance as yf
+        hist = yf.Ticker(ticker).history(start=start_date, end=end_date, interval=interval, auto_adjust=True)
+        return _normalize_history(hist)
+
+    def history_batch(self, tickers, start_date, end_date, interval='1d'):
+        import yfinance as yf
+        with self._download_lock:
+            data = yf.download(list(tickers), start=start_date, end=end_date, interval=interval, group_by='ticker',
+                               auto_adjust=True, threads=True, progress=False)
+        result = {}
+        for t in tickers:
+            if data is None or data.empty:
+                hist = None
+            elif isinstance(data.columns, pd.MultiIndex):
+                hist = data[t] if t in data.columns.get_level_values(0) else None
+            else:
+                hist = data if len(tickers) == 1 else None
+            # 整批下载的日期为所有ticker的并集，去掉该ticker没有数据的日期
+            result[t] = _normalize_history(None if hist is None else hist.dropna(how='all'))
+        return result
+
+    def info(self, ticker):
+        import yfinance as yf
+        return yf.Ticker(ticker).info or {}
+
+
+def _safe_name(ticker):
+    # ticker中的^等字符不适合作为文件名
+    return ticker.replace('^', '_caret_').replace('/', '_')
+
+
+class RecordingProvider(MarketDataProvider):
+    """
+    录制数据源：调用内部数据源并把返回结果保存到record_dir，供ReplayProvider离线回放
+    record_dir/history/<ticker>.csv 保存行情，record_dir/info/<ticker>.json 保存公司信息
+    """
+    name = 'record'
+
+    def __init__(self, inner, record_dir):
+        self.inner = inner
+        self.record_dir = Path(record_dir)
+        (self.record_dir / 'history').mkdir(parents=True, exist_ok=True)
+        (self.record_dir / 'info').mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+
+    def _record_history(self, ticker, hist):
+        if hist.empty:
+            return
+        path = self.record_dir / 'history' / f'{_safe_name(ticker)}.csv'
+        with self.lock:
+            # 与已录制的区间合并，新数据优先
+            if path.exists():
+                recorded = pd.read_csv(path, index_col=0, parse_dates=True)
+                merged = hist.combine_first(recorded).sort_index()
+            else:
+                merged = hist
+            merged.to_csv(path, float_format='%.17g')
+
+    def history(self, ticker, start_date, end_date, interval='1d'):
+        hist = self.inner.history(ticker, start_date, end_date, interval)
+        self._record_history(ticker, hist)
+        return hist
+
+    def history_batch(self, tickers, start_date, end_date, interval='1d'):
+        result = self.inner.history_batch(tickers, start_date, end_date, interval)
+        for t, hist in result.items():
+            self._record_history(t, hist)
+        return result
+
+    def info(self, ticker):
+        info = self.inner.info(ticker)
+        with open(self.record_dir / 'info' / f'{_safe_name(ticker)}.json', 'w', encoding='utf-8') as f:
+            json.dump(info, f, ensure_ascii=False, default=str)
+        return info
+
+
+class ReplayProvider(MarketDataProvider):
+    """回放数据源：从RecordingProvider录制的本地文件读取，不访问网络；未录制的ticker返回空数据"""
+    name = 'replay'
+
+    def __init__(self, record_dir):
+        self.record_dir = Path(record_dir)
+        self._cache = {}
+        self.lock = threading.Lock()
+
+    def _load(self, ticker):
+        with self.lock:
+            if ticker not in self._cache:
+                path = self.record_dir / 'history' / f'{_safe_name(ticker)}.csv'
+                self._cache[ticker] = pd.read_csv(path, index_col=0, parse_dates=True) if path.exists() else None
+            return self._cache[ticker]
+
+    def history(self, ticker, start_date, end_date, interval='1d'):
+        hist = self._load(ticker)
+        if hist is None:
+            return pd.DataFrame(columns=['Close', 'Volume'])
+        # 与yfinance一致：包含start，不包含end
+        return hist.loc[(hist.index >= pd.Timestamp(start_date)) & (hist.index < pd.Timestamp(end_date))]
+
+    def info(self, ticker):
+        path = self.record_dir / 'info' / f'{_safe_name(ticker)}.json'
+        if not path.exists():
+            raise KeyError(f'未录制的公司信息: {ticker}')
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+class SyntheticProvider(MarketDataProvider):
+    """
+    合成数据源：为任意ticker生成确定性的几何布朗运动价格和成交量，用于离线压测
+    n_tickers个额外的合成ticker（SYN0000...）会追加到下载列表，日期为截至end_date的n_days个工作日
+    """
+    name = 'synthetic'
+
+    def __init__(self, n_tickers=0, n_days=750, end_date=None, seed=0):
+        self.dates = pd.bdate_range(end=pd.Timestamp(end_date or pd.Timestamp.today().normalize()), periods=n_days, name='Date')
+        self.seed = seed
+        self.extra_tickers = [f'SYN{i:04d}' for i in range(n_tickers)]
+
+    def _rng(self, ticker):
+        return np.random.default_rng([self.seed, zlib.crc32(ticker.encode('utf-8'))])
+
+    def _series(self, ticker):
+        rng = self._rng(ticker)
+        n = len(self.dates)
+        drift, vol = rng.uniform(-0.0002, 0.0008), rng.uniform(0.01, 0.04)
+        log_returns = rng.normal(drift, vol, n)
+        closes = rng.uniform(10, 500) * np.exp(np.cumsum(log_returns))
+        volumes = np.round(rng.lognormal(rng.uniform(11, 16), 0.5, n))
+        return pd.DataFrame({'Close': closes, 'Volume': volumes}, index=self.dates)
+
+    # 一批ticker的收盘价、成交量矩阵（日期 × ticker），与逐个下载得到的序列一致
+    def market_data(self, tickers):
+        series = {t: self._series(t) for t in tickers}
+        closes = pd.DataFrame({t: s['Close'] for t, s in series.items()}, index=self.dates, columns=list(tickers))
+        volumes = pd.DataFrame({t: s['Volume'] for t, s in series.items()}, index=self.dates, columns=list(tickers))
+        return closes, volumes
+
+    def history(self, ticker, start_date, end_date, interval='1d'):
+        hist = self._series(ticker)
+        return hist.loc[(hist.index >= pd.Timestamp(start_date)) & (hist.index < pd.Timestamp(end_date))]
+
+    def info(self, ticker):
+        rng = self._rng(ticker)
+        return {
+            'longName': f'{ticker} Synthetic Corp',
+            'website': f'https://example.com/{ticker.lower()}',
+            'country': str(rng.choice(['United States', 'Taiwan', 'South Korea', 'Netherlands'])),
+            'averageAnalystRating': f'{rng.uniform(1, 3):.1f} - Buy',
+        }
+
+
+# 按名称创建数据源
+def create_provider(name='yfinance', record_dir=None, n_tickers=0, n_days=750, seed=0):
+    if name == 'yfinance':
+        return YFinanceProvider()
+    if name == 'record':
+        if record_dir is None:
+            raise ValueError('record数据源需要指定record_dir')
+        return RecordingProvider(YFinanceProvider(), record_dir)
+    if name == 'replay':
+        if record_dir is None:
+            raise ValueError('replay数据源需要指定record_dir')
+        return ReplayProvider(record_dir)
+    if name == 'synthetic':
+        return SyntheticProvider(n_tickers=n_tickers, n_days=n_days, seed=seed)
+    raise ValueError(f'未知的数据源: {name}')
@@ -0,0 +1,330 @@
+"""
+数据管道编排
+把数据采集、处理、验证、同步各阶段声明为有向无环图：每个阶段声明输入、输出文件，
+阶段之间的依赖由"某阶段的输入是另一阶段的输出"自动推导
+输入文件按内容哈希生成指纹，指纹未变且输出齐全的阶段直接跳过；互不依赖的阶段并行执行
+"""
+
+import os
+import json
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import sys
+sys.path.append(str(Path(__file__).parent))
+from config import BASE_DIR, RAW_DATA_DIR, PROCESSED_DATA_DIR, CACHE_DIR
+from market_store import market_data_path
+from sync_format import sync_path, SYNC_MANIFEST
+from holdings_store import HOLDINGS_HISTORY_PATH, NORMALIZED_HOLDINGS_PATH
+from rolling_risk import ROLLING_RISK_PATH, ROLLING_BETA_PATH
+from data_processor import RETURNS_HISTORY_PATH
+from instrumentation import span, instrumented_run
+
+PIPELINE_STATE_PATH = CACHE_DIR / 'pipeline_state.json'
+PIPELINE_DIR = Path(__file__).parent
+SYNC_DATA_DIR = BASE_DIR / 'data'
+
+
+class Stage:
+    """
+    管道阶段
+    inputs/outputs: 输入、输出文件路径；code: 阶段代码所在文件，代码变化同样视为输入变化
+    volatile: 依赖网络等外部数据的阶段，无法由本地文件判断是否变化，每次都执行（阶段内部自行增量）
+    """
+
+    def __init__(self, name, run, inputs=(), outputs=(), code=(), volatile=False):
+        self.name = name
+        self.run = run
+        self.inputs = [Path(p) for p in inputs]
+        self.outputs = [Path(p) for p in outputs]
+        self.code = [Path(p) for p in code]
+        self.volatile = volatile
+
+
+class FileHasher:
+    """文件内容哈希，按(大小, 修改时间)缓存，文件未改动时不重复读取"""
+
+    def __init__(self, cache=None):
+        self.cache = cache or {}
+        self.lock = threading.Lock()
+
+    def hash(self, path):
+        path = Path(path)
+        if not path.exists():
+            return 'missing'
+        stat = path.stat()
+        key = str(path)
+        with self.lock:
+            cached = self.cache.get(key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        value = digest.hexdigest()
+        with self.lock:
+            self.cache[key] = [stat.st_size, stat.st_mtime_ns, value]
+        return value
+
+    def fingerprint(self, paths):
+        digest = hashlib.sha256()
+        for path in sorted(str(p) for p in paths):
+            digest.update(f'{path}:{self.hash(path)}\n'.encode('utf-8'))
+        return digest.hexdigest()
+
+
+def load_state(path=PIPELINE_STATE_PATH):
+    path = Path(path)
+    if not path.exists():
+        return {'hashes': {}, 'stages': {}}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        state.setdefault('hashes', {})
+        state.setdefault('stages', {})
+        return state
+    except Exception as e:
+        print(f'[WARN] 管道状态文件读取失败，所有阶段将重新执行: {e}')
+        return {'hashes': {}, 'stages': {}}
+
+
+def save_state(state, path=PIPELINE_STATE_PATH):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+# 阶段依赖：B的某个输入是A的输出，则B依赖A
+def stage_dependencies(stages):
+    producers = {}
+    for stage in stages:
+        for out in stage.outputs:
+            producers[out] = stage.name
+    return {
+        stage.name: sorted({producers[p] for p in stage.inputs if p in producers and producers[p] != stage.name})
+        for stage in stages
+    }
+
+
+def _check_acyclic(stages, deps):
+    visiting, done = set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f'管道阶段存在循环依赖: {name}')
+        visiting.add(name)
+        for dep in deps[name]:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+
+    for stage in stages:
+        visit(stage.name)
+
+
+class Pipeline:
+    """
+    按依赖关系执行各阶段
+    force: 忽略指纹全部执行；only: 只执行指定阶段（其余阶段视为已是最新）；offline: 跳过volatile阶段
+    """
+
+    def __init__(self, stages, state_path=PIPELINE_STATE_PATH, max_workers=4):
+        self.stages = {stage.name: stage for stage in stages}
+        self.deps = stage_dependencies(stages)
+        _check_acyclic(stages, self.deps)
+        self.state_path = state_path
+        self.max_workers = max_workers
+
+    def _is_fresh(self, stage, fingerprint, state):
+        previous = state['stages'].get(stage.name)
+        return (previous is not None and previous.get('fingerprint') == fingerprint
+                and all(p.exists() for p in stage.outputs))
+
+    def plan(self, hasher, state, force=False, only=None, offline=False):
+        """不执行，返回各阶段在当前输入下是否需要执行（仅按当前文件判断，不考虑上游执行后的变化）"""
+        plan = {}
+        for name, stage in self.stages.items():
+            if only and name not in only:
+                plan[name] = 'skip'
+            elif stage.volatile:
+                plan[name] = 'skip' if offline else 'run'
+            elif force:
+                plan[name] = 'run'
+            else:
+                fingerprint = hasher.fingerprint(stage.inputs + stage.code)
+                plan[name] = 'fresh' if self._is_fresh(stage, fingerprint, state) else 'run'
+        return plan
+
+    def run(self, force=False, only=None, offline=False):
+        with instrumented_run('pipeline'):
+            return self._run(force, only, offline)
+
+    def _run(self, force, only, offline):
+        state = load_state(self.state_path)
+        hasher = FileHasher(state['hashes'])
+        status = {}
+        lock = threading.Lock()
+
+        def execute(stage):
+            if (only and stage.name not in only) or (stage.volatile and offline):
+                return 'skip', 0.0
+            # 指纹在上游阶段全部完成后计算
+            fingerprint = hasher.fingerprint(stage.inputs + stage.code)
+            if not (force or stage.volatile) and self._is_fresh(stage, fingerprint, state):
+                return 'fresh', 0.0
+            print(f'[INFO] 阶段开始: {stage.name}')
+            with span('stage', stage.name) as s:
+                stage.run()
+            with lock:
+                state['stages'][stage.name] = {
+                    'fingerprint': fingerprint,
+                    'finished_at': datetime.now().isoformat(timespec='seconds'),
+                    'seconds': s.wall_seconds,
+                }
+            return 'ok', s.wall_seconds
+
+        pending = dict(self.stages)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name in list(pending):
+                    deps = self.deps[name]
+                    if any(status.get(d) in ('failed', 'blocked') for d in deps):
+                        status[name] = 'blocked'
+                        print(f'[WARN] 上游阶段失败，跳过: {name}')
+                        del pending[name]
+                    elif all(d in status for d in deps):
+                        running[pool.submit(execute, pending.pop(name))] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        result, elapsed = future.result()
+                    except Exception as e:
+                        status[name] = 'failed'
+                        print(f'[ERROR] 阶段失败: {name}, 错误: {e}')
+                        continue
+                    status[name] = result
+                    if result == 'ok':
+                        print(f'[INFO] 阶段完成: {name}，耗时 {elapsed:.2f} 秒')
+                    elif result == 'fresh':
+                        print(f'[INFO] 输入未变化，跳过: {name}')
+        save_state(state, self.state_path)
+        return status
+
+
+def _run_holdings():
+    import data_fetcher
+    if data_fetcher.update_holdings() is None:
+        raise RuntimeError('无法下载或找到任何AGIX持仓文件')
+
+
+def _run_market_data():
+    import data_fetcher
+    data_fetcher.update_market_data()
+
+
+def _run_holdings_info():
+    import data_fetcher
+    data_fetcher.fetch_holdings_info()
+
+
+def _run_process():
+    import data_processor
+    data_processor.main()
+
+
+def _run_validate():
+    import data_validate
+    data_validate.run_validation()
+
+
+def _run_sync():
+    sys.path.append(str(BASE_DIR))
+    from data_sync import DataSync
+    if not DataSync(SYNC_DATA_DIR).sync_all_data():
+        raise RuntimeError('部分数据文件同步失败')
+
+
+def _market_files(name):
+    return [market_data_path(name, fmt, RAW_DATA_DIR) for fmt in ('parquet', 'csv')]
+
+
+HOLDINGS_TICKERS_PATH = RAW_DATA_DIR / 'holdings_tickers.csv'
+HOLDINGS_INFO_PATH = RAW_DATA_DIR / 'holdings_info.csv'
+MARKET_FILES = _market_files('market_data_closes') + _market_files('market_data_volumes')
+# 同步到云端的处理结果
+PROCESSED_FILES = [PROCESSED_DATA_DIR / name for name in (
+    'returns.csv', 'risk_metrics.csv', 'volume_analysis.csv',
+    'holdings_sectorAnalysis.csv', 'holdings_countryAnalysis.csv',
+)]
+# process阶段写入的全部文件（删除或改动其中任何一个都会触发重算）
+PROCESS_OUTPUTS = PROCESSED_FILES + [
+    PROCESSED_DATA_DIR / 'holdings_exchangeAnalysis.csv', RETURNS_HISTORY_PATH, ROLLING_RISK_PATH, ROLLING_BETA_PATH,
+]
+SYNC_FILES = [sync_path(SYNC_DATA_DIR, p.stem) for p in
+              [MARKET_FILES[1], MARKET_FILES[3], HOLDINGS_TICKERS_PATH, HOLDINGS_INFO_PATH] + PROCESSED_FILES] + [SYNC_DATA_DIR / SYNC_MANIFEST]
+FETCHER_CODE = [PIPELINE_DIR / 'data_fetcher.py', PIPELINE_DIR / 'holdings_store.py', PIPELINE_DIR / 'market_data_provider.py']
+DATA_QUALITY_REPORT_PATH = PROCESSED_DATA_DIR / 'data_quality_report.csv'
+PROCESSOR_CODE = [PIPELINE_DIR / name for name in (
+    'data_processor.py', 'risk_engine.py', 'rolling_risk.py', 'attribution.py', 'holdings_store.py', 'trading_calendar.py', 'config.py',
+    'exchange_holidays.csv',
+)]
+
+
+def default_stages():
+    return [
+        Stage('holdings', _run_holdings,
+              outputs=[NORMALIZED_HOLDINGS_PATH, HOLDINGS_TICKERS_PATH, HOLDINGS_HISTORY_PATH],
+              code=FETCHER_CODE, volatile=True),
+        Stage('market_data', _run_market_data,
+              inputs=[HOLDINGS_TICKERS_PATH], outputs=MARKET_FILES, code=FETCHER_CODE, volatile=True),
+        Stage('holdings_info', _run_holdings_info,
+              inputs=[HOLDINGS_TICKERS_PATH], outputs=[HOLDINGS_INFO_PATH], code=FETCHER_CODE, volatile=True),
+        Stage('process', _run_process,
+              inputs=MARKET_FILES + [HOLDINGS_TICKERS_PATH, HOLDINGS_INFO_PATH, NORMALIZED_HOLDINGS_PATH, HOLDINGS_HISTORY_PATH],
+              outputs=PROCESS_OUTPUTS, code=PROCESSOR_CODE),
+        Stage('validate', _run_validate,
+              inputs=MARKET_FILES + [PROCESSED_DATA_DIR / 'returns.csv'], outputs=[DATA_QUALITY_REPORT_PATH],
+              code=[PIPELINE_DIR / name for name in ('data_validate.py', 'risk_engine.py', 'trading_calendar.py', 'config.py', 'exchange_holidays.csv')]),
+        Stage('sync', _run_sync,
+              inputs=MARKET_FILES + [HOLDINGS_TICKERS_PATH, HOLDINGS_INFO_PATH] + PROCESSED_FILES,
+              outputs=SYNC_FILES, code=[BASE_DIR / 'data_sync.py', BASE_DIR / 'sync_format.py']),
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="AGIX Fund Monitor 数据管道")
+    parser.add_argument("--force", action="store_true", help="忽略输入指纹，执行所有阶段")
+    parser.add_argument("--only", nargs="+", metavar="STAGE", help="只执行指定阶段")
+    parser.add_argument("--offline", action="store_true", help="跳过需要访问网络的采集阶段")
+    parser.add_argument("--dry-run", action="store_true", help="只显示各阶段是否需要执行")
+    parser.add_argument("--workers", type=int, default=4, help="并行执行的阶段数")
+    args = parser.parse_args()
+    # data_sync使用相对项目根目录的路径
+    os.chdir(BASE_DIR)
+    pipeline = Pipeline(default_stages(), max_workers=args.workers)
+    if args.only:
+        unknown = set(args.only) - set(pipeline.stages)
+        if unknown:
+            parser.error(f"未知的阶段: {', '.join(sorted(unknown))}")
+    if args.dry_run:
+        state = load_state()
+        plan = pipeline.plan(FileHasher(state['hashes']), state, args.force, args.only, args.offline)
+        for name, action in plan.items():
+            deps = ', '.join(pipeline.deps[name]) or '-'
+            print(f'{name:<15} {action:<6} 依赖: {deps}')
+    else:
+        status = pipeline.run(force=args.force, only=args.only, offline=args.offline)
+        print('[INFO] 管道执行结果: ' + ', '.join(f'{k}={v}' for k, v in status.items()))
@@ -0,0 +1,44 @@
+import random
+import threading
+import time
+
+
+# 令牌桶限流器：多个下载线程共享同一个实例，保证整体请求速率不超过rate（次/秒）
+# capacity为桶容量，允许短时间内的突发请求
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens=1):
+        """尝试立即取出令牌，成功返回True"""
+        with self.lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        """阻塞直到取到令牌"""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# 指数退避 + 随机抖动（full jitter）：第attempt次重试的等待秒数在[0, min(cap, base * 2^attempt)]之间
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
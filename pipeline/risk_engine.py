@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+RISK_COLUMNS = ['Annualized Return', 'Annualized Volatility', 'Sharpe Ratio', 'Max Drawdown']
+
+
+# 日收益率矩阵：每个ticker相对自己上一个有效收盘价计算，停牌/休市日为NaN（不计入统计）
+def daily_returns(closes):
+    prices = closes.to_numpy(dtype=float)
+    prev = closes.ffill().shift(1).to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(~np.isnan(prices) & ~np.isnan(prev), prices / prev - 1, np.nan)
+
+
+# 区间回撤信息的合并：A在前、B在后
+# max/min为区间内累计对数收益的最大/最小值，drop为区间内最大回撤（对数，<=0）
+def _combine(a, b):
+    a_max, a_min, a_drop = a
+    b_max, b_min, b_drop = b
+    drop = np.minimum(np.minimum(a_drop, b_drop), b_min - a_max)
+    return np.maximum(a_max, b_max), np.minimum(a_min, b_min), drop
+
+
+class RiskEngine:
+    """
+    内存风险指标引擎
+    预先计算每个ticker日收益率、收益率平方、对数收益率和有效天数的前缀和，
+    任意[start, end]区间、任意无风险利率的年化收益、波动率、夏普比率均为O(1)；
+    最大回撤使用按2的幂分块预聚合的(最大值, 最小值, 最大回撤)结构，区间查询为O(log n)
+    所有计算对全部ticker一次性按数组完成
+    """
+
+    def __init__(self, closes, periods_per_year=252):
+        self.index = pd.DatetimeIndex(closes.index)
+        self.tickers = closes.columns
+        self.periods_per_year = periods_per_year
+        m = closes.shape[1]
+        returns = daily_returns(closes)
+        has = ~np.isnan(returns)
+        r0 = np.where(has, returns, 0.0)
+        log_r = np.where(has, np.log1p(r0), 0.0)
+        zero = np.zeros((1, m))
+        self._count = np.vstack([zero, np.cumsum(has, axis=0)])
+        self._sum = np.vstack([zero, np.cumsum(r0, axis=0)])
+        self._sum_sq = np.vstack([zero, np.cumsum(r0 * r0, axis=0)])
+        self._sum_log = np.vstack([zero, np.cumsum(log_r, axis=0)])
+        self._build_drawdown_levels(self._sum_log[1:])
+
+    def _build_drawdown_levels(self, log_wealth):
+        # 第k层第b块覆盖第[b*2^k, (b+1)*2^k)行，不足的块用单位元补齐
+        level = (log_wealth, log_wealth, np.zeros_like(log_wealth))
+        self._levels = [level]
+        while len(level[0]) > 1:
+            size = len(level[0])
+            if size % 2:
+                m = level[0].shape[1]
+                pad = (np.full((1, m), -np.inf), np.full((1, m), np.inf), np.zeros((1, m)))
+                level = tuple(np.vstack([arr, p]) for arr, p in zip(level, pad))
+            left = tuple(arr[0::2] for arr in level)
+            right = tuple(arr[1::2] for arr in level)
+            level = _combine(left, right)
+            self._levels.append(level)
+
+    def _positions(self, start=None, end=None):
+        """返回区间内首行、末行的位置（包含两端）"""
+        i = 0 if start is None else int(self.index.searchsorted(pd.Timestamp(start), side='left'))
+        j = len(self.index) - 1 if end is None else int(self.index.searchsorted(pd.Timestamp(end), side='right')) - 1
+        return i, j
+
+    def _max_drawdown_log(self, i, j):
+        m = len(self.tickers)
+        left_parts, right_parts = [], []
+        lo, hi, k = i, j + 1, 0
+        while lo < hi:
+            if lo & 1:
+                left_parts.append((k, lo))
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                right_parts.append((k, hi))
+            lo >>= 1
+            hi >>= 1
+            k += 1
+        result = (np.full(m, -np.inf), np.full(m, np.inf), np.zeros(m))
+        for k, b in left_parts + right_parts[::-1]:
+            level = self._levels[k]
+            result = _combine(result, (level[0][b], level[1][b], level[2][b]))
+        return result[2]
+
+    def metrics(self, start=None, end=None, risk_free_rate=0.02):
+        """指定区间、无风险利率下的年化收益、年化波动率、夏普比率和最大回撤"""
+        i, j = self._positions(start, end)
+        nan = np.full(len(self.tickers), np.nan)
+        if j <= i:
+            return pd.DataFrame({col: nan for col in RISK_COLUMNS}, index=self.tickers)
+        # 区间内的收益率为第i+1行到第j行（第i行的收盘价作为起点）
+        count = self._count[j + 1] - self._count[i + 1]
+        total = self._sum[j + 1] - self._sum[i + 1]
+        total_sq = self._sum_sq[j + 1] - self._sum_sq[i + 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.where(count > 0, total / count, np.nan)
+            var = np.where(count > 1, (total_sq - count * mean * mean) / (count - 1), np.nan)
+            annualized_return = mean * self.periods_per_year
+            annualized_volatility = np.sqrt(np.maximum(var, 0) * self.periods_per_year)
+            sharpe_ratio = (annualized_return - risk_free_rate) / annualized_volatility
+        max_drawdown = np.where(count > 0, np.expm1(self._max_drawdown_log(i, j)), np.nan)
+        return pd.DataFrame({
+            'Annualized Return': annualized_return,
+            'Annualized Volatility': annualized_volatility,
+            'Sharpe Ratio': sharpe_ratio,
+            'Max Drawdown': max_drawdown,
+        }, index=self.tickers)
+
+    def cumulative_return(self, start=None, end=None):
+        """区间累计收益（由对数收益前缀和得到）"""
+        i, j = self._positions(start, end)
+        if j <= i:
+            return pd.Series(np.nan, index=self.tickers)
+        return pd.Series(np.expm1(self._sum_log[j + 1] - self._sum_log[i + 1]), index=self.tickers)
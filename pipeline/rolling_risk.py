@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent))
+from config import PROCESSED_DATA_DIR, ROLLING_WINDOWS, ROLLING_MIN_PERIODS_RATIO, RISK_FREE_RATE
+from risk_engine import daily_returns
+from market_store import save_table, load_table
+
+ROLLING_RISK_PATH = PROCESSED_DATA_DIR / 'rolling_risk.parquet'
+ROLLING_BETA_PATH = PROCESSED_DATA_DIR / 'rolling_beta.parquet'
+
+
+# 带前导0的前缀和，第t行到第t-window+1行的窗口和为 prefix[t+1] - prefix[t+1-window]
+def _prefix(arr):
+    return np.concatenate([np.zeros((1,) + arr.shape[1:]), np.cumsum(arr, axis=0)])
+
+def _window_sum(prefix, window):
+    out = np.full((prefix.shape[0] - 1,) + prefix.shape[1:], np.nan)
+    if window <= out.shape[0]:
+        out[window - 1:] = prefix[window:] - prefix[:-window]
+    return out
+
+# ticker列直接由编码构造为分类类型，避免生成大量重复字符串
+def _tiled_category(labels, repeats):
+    return pd.Categorical.from_codes(np.tile(np.arange(len(labels)), repeats), categories=labels)
+
+def _min_periods(window):
+    return max(2, int(np.ceil(window * ROLLING_MIN_PERIODS_RATIO)))
+
+
+# 滚动波动率和夏普比率：所有ticker、所有窗口一次性由窗口内的一阶、二阶矩计算
+# 返回 {window: (年化波动率矩阵, 夏普比率矩阵)}，矩阵形状为 日期 × ticker
+def rolling_volatility_sharpe(returns, windows=ROLLING_WINDOWS, risk_free_rate=RISK_FREE_RATE, periods_per_year=252):
+    has = ~np.isnan(returns)
+    r0 = np.where(has, returns, 0.0)
+    count_p, sum_p, sq_p = _prefix(has.astype(float)), _prefix(r0), _prefix(r0 * r0)
+    results = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for window in windows:
+            n = _window_sum(count_p, window)
+            s = _window_sum(sum_p, window)
+            sq = _window_sum(sq_p, window)
+            ok = n >= _min_periods(window)
+            mean = s / n
+            var = np.maximum((sq - n * mean * mean) / (n - 1), 0)
+            vol = np.where(ok, np.sqrt(var * periods_per_year), np.nan)
+            sharpe = np.where(ok, (mean * periods_per_year - risk_free_rate) / vol, np.nan)
+            results[window] = (vol, sharpe)
+    return results
+
+
+# 滚动beta和相关系数：对每个基准，一次性计算所有标的在所有窗口下与该基准的值
+# 仅统计标的和基准当天都有收益率的日期；返回 {(benchmark, window): (beta矩阵, 相关系数矩阵)}，矩阵形状为 日期 × 标的
+def rolling_beta_correlation(asset_returns, benchmark_returns, benchmarks, windows=ROLLING_WINDOWS):
+    asset_has = ~np.isnan(asset_returns)
+    x0 = np.where(asset_has, asset_returns, 0.0)
+    results = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for b, benchmark in enumerate(benchmarks):
+            y = benchmark_returns[:, b:b + 1]
+            both = asset_has & ~np.isnan(y)
+            x = np.where(both, x0, 0.0)
+            yb = np.where(both, np.nan_to_num(y), 0.0)
+            prefixes = [_prefix(a) for a in (both.astype(float), x, yb, x * x, yb * yb, x * yb)]
+            for window in windows:
+                n, sx, sy, sxx, syy, sxy = (_window_sum(p, window) for p in prefixes)
+                cov = sxy - sx * sy / n
+                var_x = sxx - sx * sx / n
+                var_y = syy - sy * sy / n
+                ok = n >= _min_periods(window)
+                beta = np.where(ok, cov / var_y, np.nan)
+                corr = np.where(ok, cov / np.sqrt(var_x * var_y), np.nan)
+                results[(benchmark, window)] = (beta, corr)
+    return results
+
+
+# 计算AGIX及所有持仓相对每个基准的滚动风险指标，并保存为两个长表：
+# rolling_risk（Date, Ticker, Window, Volatility, Sharpe）和 rolling_beta（Date, Ticker, Benchmark, Window, Beta, Correlation）
+def calculate_rolling_risk(closes, assets, benchmarks, windows=ROLLING_WINDOWS, risk_free_rate=RISK_FREE_RATE):
+    assets = [t for t in dict.fromkeys(assets) if t in closes.columns]
+    benchmarks = [t for t in dict.fromkeys(benchmarks) if t in closes.columns]
+    tickers = list(dict.fromkeys(assets + benchmarks))
+    closes = closes[tickers]
+    returns = daily_returns(closes)
+    dates = closes.index.values
+    n_dates = len(dates)
+
+    risk_frames = []
+    for window, (vol, sharpe) in rolling_volatility_sharpe(returns, windows, risk_free_rate).items():
+        risk_frames.append(pd.DataFrame({
+            'Date': np.repeat(dates, len(tickers)),
+            'Ticker': _tiled_category(tickers, n_dates),
+            'Window': np.int16(window),
+            'Volatility': vol.astype(np.float32).ravel(),
+            'Sharpe': sharpe.astype(np.float32).ravel(),
+        }))
+    rolling_risk = pd.concat(risk_frames, ignore_index=True).dropna(subset=['Volatility'])
+
+    asset_idx = [tickers.index(t) for t in assets]
+    bench_idx = [tickers.index(t) for t in benchmarks]
+    beta_frames = []
+    pairs = rolling_beta_correlation(returns[:, asset_idx], returns[:, bench_idx], benchmarks, windows)
+    for (benchmark, window), (beta, corr) in pairs.items():
+        b_pos = benchmarks.index(benchmark)
+        beta_frames.append(pd.DataFrame({
+            'Date': np.repeat(dates, len(assets)),
+            'Ticker': _tiled_category(assets, n_dates),
+            'Benchmark': pd.Categorical.from_codes(np.full(n_dates * len(assets), b_pos), categories=benchmarks),
+            'Window': np.int16(window),
+            'Beta': beta.astype(np.float32).ravel(),
+            'Correlation': corr.astype(np.float32).ravel(),
+        }))
+    rolling_beta = pd.concat(beta_frames, ignore_index=True).dropna(subset=['Beta'])
+    return rolling_risk.reset_index(drop=True), rolling_beta.reset_index(drop=True)
+
+
+def save_rolling_risk(closes, assets, benchmarks):
+    rolling_risk, rolling_beta = calculate_rolling_risk(closes, assets, benchmarks)
+    risk_path = save_table(rolling_risk, ROLLING_RISK_PATH)
+    beta_path = save_table(rolling_beta, ROLLING_BETA_PATH)
+    return risk_path, beta_path
+
+
+def load_rolling_risk():
+    return load_table(ROLLING_RISK_PATH)
+
+
+def load_rolling_beta():
+    return load_table(ROLLING_BETA_PATH)
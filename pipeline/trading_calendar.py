@@ -0,0 +1,162 @@
+"""
+多交易所交易日历
+行情矩阵把美股与台湾、韩国、伦敦、德国、澳洲等市场的ticker放在同一个日期并集上，
+非本交易所交易日的NaN会让收益率锚点落在无数据的日期。本模块按随代码提交的各交易所休市日表
+（exchange_holidays.csv）为每个交易所预先计算交易日表，并按ticker所在交易所对齐、向前填充和定位周/月/年锚点，
+全部按数组一次完成；休市日表未覆盖的交易所或日期才按行情覆盖率推断
+"""
+
+import argparse
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).parent))
+from config import TICKER_SUFFIX_TO_EXCHANGE, CALENDAR_SESSION_COVERAGE, EXCHANGE_CALENDAR_CODES
+from config import CALENDAR_HOLIDAYS_PATH, CALENDAR_HOLIDAYS_START, CALENDAR_HOLIDAYS_END, CALENDAR_EXTRA_HOLIDAYS
+
+
+# 由ticker后缀确定交易所
+def ticker_exchange(ticker):
+    suffix = ticker.rsplit('.', 1)[1] if '.' in ticker else ''
+    return TICKER_SUFFIX_TO_EXCHANGE.get(suffix, 'US')
+
+
+# 读取休市日表，返回 {交易所: 休市日DatetimeIndex}；文件不存在时返回空字典（全部按推断）
+@lru_cache(maxsize=None)
+def load_holidays(path=CALENDAR_HOLIDAYS_PATH):
+    path = Path(path)
+    if not path.exists():
+        print(f'[WARN] 休市日表不存在，交易日按行情推断: {path}')
+        return {}
+    table = pd.read_csv(path, parse_dates=['Date'])
+    return {exchange: pd.DatetimeIndex(group['Date']) for exchange, group in table.groupby('Exchange')}
+
+
+# 用exchange_calendars（可选依赖，只在重新生成时需要）生成休市日表：覆盖区间内不开市的工作日，
+# 加上CALENDAR_EXTRA_HOLIDAYS中的临时休市
+def build_holidays(path=CALENDAR_HOLIDAYS_PATH, start=CALENDAR_HOLIDAYS_START, end=CALENDAR_HOLIDAYS_END):
+    import exchange_calendars as xcals
+    weekdays = pd.bdate_range(start, end)
+    frames = []
+    for exchange, code in EXCHANGE_CALENDAR_CODES.items():
+        sessions = xcals.get_calendar(code, start=start, end=end).sessions
+        holidays = weekdays.difference(pd.DatetimeIndex(sessions).tz_localize(None))
+        holidays = holidays.union(pd.DatetimeIndex(CALENDAR_EXTRA_HOLIDAYS.get(exchange, [])))
+        frames.append(pd.DataFrame({'Exchange': exchange, 'Date': holidays.strftime('%Y-%m-%d')}))
+    table = pd.concat(frames, ignore_index=True)
+    table.to_csv(path, index=False)
+    load_holidays.cache_clear()
+    print(f'[INFO] 休市日表已保存: {path}（{len(table)} 个休市日）')
+    return table
+
+
+# 由行情推断各交易所的交易日：工作日中，该交易所处于交易期（首个至最后一个有效收盘价之间）的ticker
+# 至少min_coverage比例有收盘价，视为开市；返回 日期 × 交易所 的布尔表
+def infer_sessions(closes, min_coverage=CALENDAR_SESSION_COVERAGE):
+    index = pd.DatetimeIndex(closes.index)
+    valid = closes.notna().to_numpy()
+    active = np.maximum.accumulate(valid, axis=0) & np.maximum.accumulate(valid[::-1], axis=0)[::-1]
+    exchanges = pd.Index(closes.columns.map(ticker_exchange))
+    weekday = np.asarray(index.dayofweek < 5)
+    sessions = {}
+    for exchange in exchanges.unique():
+        cols = np.flatnonzero(exchanges == exchange)
+        n_active = active[:, cols].sum(axis=1)
+        n_valid = valid[:, cols].sum(axis=1)
+        sessions[exchange] = weekday & (n_active > 0) & (n_valid >= min_coverage * n_active)
+    return pd.DataFrame(sessions, index=index)
+
+
+# 各交易所的交易日：休市日表覆盖区间内为工作日且不在休市日表中；
+# 没有休市日表的交易所及覆盖区间外的日期，多个ticker的交易所按行情推断，只有一个ticker的交易所按工作日计
+# （单个ticker的缺失不能说明休市）；返回 日期 × 交易所 的布尔表
+def exchange_sessions(closes, holidays=None, min_coverage=CALENDAR_SESSION_COVERAGE):
+    holidays = load_holidays() if holidays is None else holidays
+    index = pd.DatetimeIndex(closes.index)
+    weekday = np.asarray(index.dayofweek < 5)
+    covered = np.asarray((index >= pd.Timestamp(CALENDAR_HOLIDAYS_START)) & (index <= pd.Timestamp(CALENDAR_HOLIDAYS_END)))
+    counts = pd.Index(closes.columns.map(ticker_exchange)).value_counts()
+    inferred = infer_sessions(closes, min_coverage)
+    sessions = {}
+    for exchange in inferred.columns:
+        fallback = inferred[exchange].to_numpy() if counts[exchange] > 1 else weekday
+        if exchange in holidays:
+            scheduled = weekday & ~index.isin(holidays[exchange])
+            sessions[exchange] = np.where(covered, scheduled, fallback)
+        else:
+            sessions[exchange] = fallback
+    return pd.DataFrame(sessions, index=index)
+
+
+class TradingCalendar:
+    """
+    多交易所交易日历
+    sessions: 日期 × 交易所 的布尔表；tickers: 行情矩阵的列，各自按后缀归属交易所
+    预先计算每个交易所"第i行当天或之前最近的交易日行号"，任意锚点的查询都是一次数组索引；
+    锚点为-1表示该日期之前没有交易日
+    """
+
+    def __init__(self, sessions, tickers):
+        self.index = pd.DatetimeIndex(sessions.index)
+        self.sessions = sessions
+        self.tickers = pd.Index(tickers)
+        self.exchanges = pd.Index(sessions.columns)
+        self._ticker_col = self.exchanges.get_indexer(self.tickers.map(ticker_exchange))
+        if (self._ticker_col < 0).any():
+            missing = sorted(set(self.tickers[self._ticker_col < 0].map(ticker_exchange)))
+            raise ValueError(f'交易日表缺少交易所: {missing}')
+        rows = np.arange(len(self.index))[:, None]
+        self._last = np.maximum.accumulate(np.where(sessions.to_numpy(dtype=bool), rows, -1), axis=0)
+
+    @classmethod
+    def from_closes(cls, closes, holidays=None, min_coverage=CALENDAR_SESSION_COVERAGE):
+        return cls(exchange_sessions(closes, holidays, min_coverage), closes.columns)
+
+    def session_mask(self):
+        """日期 × ticker 的布尔矩阵，ticker所在交易所开市的日期为True"""
+        return self.sessions.to_numpy(dtype=bool)[:, self._ticker_col]
+
+    def last_session(self, positions):
+        """positions: 日期并集上的行号（标量或一维数组）；返回各ticker在该行当天或之前最近的本交易所交易日行号"""
+        positions = np.asarray(positions)
+        rows = self._last[np.maximum(positions, 0)][..., self._ticker_col]
+        return np.where(positions[..., None] >= 0, rows, -1)
+
+    def previous_session(self, rows):
+        """rows: 各ticker的交易日行号（last_session的结果）；返回各ticker的前一个本交易所交易日行号"""
+        rows = np.asarray(rows)
+        prev = self._last[np.maximum(rows - 1, 0), self._ticker_col]
+        return np.where(rows > 0, prev, -1)
+
+    def anchor_rows(self, dates):
+        """各ticker在dates（标量或数组）当天或之前最近的本交易所交易日行号"""
+        dates = pd.DatetimeIndex(np.atleast_1d(pd.to_datetime(dates)))
+        positions = self.index.searchsorted(dates, side='right') - 1
+        return self.last_session(positions)
+
+    def align(self, closes):
+        """
+        按各ticker自己的交易所对齐：本交易所交易日的缺失用上一有效收盘价填充（上市前、最后一个有效收盘价之后不填），
+        非交易日置为NaN，使收益率只在本交易所交易日之间计算
+        """
+        filled = closes.reindex(index=self.index, columns=self.tickers).ffill(limit_area='inside')
+        return filled.where(self.session_mask())
+
+
+# 按锚点行号取值：rows为 k × ticker（或一维）的行号矩阵，-1取NaN
+def take_rows(values, rows):
+    rows = np.asarray(rows)
+    cols = np.arange(values.shape[1])
+    return np.where(rows >= 0, values[np.maximum(rows, 0), cols], np.nan)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="多交易所交易日历")
+    parser.add_argument("--build-holidays", action="store_true", help="用exchange_calendars重新生成休市日表")
+    args = parser.parse_args()
+    if args.build_holidays:
+        build_holidays()
+    else:
+        parser.print_help()
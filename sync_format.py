@@ -0,0 +1,188 @@
+"""
+云端同步文件格式
+DataSync把行情矩阵和结果表写入data目录，云端看板从这里读取；
+默认格式为Arrow IPC（.arrow）：带类型、列式、可压缩，读取时内存映射；JSON（.json）仅作为兼容旧部署的后备格式
+同步目录中的清单（sync_manifest.json）记录每份数据的内容哈希、行数、最后日期和组成文件，
+内容未变化的数据不重写；行情矩阵只追加新日期时以增量文件（<name>.delta0001.arrow ...）同步，读取时按清单顺序拼接
+行情矩阵保存为 Date列 + 每个ticker一列float64，缺失值按NaN原样保存（不使用空值位图），
+未压缩时各列直接引用内存映射的缓冲区，读取为零拷贝（只读）
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from datetime import datetime
+from market_store import MARKET_STORE_DTYPES
+
+# 同步格式：'arrow' / 'json'
+SYNC_FORMAT = 'arrow'
+# Arrow IPC压缩：'zstd' / 'lz4' / None（None时行情矩阵可零拷贝内存映射读取）
+SYNC_COMPRESSION = 'zstd'
+# 行情矩阵（日期 × ticker），其余名称均为普通表
+MATRICES = tuple(MARKET_STORE_DTYPES)
+
+# 同步清单文件名
+SYNC_MANIFEST = 'sync_manifest.json'
+# 行情矩阵最多累积的增量文件数，超过后整份重写
+SYNC_MAX_DELTAS = 30
+
+_SUFFIXES = {'arrow': '.arrow', 'json': '.json'}
+_METADATA_KEY = b'agix_sync'
+
+
+def sync_path(data_dir, name, fmt=SYNC_FORMAT):
+    return Path(data_dir) / f'{name}{_SUFFIXES[fmt]}'
+
+
+def delta_path(data_dir, name, seq):
+    return Path(data_dir) / f'{name}.delta{seq:04d}.arrow'
+
+
+def resolve_sync_path(data_dir, name):
+    """按 Arrow -> JSON 的优先级返回已存在的同步文件，都不存在时返回None"""
+    for fmt in ('arrow', 'json'):
+        path = sync_path(data_dir, name, fmt)
+        if path.exists():
+            return path
+    return None
+
+
+def _arrow_table(df, name):
+    import pyarrow as pa
+    if name in MATRICES:
+        columns = {'Date': pa.array(pd.DatetimeIndex(df.index).values)}
+        for col in df.columns:
+            # from_pandas=False：NaN按浮点值保存，读取时不需要把空值位图还原成NaN
+            columns[str(col)] = pa.array(df[col].to_numpy(dtype=np.float64, na_value=np.nan), from_pandas=False)
+        return pa.table(columns)
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def write_sync_frame(df, path, name, compression=SYNC_COMPRESSION):
+    """把行情矩阵或结果表写为Arrow IPC文件，返回写入的字节数"""
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    table = _arrow_table(df, name)
+    meta = {'name': name, 'last_updated': datetime.now().isoformat()}
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), _METADATA_KEY: json.dumps(meta).encode()})
+    options = ipc.IpcWriteOptions(compression=compression)
+    with pa.OSFile(str(path), 'wb') as sink, ipc.new_file(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return Path(path).stat().st_size
+
+
+def read_sync_frame(path, name):
+    """内存映射读取Arrow IPC文件；行情矩阵以Date为索引，未压缩且无空值的列不复制数据"""
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    table = ipc.open_file(pa.memory_map(str(path), 'r')).read_all()
+    if name not in MATRICES:
+        return table.to_pandas()
+    index = pd.DatetimeIndex(table.column('Date').to_numpy(), name='Date')
+    data = {}
+    for col in table.column_names[1:]:
+        chunked = table.column(col)
+        if chunked.num_chunks == 1 and chunked.null_count == 0:
+            data[col] = chunked.chunk(0).to_numpy(zero_copy_only=True)
+        else:
+            data[col] = chunked.to_numpy()
+    return pd.DataFrame(data, index=index, columns=table.column_names[1:], copy=False)
+
+
+def sync_metadata(path):
+    """Arrow同步文件的元数据（name, last_updated），JSON文件返回其last_updated"""
+    path = Path(path)
+    if path.suffix == '.json':
+        with open(path, 'r', encoding='utf-8') as f:
+            return {'name': path.stem, 'last_updated': json.load(f).get('last_updated')}
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    schema = ipc.open_file(pa.memory_map(str(path), 'r')).schema
+    return json.loads((schema.metadata or {}).get(_METADATA_KEY, b'{}'))
+
+
+def frame_row_hashes(df):
+    """每行（含索引）的64位哈希"""
+    return pd.util.hash_pandas_object(df, index=True).to_numpy()
+
+
+def frame_digest(df, row_hashes=None, rows=None):
+    """DataFrame内容哈希（列名 + 前rows行的行哈希）；rows用于判断旧数据是否为新数据的前缀"""
+    if row_hashes is None:
+        row_hashes = frame_row_hashes(df)
+    digest = hashlib.sha256('\x1f'.join(map(str, df.columns)).encode('utf-8'))
+    digest.update(np.ascontiguousarray(row_hashes[:rows]).tobytes())
+    return digest.hexdigest()
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(data_dir):
+    """读取同步清单，不存在或损坏时返回空清单"""
+    path = Path(data_dir) / SYNC_MANIFEST
+    if not path.exists():
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f'[WARN] 同步清单读取失败，所有数据将整份同步: {e}')
+        return {}
+
+
+def save_manifest(data_dir, manifest):
+    path = Path(data_dir) / SYNC_MANIFEST
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def sync_parts(data_dir, name, manifest=None):
+    """组成一份同步数据的文件（基础文件 + 增量文件）；清单中没有记录时按 Arrow -> JSON 查找单个文件"""
+    data_dir = Path(data_dir)
+    entry = (load_manifest(data_dir) if manifest is None else manifest).get(name)
+    if entry:
+        parts = [data_dir / part['file'] for part in entry['parts']]
+        if all(p.exists() for p in parts):
+            return parts
+    path = resolve_sync_path(data_dir, name)
+    return [] if path is None else [path]
+
+
+# DataSync保存的JSON（columns/data/index）转换为DataFrame；行情矩阵以Date为索引并转换为数值
+def frame_from_sync_json(data, name):
+    df = pd.DataFrame(data['data'], columns=data['columns'])
+    if data.get('index'):
+        df.index = data['index']
+    if name in MATRICES:
+        if 'Date' in df.columns:
+            df['Date'] = pd.to_datetime(df['Date'])
+            df = df.set_index('Date')
+        df = df.apply(pd.to_numeric, errors='coerce')
+    return df
+
+
+def _read_part(path, name):
+    if path.suffix == '.arrow':
+        return read_sync_frame(path, name)
+    with open(path, 'r', encoding='utf-8') as f:
+        return frame_from_sync_json(json.load(f), name)
+
+
+def load_sync_frame(data_dir, name, manifest=None):
+    """读取同步数据：优先Arrow，不存在时读取JSON；有增量文件时按顺序拼接；都不存在时返回None"""
+    parts = sync_parts(data_dir, name, manifest)
+    if not parts:
+        return None
+    frames = [_read_part(path, name) for path in parts]
+    return frames[0] if len(frames) == 1 else pd.concat(frames)
@@ -0,0 +1,38 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'pipeline'))
+from data_validate import check_gaps
+from trading_calendar import exchange_sessions
+
+
+def _closes(tickers, start='2025-07-01', end='2025-08-01'):
+    index = pd.bdate_range(start, end, name='Date')
+    return pd.DataFrame(100.0, index=index, columns=tickers)
+
+
+def test_gap_on_single_ticker_exchange_is_reported():
+    closes = _closes(['AAPL', 'MSFT', 'XB0T.DE'])
+    closes.loc['2025-07-28', 'XB0T.DE'] = np.nan
+    sessions = exchange_sessions(closes)
+    assert sessions.loc['2025-07-28', 'Xetra']
+    gaps = check_gaps(closes)
+    assert gaps[['Ticker', 'Start', 'End', 'Days']].values.tolist() == [
+        ['XB0T.DE', pd.Timestamp('2025-07-28'), pd.Timestamp('2025-07-28'), 1]]
+
+
+def test_holiday_on_single_ticker_exchange_is_not_a_gap():
+    closes = _closes(['AAPL', 'XB0T.DE'], start='2025-12-15', end='2026-01-09')
+    closes.loc[['2025-12-24', '2025-12-25', '2025-12-26', '2025-12-31', '2026-01-01'], 'XB0T.DE'] = np.nan
+    closes.loc[['2025-12-25', '2026-01-01'], 'AAPL'] = np.nan
+    assert check_gaps(closes).empty
+
+
+def test_single_ticker_exchange_without_holiday_table_uses_weekdays():
+    closes = _closes(['AAPL', 'MSFT', 'ANTH.PVT'])
+    closes.loc['2025-07-15', 'ANTH.PVT'] = np.nan
+    gaps = check_gaps(closes)
+    assert gaps['Ticker'].tolist() == ['ANTH.PVT']
@@ -71,12 +71,14 @@ def plot_risk_metrics(risk_metrics, benchmarks):
 def plot_volume_trend(volumes, window=5):
     fig, ax = plt.subplots(figsize=(12, 6))
     if 'AGIX' in volumes.columns:
+        # 紧凑表示下成交量为可空整数，绘图前转为浮点（缺失为NaN）
+        agix_volume = volumes['AGIX'].astype(float)
         # 原始数据（细线，透明度较低）
-        ax.plot(volumes.index, volumes['AGIX'], 
+        ax.plot(volumes.index, agix_volume, 
                 alpha=0.3, linewidth=1, color='gray', label='Raw Volume')
         
         # 平滑处理后的数据（粗线，透明度较高）
-        smoothed_volume = volumes['AGIX'].rolling(window=window, min_periods=1).mean()
+        smoothed_volume = agix_volume.rolling(window=window, min_periods=1).mean()
         ax.plot(volumes.index, smoothed_volume, 
                 linewidth=2, color='blue', alpha=0.8, label=f'Smoothed Volume ({window}-day MA)')
     